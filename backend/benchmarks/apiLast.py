@@ -0,0 +1,320 @@
+"""Durchsatz und Latenz der API je Endpunkt, in-process über die ASGI-App.
+
+Befüllt eine temporäre SQLite-Datenbank mit einstellbaren Mengen, ruft jeden
+Router über httpx.ASGITransport mit mehreren gleichzeitigen Clients auf und
+meldet je Endpunkt Anfragen/s sowie p50/p95/p99. Das Ergebnis lässt sich als
+JSON speichern und mit einer Baseline vergleichen; ist ein Endpunkt um mehr
+als die Toleranz langsamer (p50 oder Durchsatz), endet das Skript mit Status 1.
+Ebenso bei Fehlerantworten oder wenn ein Endpunkt länger als --zeitlimit
+braucht (etwa weil die Ereignisschleife blockiert); dann werden zuvor die
+Stacks aller Threads ausgegeben.
+
+Aufruf aus dem backend-Verzeichnis:
+    python -m benchmarks.apiLast --clients 8 --anfragen 300
+    python -m benchmarks.apiLast --ausgabe ergebnis.json --vergleich benchmarks/baseline_apiLast.json
+
+Die Baseline gilt nur für den Rechner, auf dem sie erzeugt wurde; nach einer
+bewussten Änderung oder auf neuer Hardware mit --ausgabe neu schreiben.
+"""
+import argparse
+import asyncio
+import faulthandler
+import importlib
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+from sqlalchemy import insert
+
+_WOERTER = (
+    "Matrix Vektor Determinante Eigenwert Basis Abbildung Rang Kern Bild Skalar Norm Raum "
+    "Ableitung Integral Grenzwert Folge Reihe Graph Baum Sortierung Laufzeit Rekursion"
+).split()
+_MODULE = [f"Modul {i}" for i in range(20)]
+_FAECHER = ["Mathe", "Informatik", "Physik", "Statistik"]
+# Wenige verschiedene Inhalte, damit gleichzeitige Uploads Inhalte im
+# Dateispeicher wiederverwenden und ersetzte Inhalte aufgeräumt werden
+_INHALTE = [(" ".join(_WOERTER[i:]) + "\n").encode() * 200 for i in range(6)]
+
+
+def _text(rnd, woerter):
+    return " ".join(rnd.choice(_WOERTER) for _ in range(woerter))
+
+
+def _befuelle(engine, mengen, stapel=1000):
+    from datenbank.modelle import Datei, KiAntwort, Notiz, QuizFrage, QuizSession, QuizVersuch, datei_quizsession, notiz_datei
+
+    rnd = random.Random(1)
+
+    def schreibe(connection, tabelle, zeilen):
+        for anfang in range(0, len(zeilen), stapel):
+            connection.execute(insert(tabelle), zeilen[anfang:anfang + stapel])
+
+    with engine.begin() as connection:
+        schreibe(connection, Datei, [
+            {"titel": _text(rnd, 4), "pfad": f"/daten/{i}.pdf", "dateiart": rnd.choice(["PDF", "Folien", "Skript"]),
+             "dozent": f"Dozent {i % 30}", "semester": f"WS {i % 8}", "modul": rnd.choice(_MODULE)}
+            for i in range(mengen["dateien"])
+        ])
+        schreibe(connection, Notiz, [
+            {"titel": _text(rnd, 3), "labels": {"fach": rnd.choice(_FAECHER), "tags": rnd.sample(_WOERTER, 2)}}
+            for _ in range(mengen["notizen"])
+        ])
+        schreibe(connection, KiAntwort, [
+            {"inhalt": _text(rnd, 60), "kommentar": _text(rnd, 5), "typ": rnd.choice(["Definition", "Beispiel"]),
+             "notiz_id": rnd.randint(1, mengen["notizen"]), "position": i * 1024}
+            for i in range(mengen["kiantworten"])
+        ])
+        schreibe(connection, QuizSession, [{"titel": _text(rnd, 3)} for _ in range(mengen["quiz_sessions"])])
+        schreibe(connection, QuizFrage, [
+            {"frage": _text(rnd, 10) + "?", "Antwort": _text(rnd, 8), "Erklaerung": _text(rnd, 30),
+             "quiz_session_id": rnd.randint(1, mengen["quiz_sessions"])}
+            for _ in range(mengen["quiz_fragen"])
+        ])
+        schreibe(connection, QuizVersuch, [
+            {"quiz_frage_id": rnd.randint(1, mengen["quiz_fragen"]), "richtig": rnd.random() < 0.7,
+             "dauer_ms": rnd.randint(500, 20000), "zeitpunkt": 1700000000 + i}
+            for i in range(mengen["versuche"])
+        ])
+        schreibe(connection, notiz_datei, [
+            {"notiz_id": notiz, "datei_id": datei}
+            for notiz in range(1, mengen["notizen"] + 1)
+            for datei in {rnd.randint(1, mengen["dateien"]) for _ in range(2)}
+        ])
+        schreibe(connection, datei_quizsession, [
+            {"quiz_session_id": session, "datei_id": datei}
+            for session in range(1, mengen["quiz_sessions"] + 1)
+            for datei in {rnd.randint(1, mengen["dateien"]) for _ in range(2)}
+        ])
+
+
+# Je Endpunkt (Name, Anteil an --anfragen, Fabrik für Methode, URL und Body);
+# die Namen bleiben über Läufe gleich und sind die Schlüssel im JSON
+def _szenarien(mengen):
+    def zufall(name):
+        return lambda r: r.randint(1, mengen[name])
+
+    datei, notiz, ki, session, frage = (
+        zufall(name) for name in ("dateien", "notizen", "kiantworten", "quiz_sessions", "quiz_fragen")
+    )
+    return [
+        ("GET /api/dateien/", 1, lambda r: ("GET", f"/api/dateien/?modul={r.choice(_MODULE)}&limit=50", None)),
+        ("GET /api/dateien/{id}", 1, lambda r: ("GET", f"/api/dateien/{datei(r)}", None)),
+        ("GET /api/dateien/facetten", 1, lambda r: ("GET", f"/api/dateien/facetten?semester=WS {r.randrange(8)}", None)),
+        ("GET /api/dateien/{id}/notizen", 1, lambda r: ("GET", f"/api/dateien/{datei(r)}/notizen", None)),
+        ("POST /api/dateien/hochladen", 0.25, lambda r: ("POST", "/api/dateien/hochladen", (
+            f"{r.choice(_WOERTER)}.txt", r.choice(_INHALTE), "text/plain"))),
+        ("PUT /api/dateien/{id}/inhalt", 0.25, lambda r: ("PUT", f"/api/dateien/{datei(r)}/inhalt", r.choice(_INHALTE))),
+        ("POST /api/dateien/", 1, lambda r: ("POST", "/api/dateien/", {
+            "titel": _text(r, 4), "pfad": "/daten/neu.pdf", "semester": "WS 0", "modul": r.choice(_MODULE)})),
+        ("PATCH /api/dateien/{id}", 1, lambda r: ("PATCH", f"/api/dateien/{datei(r)}", {"titel": _text(r, 4)})),
+        ("GET /api/notizen/", 1, lambda r: ("GET", f"/api/notizen/?label=fach:{r.choice(_FAECHER)}&limit=50", None)),
+        ("GET /api/notizen/{id}/vollstaendig", 1, lambda r: ("GET", f"/api/notizen/{notiz(r)}/vollstaendig", None)),
+        ("GET /api/notizen/facetten", 1, lambda r: ("GET", "/api/notizen/facetten?schluessel=tags", None)),
+        ("POST /api/notizen/", 1, lambda r: ("POST", "/api/notizen/", {"titel": _text(r, 3), "labels": {"fach": r.choice(_FAECHER)}})),
+        ("GET /api/kiantworten/{id}", 1, lambda r: ("GET", f"/api/kiantworten/{ki(r)}", None)),
+        ("GET /api/kiantworten/notiz/{id}", 1, lambda r: ("GET", f"/api/kiantworten/notiz/{notiz(r)}", None)),
+        ("GET /api/kiantworten/{id}/aehnliche", 1, lambda r: ("GET", f"/api/kiantworten/{ki(r)}/aehnliche?k=10", None)),
+        ("POST /api/kiantworten/", 1, lambda r: ("POST", "/api/kiantworten/", {"inhalt": _text(r, 60), "notiz_id": notiz(r)})),
+        ("POST /api/ki-auftraege/", 1, lambda r: ("POST", "/api/ki-auftraege/", {"notiz_id": notiz(r), "typ": "Definition"})),
+        ("GET /api/quiz-sessions/", 1, lambda r: ("GET", f"/api/quiz-sessions/?after={session(r)}&limit=50", None)),
+        ("GET /api/quiz-sessions/{id}/vollstaendig", 1, lambda r: ("GET", f"/api/quiz-sessions/{session(r)}/vollstaendig", None)),
+        ("GET /api/quiz-fragen/{id}", 1, lambda r: ("GET", f"/api/quiz-fragen/{frage(r)}", None)),
+        ("GET /api/quiz-fragen/naechste", 1, lambda r: ("GET", f"/api/quiz-fragen/naechste?quiz_session_id={session(r)}&limit=10", None)),
+        ("GET /api/quiz-fragen/{id}/aehnliche", 1, lambda r: ("GET", f"/api/quiz-fragen/{frage(r)}/aehnliche?k=10", None)),
+        ("POST /api/quiz-fragen/{id}/bewertung", 1, lambda r: ("POST", f"/api/quiz-fragen/{frage(r)}/bewertung", {"bewertung": r.randint(0, 5)})),
+        ("POST /api/quiz-fragen/batch", 0.25, lambda r: ("POST", "/api/quiz-fragen/batch", [
+            {"frage": _text(r, 10) + "?", "Antwort": _text(r, 8), "Erklaerung": _text(r, 30), "quiz_session_id": session(r)}
+            for _ in range(20)
+        ])),
+        ("POST /api/quiz-versuche/", 1, lambda r: ("POST", "/api/quiz-versuche/", [
+            {"quiz_frage_id": frage(r), "richtig": r.random() < 0.7, "dauer_ms": r.randint(500, 20000)}])),
+        ("GET /api/quiz-versuche/", 1, lambda r: ("GET", f"/api/quiz-versuche/?quiz_frage_id={frage(r)}", None)),
+        ("GET /api/statistik/quiz-sessions/{id}", 1, lambda r: ("GET", f"/api/statistik/quiz-sessions/{session(r)}", None)),
+        ("GET /api/statistik/module", 1, lambda r: ("GET", "/api/statistik/module", None)),
+        ("GET /api/suche/", 1, lambda r: ("GET", f"/api/suche/?q={r.choice(_WOERTER)}&limit=20", None)),
+        # Streamt den gesamten Datenbestand
+        ("GET /api/export", 0.02, lambda r: ("GET", "/api/export?gzip=false", None)),
+    ]
+
+
+def _perzentil(werte, p):
+    if len(werte) == 1:
+        return werte[0]
+    return statistics.quantiles(werte, n=100, method="inclusive")[p - 1]
+
+
+async def _messe(client, erzeuge, anfragen, clients, seed):
+    dauern = []
+    fehler = 0
+    offen = iter(range(anfragen))
+
+    async def arbeite(nummer):
+        nonlocal fehler
+        rnd = random.Random(seed * 1000 + nummer)
+        for _ in offen:
+            methode, url, body = erzeuge(rnd)
+            # bytes als Body, (Name, Inhalt, Typ) als Datei im Formular, sonst JSON
+            if isinstance(body, bytes):
+                inhalt = {"content": body}
+            elif isinstance(body, tuple):
+                inhalt = {"files": {"datei": body}}
+            else:
+                inhalt = {"json": body}
+            start = time.perf_counter()
+            antwort = await client.request(methode, url, **inhalt)
+            await antwort.aread()
+            dauern.append(time.perf_counter() - start)
+            if antwort.status_code >= 400:
+                fehler += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(arbeite(nummer) for nummer in range(clients)))
+    gesamt = time.perf_counter() - start
+    dauern.sort()
+    return {
+        "anfragen": len(dauern),
+        "fehler": fehler,
+        "durchsatz": len(dauern) / gesamt,
+        **{f"p{p}_ms": _perzentil(dauern, p) * 1000 for p in (50, 95, 99)},
+    }
+
+
+async def _lauf(app, mengen, args):
+    import httpx
+
+    ergebnisse = {}
+    transport = httpx.ASGITransport(app=app)
+    # Der Lebenszyklus startet Vektorindex, Worker und Versuchs-Puffer wie im Server
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+            for seed, (name, anteil, erzeuge) in enumerate(_szenarien(mengen)):
+                if args.nur and not any(teil in name for teil in args.nur):
+                    continue
+                anfragen = max(args.clients, round(args.anfragen * anteil))
+                # Wächter in eigenem Thread: greift auch, wenn die Ereignisschleife steht
+                faulthandler.dump_traceback_later(args.zeitlimit, exit=True)
+                # Aufwärmen: Verbindungen, Caches von SQLite und Python
+                await _messe(client, erzeuge, min(anfragen, args.clients * 2), args.clients, seed + 10000)
+                ergebnisse[name] = await _messe(client, erzeuge, anfragen, args.clients, seed)
+                faulthandler.cancel_dump_traceback_later()
+                print(f"{name:45} {ergebnisse[name]['durchsatz']:>9.0f}/s", file=sys.stderr)
+    return ergebnisse
+
+
+def _drucke(ergebnisse):
+    print(f"{'Endpunkt':45} {'Anfragen':>8} {'Fehler':>6} {'Anfr./s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, werte in ergebnisse.items():
+        print(
+            f"{name:45} {werte['anfragen']:>8} {werte['fehler']:>6} {werte['durchsatz']:>9.0f} "
+            f"{werte['p50_ms']:>8.2f} {werte['p95_ms']:>8.2f} {werte['p99_ms']:>8.2f}"
+        )
+
+
+# Verschlechterung, wenn p50 um mehr als toleranz (relativ) und min_ms
+# (absolut) steigt oder der Durchsatz um mehr als toleranz sinkt. p95/p99
+# schwanken zwischen gleichen Läufen zu stark für eine feste Schwelle und
+# werden nur angezeigt; das Mindestmaß hält Rauschen bei schnellen Endpunkten heraus.
+def _vergleiche(ergebnisse, baseline, toleranz, min_ms):
+    verschlechtert = []
+    print(f"\n{'Endpunkt':45} {'p50 alt':>8} {'p50 neu':>8} {'p95 alt':>8} {'p95 neu':>8} {'Anfr./s alt':>11} {'Anfr./s neu':>11}")
+    for name, neu in ergebnisse.items():
+        alt = baseline["endpunkte"].get(name)
+        if alt is None:
+            print(f"{name:45} {'neu':>8}")
+            continue
+        langsamer = neu["p50_ms"] > alt["p50_ms"] * (1 + toleranz) and neu["p50_ms"] - alt["p50_ms"] >= min_ms
+        weniger = neu["durchsatz"] < alt["durchsatz"] * (1 - toleranz)
+        markierung = "  VERSCHLECHTERT" if langsamer or weniger else ""
+        print(
+            f"{name:45} {alt['p50_ms']:>8.2f} {neu['p50_ms']:>8.2f} {alt['p95_ms']:>8.2f} {neu['p95_ms']:>8.2f} "
+            f"{alt['durchsatz']:>11.0f} {neu['durchsatz']:>11.0f}{markierung}"
+        )
+        if markierung:
+            verschlechtert.append(name)
+    return verschlechtert
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dateien", type=int, default=2000)
+    parser.add_argument("--notizen", type=int, default=1000)
+    parser.add_argument("--kiantworten", type=int, default=5000)
+    parser.add_argument("--quiz-sessions", type=int, default=200)
+    parser.add_argument("--quiz-fragen", type=int, default=10000)
+    parser.add_argument("--versuche", type=int, default=20000)
+    parser.add_argument("--clients", type=int, default=8, help="gleichzeitige Clients je Endpunkt")
+    parser.add_argument("--anfragen", type=int, default=300, help="Anfragen je Endpunkt")
+    parser.add_argument("--async-db", action="store_true", help="mit LERNASSISTENT_ASYNC_DB=1 messen")
+    parser.add_argument("--nur", action="append", help="nur Endpunkte, deren Name dies enthält (mehrfach)")
+    parser.add_argument("--ausgabe", help="Ergebnis als JSON schreiben")
+    parser.add_argument("--vergleich", help="Baseline-JSON zum Vergleich")
+    parser.add_argument("--toleranz", type=float, default=0.3)
+    parser.add_argument("--min-ms", type=float, default=1.0)
+    parser.add_argument("--zeitlimit", type=float, default=300, help="Sekunden je Endpunkt, danach Abbruch")
+    args = parser.parse_args()
+    mengen = {
+        "dateien": args.dateien,
+        "notizen": args.notizen,
+        "kiantworten": args.kiantworten,
+        "quiz_sessions": args.quiz_sessions,
+        "quiz_fragen": args.quiz_fragen,
+        "versuche": args.versuche,
+    }
+
+    with tempfile.TemporaryDirectory() as verzeichnis:
+        # datenbank.py und die Hintergrunddienste lesen ihre Pfade beim Import
+        os.environ["LERNASSISTENT_DB_PFAD"] = os.path.join(verzeichnis, "benchmark.db")
+        os.environ["LERNASSISTENT_VEKTOR_PFAD"] = os.path.join(verzeichnis, "vektorindex")
+        os.environ["LERNASSISTENT_DATEI_SPEICHER"] = os.path.join(verzeichnis, "dateispeicher")
+        os.environ["LERNASSISTENT_ASYNC_DB"] = "1" if args.async_db else "0"
+        anwendung = importlib.import_module("main")
+        from datenbank.datenbank import engine
+
+        start = time.perf_counter()
+        _befuelle(engine, mengen)
+        print(f"Befüllt in {time.perf_counter() - start:.1f} s", file=sys.stderr)
+        ergebnisse = asyncio.run(_lauf(anwendung.app, mengen, args))
+        engine.dispose()
+
+    _drucke(ergebnisse)
+    lauf = {
+        "meta": {
+            "zeitpunkt": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "plattform": platform.platform(),
+            "async_db": args.async_db,
+            "clients": args.clients,
+            "anfragen": args.anfragen,
+            "mengen": mengen,
+        },
+        "endpunkte": ergebnisse,
+    }
+    if args.ausgabe:
+        with open(args.ausgabe, "w", encoding="utf-8") as datei:
+            json.dump(lauf, datei, indent=2, ensure_ascii=False)
+    if args.vergleich:
+        with open(args.vergleich, encoding="utf-8") as datei:
+            baseline = json.load(datei)
+        for schluessel in ("mengen", "clients", "async_db"):
+            if baseline["meta"].get(schluessel) != lauf["meta"][schluessel]:
+                print(f"Hinweis: {schluessel} weicht von der Baseline ab", file=sys.stderr)
+        verschlechtert = _vergleiche(ergebnisse, baseline, args.toleranz, args.min_ms)
+        if verschlechtert:
+            print(f"\n{len(verschlechtert)} Endpunkt(e) verschlechtert", file=sys.stderr)
+            sys.exit(1)
+    fehlerhaft = [name for name, werte in ergebnisse.items() if werte["fehler"]]
+    if fehlerhaft:
+        print(f"\nFehlerantworten bei: {', '.join(fehlerhaft)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Einfüge- und Aktualisierungsdurchsatz mit altem und neuem Indexsatz.
+
+Aufruf aus dem backend-Verzeichnis:
+    python -m benchmarks.schreibDurchsatz --zeilen 20000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import insert, update
+from sqlalchemy.orm import sessionmaker
+
+from datenbank.datenbank import STANDARD_PROFIL, erstelle_engine
+from datenbank.migrationen import ALTE_INDIZES, NEUE_INDIZES
+from datenbank.modelle import Base, Datei, KiAntwort, Notiz, QuizFrage, QuizSession
+
+_WOERTER = "Matrix Vektor Determinante Eigenwert Basis Abbildung Rang Kern Bild Skalar Norm Raum".split()
+
+
+def _text(woerter):
+    return " ".join(random.choice(_WOERTER) for _ in range(woerter))
+
+
+def _schema(engine, alt):
+    Base.metadata.create_all(bind=engine)
+    if not alt:
+        return
+    with engine.begin() as connection:
+        for name, tabelle, _ in NEUE_INDIZES:
+            connection.exec_driver_sql(f'DROP INDEX IF EXISTS "{name}"')
+        for tabelle, spalte in ALTE_INDIZES:
+            connection.exec_driver_sql(f'CREATE INDEX "ix_{tabelle}_{spalte}" ON "{tabelle}" ("{spalte}")')
+
+
+def _messe(engine, zeilen, stapel):
+    Session = sessionmaker(bind=engine)
+    ergebnisse = {}
+    with Session() as db:
+        notiz = Notiz(titel="Notiz", labels={})
+        session = QuizSession(titel="Quiz")
+        db.add_all([notiz, session])
+        db.commit()
+
+        start = time.perf_counter()
+        for anfang in range(0, zeilen, stapel):
+            anzahl = min(stapel, zeilen - anfang)
+            db.execute(insert(Datei), [
+                {"titel": _text(6), "pfad": f"/daten/{anfang + i}.pdf", "dateiart": "PDF", "dozent": f"Dozent {i % 30}",
+                 "semester": f"WS {i % 8}", "modul": f"Modul {i % 40}"}
+                for i in range(anzahl)
+            ])
+            db.execute(insert(KiAntwort), [
+                {"inhalt": _text(120), "kommentar": _text(10), "typ": "Definition", "notiz_id": notiz.id}
+                for _ in range(anzahl)
+            ])
+            db.execute(insert(QuizFrage), [
+                {"frage": _text(12), "Antwort": _text(20), "Erklaerung": _text(60), "quiz_session_id": session.id}
+                for _ in range(anzahl)
+            ])
+            db.commit()
+        ergebnisse["einfuegen"] = 3 * zeilen / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for anfang in range(0, zeilen, stapel):
+            ids = range(anfang + 1, min(anfang + stapel, zeilen) + 1)
+            db.execute(update(KiAntwort), [{"id": i, "inhalt": _text(120), "kommentar": _text(10)} for i in ids])
+            db.execute(update(QuizFrage), [{"id": i, "Erklaerung": _text(60)} for i in ids])
+            db.commit()
+        ergebnisse["aktualisieren"] = 2 * zeilen / (time.perf_counter() - start)
+    return ergebnisse
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--zeilen", type=int, default=20000)
+    parser.add_argument("--stapel", type=int, default=500)
+    args = parser.parse_args()
+
+    ergebnisse = {}
+    with tempfile.TemporaryDirectory() as verzeichnis:
+        for name, alt in (("vorher", True), ("nachher", False)):
+            random.seed(1)
+            pfad = os.path.join(verzeichnis, f"{name}.db")
+            engine = erstelle_engine(pfad, STANDARD_PROFIL)
+            _schema(engine, alt)
+            ergebnisse[name] = _messe(engine, args.zeilen, args.stapel)
+            engine.dispose()
+            ergebnisse[name]["groesse_mb"] = os.path.getsize(pfad) / 2**20
+
+    print(f"{'':10} {'Einfügen/s':>11} {'Aktualisieren/s':>16} {'Größe MB':>9}")
+    for name, werte in ergebnisse.items():
+        print(f"{name:10} {werte['einfuegen']:>11.0f} {werte['aktualisieren']:>16.0f} {werte['groesse_mb']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Gemischter Lese-/Schreibdurchsatz mit und ohne SQLite-Verbindungsprofil.
+
+Aufruf aus dem backend-Verzeichnis:
+    python -m benchmarks.sqliteProfil --sekunden 5 --leser 8 --schreiber 2
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from datenbank.datenbank import STANDARD_PROFIL, erstelle_engine
+from datenbank.modelle import Base, Datei
+
+
+def _befuelle(engine, anzahl):
+    Session = sessionmaker(bind=engine)
+    with Session() as db:
+        db.add_all(
+            Datei(titel=f"Datei {i}", pfad=f"/daten/{i}.pdf", semester=f"WS {i % 8}", modul=f"Modul {i % 40}")
+            for i in range(anzahl)
+        )
+        db.commit()
+
+
+def _lauf(schreib_engine, lese_engine, sekunden, leser, schreiber, anzahl):
+    Schreiben = sessionmaker(bind=schreib_engine)
+    Lesen = sessionmaker(bind=lese_engine)
+    ergebnisse = {"lesen": 0, "schreiben": 0, "gesperrt": 0}
+    sperre = threading.Lock()
+    ende = time.perf_counter() + sekunden
+
+    def zaehle(schluessel):
+        with sperre:
+            ergebnisse[schluessel] += 1
+
+    def lese_schleife():
+        while time.perf_counter() < ende:
+            try:
+                with Lesen() as db:
+                    semester = f"WS {random.randrange(8)}"
+                    db.execute(select(Datei).where(Datei.semester == semester).limit(50)).all()
+                zaehle("lesen")
+            except OperationalError:
+                zaehle("gesperrt")
+
+    def schreib_schleife():
+        while time.perf_counter() < ende:
+            try:
+                with Schreiben() as db:
+                    datei = db.get(Datei, random.randrange(1, anzahl + 1))
+                    datei.titel = f"Datei {time.time()}"
+                    db.add(Datei(titel="Neu", pfad="/daten/neu.pdf", semester="WS 0"))
+                    db.commit()
+                zaehle("schreiben")
+            except OperationalError:
+                zaehle("gesperrt")
+
+    threads = [threading.Thread(target=lese_schleife) for _ in range(leser)]
+    threads += [threading.Thread(target=schreib_schleife) for _ in range(schreiber)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {schluessel: wert / sekunden for schluessel, wert in ergebnisse.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sekunden", type=float, default=5.0)
+    parser.add_argument("--leser", type=int, default=8)
+    parser.add_argument("--schreiber", type=int, default=2)
+    parser.add_argument("--dateien", type=int, default=20000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as verzeichnis:
+        # Vorher: eine Engine ohne Pragmas, wie bisher in datenbank.py
+        pfad = os.path.join(verzeichnis, "vorher.db")
+        engine = create_engine(f"sqlite:///{pfad}", connect_args={"check_same_thread": False})
+        Base.metadata.create_all(bind=engine)
+        _befuelle(engine, args.dateien)
+        vorher = _lauf(engine, engine, args.sekunden, args.leser, args.schreiber, args.dateien)
+        engine.dispose()
+
+        # Nachher: Verbindungsprofil und getrennte Lese-/Schreib-Engines
+        pfad = os.path.join(verzeichnis, "nachher.db")
+        schreib_engine = erstelle_engine(pfad, STANDARD_PROFIL)
+        lese_engine = erstelle_engine(pfad, STANDARD_PROFIL, nur_lesen=True)
+        Base.metadata.create_all(bind=schreib_engine)
+        _befuelle(schreib_engine, args.dateien)
+        nachher = _lauf(schreib_engine, lese_engine, args.sekunden, args.leser, args.schreiber, args.dateien)
+        schreib_engine.dispose()
+        lese_engine.dispose()
+
+    print(f"{'':10} {'Lesen/s':>10} {'Schreiben/s':>12} {'gesperrt/s':>11}")
+    for name, werte in (("vorher", vorher), ("nachher", nachher)):
+        print(f"{name:10} {werte['lesen']:>10.0f} {werte['schreiben']:>12.0f} {werte['gesperrt']:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+import logging
+import os
+import re
+import threading
+import time
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+from .metriken import route_vorlage
+
+# Protokoll langsamer SQL-Anweisungen: jede Ausführung ab SCHWELLE ms wird mit
+# Dauer, Parametern und Route geloggt und je normalisierter Anweisung
+# (Literale und Parameterlisten zusammengefasst) aufsummiert. Für jede neue
+# Anweisung wird einmal EXPLAIN QUERY PLAN auf derselben Verbindung ausgeführt;
+# Zeilen mit SCAN (Durchlauf einer ganzen Tabelle bzw. eines ganzen Index)
+# werden markiert. So fallen auch Abfragen auf, die das ORM implizit stellt
+# (Lazy Loads). Nur mit LERNASSISTENT_LANGSAME_ABFRAGEN_MS gesetzt, z.B. 50;
+# 0 erfasst jede Anweisung.
+_schwelle = os.getenv("LERNASSISTENT_LANGSAME_ABFRAGEN_MS", "").strip()
+AKTIV = _schwelle != ""
+SCHWELLE = float(_schwelle) / 1000 if AKTIV else None
+# Höchstzahl gemerkter Anweisungen; darüber fällt die mit der kleinsten Höchstdauer weg
+MAX_ANWEISUNGEN = int(os.getenv("LERNASSISTENT_LANGSAME_ABFRAGEN_ANZAHL", "500"))
+MAX_PARAMETER_ZEICHEN = 300
+MAX_ROUTEN = 5
+
+logger = logging.getLogger(__name__)
+
+# ASGI-Scope der laufenden Anfrage, für die Route
+_scope = ContextVar("abfrage_profil_scope", default=None)
+
+_ZEICHENKETTE = re.compile(r"'(?:[^']|'')*'")
+_ZAHL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_LISTE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_ZEILEN = re.compile(r"\(\?, \.\.\.\)(?:\s*,\s*\(\?, \.\.\.\))+")
+_LEERRAUM = re.compile(r"\s+")
+_ERKLAERBAR = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "REPLACE")
+
+
+def normalisiere(anweisung):
+    anweisung = _LEERRAUM.sub(" ", anweisung).strip()
+    anweisung = _ZEICHENKETTE.sub("?", anweisung)
+    anweisung = _ZAHL.sub("?", anweisung)
+    anweisung = _LISTE.sub("(?, ...)", anweisung)
+    return _ZEILEN.sub("(?, ...), ...", anweisung)
+
+
+class _Eintrag:
+    __slots__ = ("sql", "anzahl", "gesamt", "max", "parameter", "routen", "plan")
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.anzahl = 0
+        self.gesamt = 0.0
+        self.max = 0.0
+        self.parameter = None
+        self.routen = []
+        self.plan = None
+
+
+class AbfrageProfil:
+    def __init__(self, schwelle=SCHWELLE, max_anweisungen=MAX_ANWEISUNGEN):
+        self.schwelle = schwelle
+        self.max_anweisungen = max_anweisungen
+        self._sperre = threading.Lock()
+        self._eintraege = {}
+
+    def erfasse(self, conn, anweisung, parameter, dauer, executemany):
+        sql = normalisiere(anweisung)
+        if executemany and parameter:
+            parameter = parameter[0]
+        route = _herkunft()
+        text_parameter = repr(parameter)[:MAX_PARAMETER_ZEICHEN]
+        with self._sperre:
+            eintrag = self._eintraege.get(sql)
+            if eintrag is None:
+                if len(self._eintraege) >= self.max_anweisungen:
+                    del self._eintraege[min(self._eintraege.values(), key=lambda e: e.max).sql]
+                eintrag = self._eintraege[sql] = _Eintrag(sql)
+            neu = eintrag.plan is None
+            if neu:
+                # Platzhalter, damit parallele Ausführungen nicht ebenfalls erklären
+                eintrag.plan = []
+            eintrag.anzahl += 1
+            eintrag.gesamt += dauer
+            if dauer >= eintrag.max:
+                eintrag.max = dauer
+                eintrag.parameter = text_parameter
+            if route not in eintrag.routen:
+                eintrag.routen = (eintrag.routen + [route])[-MAX_ROUTEN:]
+        plan = _erklaere(conn, anweisung, parameter) if neu else eintrag.plan
+        if neu:
+            eintrag.plan = plan
+        scans = [zeile for zeile in plan if _ist_scan(zeile)]
+        logger.warning(
+            "Langsame Abfrage %.1f ms [%s]%s: %s | Parameter: %s",
+            dauer * 1000, route, " SCAN: " + "; ".join(scans) if scans else "", anweisung.strip(), text_parameter,
+        )
+
+    def langsamste(self, limit=20, sortierung="max"):
+        with self._sperre:
+            eintraege = [
+                {
+                    "sql": e.sql,
+                    "anzahl": e.anzahl,
+                    "gesamt_ms": e.gesamt * 1000,
+                    "max_ms": e.max * 1000,
+                    "mittel_ms": e.gesamt / e.anzahl * 1000,
+                    "parameter": e.parameter,
+                    "routen": list(e.routen),
+                    "plan": list(e.plan or ()),
+                }
+                for e in self._eintraege.values()
+            ]
+        for eintrag in eintraege:
+            eintrag["scan"] = any(_ist_scan(zeile) for zeile in eintrag["plan"])
+        schluessel = {"max": "max_ms", "gesamt": "gesamt_ms", "anzahl": "anzahl"}[sortierung]
+        return sorted(eintraege, key=lambda e: e[schluessel], reverse=True)[:limit]
+
+    def leeren(self):
+        with self._sperre:
+            anzahl = len(self._eintraege)
+            self._eintraege.clear()
+        return anzahl
+
+
+abfrage_profil = AbfrageProfil()
+
+
+def _herkunft():
+    scope = _scope.get()
+    if scope is not None:
+        return f"{scope['method']} {route_vorlage(scope) or scope['path']}"
+    # Worker ohne Anfrage (KI-Aufträge, Versuchs-Puffer, Vektorindex)
+    return f"Thread {threading.current_thread().name}"
+
+
+# Die Volltextsuche erscheint als SCAN der virtuellen Tabelle, nutzt aber den FTS-Index
+def _ist_scan(zeile):
+    zeile = zeile.strip()
+    return zeile.startswith("SCAN ") and " VIRTUAL TABLE " not in zeile and zeile != "SCAN CONSTANT ROW"
+
+
+# Plan auf der Verbindung der Anweisung (gleiche Transaktion, gleiche
+# Parameter), am Engine-Event vorbei über einen eigenen DBAPI-Cursor
+def _erklaere(conn, anweisung, parameter):
+    if not anweisung.lstrip().upper().startswith(_ERKLAERBAR):
+        return []
+    try:
+        cursor = conn.connection.dbapi_connection.cursor()
+        try:
+            cursor.execute("EXPLAIN QUERY PLAN " + anweisung, parameter or ())
+            zeilen = cursor.fetchall()
+        finally:
+            cursor.close()
+    except Exception as fehler:
+        return [f"EXPLAIN fehlgeschlagen: {fehler}"]
+    # Zeilen (id, parent, notused, detail); Einrückung nach Verschachtelung
+    tiefe = {0: -1}
+    plan = []
+    for knoten, eltern, _, detail in zeilen:
+        tiefe[knoten] = tiefe.get(eltern, -1) + 1
+        plan.append("  " * tiefe[knoten] + detail if tiefe[knoten] else detail)
+    return plan
+
+
+def _vor_abfrage(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._profil_start = time.perf_counter()
+
+
+def _nach_abfrage(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, "_profil_start", None)
+    if start is None:
+        return
+    dauer = time.perf_counter() - start
+    if dauer >= abfrage_profil.schwelle:
+        abfrage_profil.erfasse(conn, statement, parameters, dauer, executemany)
+
+
+def beobachte(*engines):
+    for engine in engines:
+        if engine is None:
+            continue
+        engine = getattr(engine, "sync_engine", engine)
+        event.listen(engine, "before_cursor_execute", _vor_abfrage)
+        event.listen(engine, "after_cursor_execute", _nach_abfrage)
+
+
+# Merkt sich den Scope der Anfrage, damit langsame Abfragen ihre Route kennen
+class AbfrageProfilMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = _scope.set(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _scope.reset(token)
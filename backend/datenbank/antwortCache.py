@@ -0,0 +1,243 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict, namedtuple
+from urllib.parse import parse_qs
+
+from starlette.responses import Response
+
+# In-Process-Cache für GET-Antworten. Jeder Eintrag trägt Tags, von denen sein
+# Inhalt abhängt; die Schreibfunktionen in crud.py invalidieren nach dem Commit
+# genau die betroffenen Tags:
+#   "datei"                 Listen aller Dateien (Sammlung)
+#   "datei:5"               Detailansicht einer Datei
+#   "notiz:3/dateien"       Relation einer Notiz zu ihren Dateien
+#   "notiz_datei"           irgendeine Verknüpfung Notiz/Datei
+Eintrag = namedtuple("Eintrag", ["inhalt", "etag", "media_type", "tags", "ablauf"])
+
+RESSOURCEN = {
+    "dateien": "datei",
+    "notizen": "notiz",
+    "kiantworten": "kiantwort",
+    "quiz-sessions": "quiz_session",
+    "quiz-fragen": "quiz_frage",
+}
+
+# Zusammengesetzte Listen hängen zusätzlich von ihren Kindern und Verknüpfungen ab
+_VOLLSTAENDIG = {
+    "notizen": {"notiz", "kiantwort", "datei", "notiz_datei"},
+    "quiz-sessions": {"quiz_session", "quiz_frage", "datei", "datei_quizsession"},
+}
+
+# Nach datei_id gefilterte Listen ändern sich auch beim Verknüpfen und Lösen
+_VERKNUEPFUNG = {"notizen": "notiz_datei", "quiz-sessions": "datei_quizsession"}
+
+
+def tags_fuer_pfad(pfad, query=""):
+    teile = pfad.strip("/").split("/")
+    if len(teile) < 2 or teile[0] != "api":
+        return None
+    ressource, rest = teile[1], teile[2:]
+    if ressource == "suche" and not rest:
+        return {"datei", "notiz", "kiantwort", "quiz_frage"}
+    if ressource not in RESSOURCEN:
+        return None
+    entitaet = RESSOURCEN[ressource]
+    if not rest:
+        if ressource in _VERKNUEPFUNG and "datei_id" in parse_qs(query):
+            return {entitaet, _VERKNUEPFUNG[ressource]}
+        return {entitaet}
+    if rest == ["vollstaendig"] and ressource in _VOLLSTAENDIG:
+        return set(_VOLLSTAENDIG[ressource])
+    if rest == ["facetten"]:
+        return {entitaet}
+    if ressource == "kiantworten" and len(rest) == 2 and rest[0] == "notiz" and rest[1].isdigit():
+        return {f"notiz:{rest[1]}/kiantworten"}
+    if not rest[0].isdigit():
+        return None
+    if len(rest) == 1:
+        return {f"{entitaet}:{rest[0]}"}
+    if len(rest) == 2 and rest[1] == "inhalt":
+        # Dateiinhalte werden gestreamt und nicht zwischengespeichert
+        return None
+    if len(rest) == 2 and rest[1] == "aehnliche":
+        # Hängt vom Vektorindex ab, der erst nach dem Commit aktualisiert wird
+        return None
+    if len(rest) == 2 and rest[1] == "vollstaendig" and ressource in _VOLLSTAENDIG:
+        kinder = ("kiantworten", "dateien") if ressource == "notizen" else ("fragen", "dateien")
+        return {f"{entitaet}:{rest[0]}"} | {f"{entitaet}:{rest[0]}/{kind}" for kind in kinder}
+    if len(rest) == 2:
+        return {f"{entitaet}:{rest[0]}/{rest[1]}"}
+    return None
+
+
+class _Ticket:
+    # Eine laufende Anfrage, deren Ergebnis noch gespeichert werden soll. Wird
+    # während der Anfrage einer ihrer Tags invalidiert, ist das Ergebnis
+    # möglicherweise veraltet und wird nicht gespeichert.
+    __slots__ = ("tags", "veraltet")
+
+    def __init__(self, tags):
+        self.tags = tags
+        self.veraltet = False
+
+
+class AntwortCache:
+    def __init__(self, max_eintraege=1024, max_bytes=64 * 2**20, ttl=60.0):
+        self.max_eintraege = max_eintraege
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._eintraege = OrderedDict()
+        self._tag_index = defaultdict(set)
+        self._laufend = set()
+        self._bytes = 0
+        self._sperre = threading.Lock()
+        self.zaehler = {"treffer": 0, "fehlgriffe": 0, "nicht_geaendert": 0, "verdraengt": 0, "invalidiert": 0}
+
+    @property
+    def aktiv(self):
+        return self.max_eintraege > 0
+
+    def hole(self, schluessel):
+        with self._sperre:
+            eintrag = self._eintraege.get(schluessel)
+            if eintrag is None:
+                self.zaehler["fehlgriffe"] += 1
+                return None
+            if eintrag.ablauf < time.monotonic():
+                self._entferne(schluessel)
+                self.zaehler["fehlgriffe"] += 1
+                return None
+            self._eintraege.move_to_end(schluessel)
+            self.zaehler["treffer"] += 1
+            return eintrag
+
+    def beginne(self, tags):
+        ticket = _Ticket(frozenset(tags))
+        with self._sperre:
+            self._laufend.add(ticket)
+        return ticket
+
+    def speichere(self, ticket, schluessel, inhalt, etag, media_type):
+        with self._sperre:
+            self._laufend.discard(ticket)
+            if ticket.veraltet or len(inhalt) > self.max_bytes:
+                return
+            if schluessel in self._eintraege:
+                self._entferne(schluessel)
+            self._eintraege[schluessel] = Eintrag(inhalt, etag, media_type, ticket.tags, time.monotonic() + self.ttl)
+            self._bytes += len(inhalt)
+            for tag in ticket.tags:
+                self._tag_index[tag].add(schluessel)
+            while len(self._eintraege) > self.max_eintraege or self._bytes > self.max_bytes:
+                self._entferne(next(iter(self._eintraege)))
+                self.zaehler["verdraengt"] += 1
+
+    def zaehle(self, name):
+        with self._sperre:
+            self.zaehler[name] += 1
+
+    def verwerfe(self, ticket):
+        with self._sperre:
+            self._laufend.discard(ticket)
+
+    def invalidiere(self, *tags):
+        if not self.aktiv or not tags:
+            return
+        tags = set(tags)
+        with self._sperre:
+            for ticket in self._laufend:
+                if not ticket.veraltet and ticket.tags & tags:
+                    ticket.veraltet = True
+            schluessel = set()
+            for tag in tags:
+                schluessel |= self._tag_index.get(tag, set())
+            for eintrag in schluessel:
+                self._entferne(eintrag)
+                self.zaehler["invalidiert"] += 1
+
+    def leeren(self):
+        with self._sperre:
+            for ticket in self._laufend:
+                ticket.veraltet = True
+            self._eintraege.clear()
+            self._tag_index.clear()
+            self._bytes = 0
+
+    def statistik(self):
+        with self._sperre:
+            anfragen = self.zaehler["treffer"] + self.zaehler["fehlgriffe"]
+            return {
+                **self.zaehler,
+                "trefferquote": self.zaehler["treffer"] / anfragen if anfragen else 0.0,
+                "eintraege": len(self._eintraege),
+                "bytes": self._bytes,
+                "max_eintraege": self.max_eintraege,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+            }
+
+    def _entferne(self, schluessel):
+        eintrag = self._eintraege.pop(schluessel, None)
+        if eintrag is None:
+            return
+        self._bytes -= len(eintrag.inhalt)
+        for tag in eintrag.tags:
+            schluessel_menge = self._tag_index.get(tag)
+            if schluessel_menge is not None:
+                schluessel_menge.discard(schluessel)
+                if not schluessel_menge:
+                    del self._tag_index[tag]
+
+
+# LERNASSISTENT_CACHE_EINTRAEGE=0 schaltet den Cache ab
+antwort_cache = AntwortCache(
+    max_eintraege=int(os.getenv("LERNASSISTENT_CACHE_EINTRAEGE", "1024")),
+    max_bytes=int(os.getenv("LERNASSISTENT_CACHE_BYTES", str(64 * 2**20))),
+    ttl=float(os.getenv("LERNASSISTENT_CACHE_TTL", "60")),
+)
+
+
+def etag_passt(request, etag):
+    kandidaten = request.headers.get("if-none-match")
+    if not kandidaten:
+        return False
+    return kandidaten.strip() == "*" or etag in (kandidat.strip() for kandidat in kandidaten.split(","))
+
+
+def _antwort(request, eintrag, status):
+    headers = {"ETag": eintrag.etag, "Cache-Control": "no-cache", "X-Cache": status}
+    if etag_passt(request, eintrag.etag):
+        antwort_cache.zaehle("nicht_geaendert")
+        return Response(status_code=304, headers=headers)
+    return Response(content=eintrag.inhalt, media_type=eintrag.media_type, headers=headers)
+
+
+# HTTP-Middleware: beantwortet GET-Anfragen aus dem Cache bzw. mit 304, ohne
+# die Datenbank zu berühren, und legt neue 200-Antworten mit starkem ETag ab.
+async def cache_middleware(request, call_next):
+    tags = tags_fuer_pfad(request.url.path, request.url.query) if request.method == "GET" and antwort_cache.aktiv else None
+    if tags is None:
+        return await call_next(request)
+
+    schluessel = request.url.path + "?" + "&".join(sorted(request.url.query.split("&")))
+    eintrag = antwort_cache.hole(schluessel)
+    if eintrag is not None:
+        return _antwort(request, eintrag, "HIT")
+
+    ticket = antwort_cache.beginne(tags)
+    try:
+        response = await call_next(request)
+        if response.status_code != 200:
+            antwort_cache.verwerfe(ticket)
+            return response
+        inhalt = b"".join([teil async for teil in response.body_iterator])
+    except BaseException:
+        antwort_cache.verwerfe(ticket)
+        raise
+    # Einzelne Datensätze setzen ihre Version als ETag (versionierung.py)
+    etag = response.headers.get("etag") or '"' + hashlib.sha256(inhalt).hexdigest()[:32] + '"'
+    media_type = response.headers.get("content-type")
+    antwort_cache.speichere(ticket, schluessel, inhalt, etag, media_type)
+    return _antwort(request, Eintrag(inhalt, etag, media_type, tags, 0), "MISS")
@@ -0,0 +1,210 @@
+import json
+import zlib
+
+from sqlalchemy import func, insert, select
+
+from .crud import ABSTAND
+from .dateiSpeicher import ist_sha256
+from .migrationen import schema_version
+from .volltextsuche import indexiere_nachtraeglich, pausiere_einfuege_trigger
+from .modelle import Datei, Notiz, KiAntwort, QuizSession, QuizFrage, notiz_datei, datei_quizsession
+
+# Export/Import der gesamten Lerndatenbank als NDJSON: eine Kopfzeile, danach
+# eine Zeile {"tabelle": ..., "daten": {...}} pro Datensatz, Eltern vor Kindern.
+# Der Volltextindex wird nicht exportiert, sondern beim Import neu aufgebaut.
+FORMAT = "lernassistent-ndjson"
+FORMAT_VERSION = 1
+
+TABELLEN = {
+    tabelle.name: tabelle
+    for tabelle in (
+        Datei.__table__,
+        Notiz.__table__,
+        KiAntwort.__table__,
+        QuizSession.__table__,
+        QuizFrage.__table__,
+        notiz_datei,
+        datei_quizsession,
+    )
+}
+
+STAPEL = 2000
+PUFFER_BYTES = 64 * 1024
+
+
+def _zeile(objekt):
+    return (json.dumps(objekt, ensure_ascii=False, separators=(",", ":")) + "\n").encode()
+
+
+def _export_zeilen(engine):
+    # Eine eigene Lesetransaktion sorgt für einen konsistenten Stand über alle
+    # Tabellen; yield_per holt die Zeilen stapelweise über den Cursor, statt
+    # das Ergebnis vollständig zu laden.
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.exec_driver_sql("BEGIN")
+        try:
+            yield _zeile({"format": FORMAT, "version": FORMAT_VERSION, "schema_version": schema_version(connection)})
+            for name, tabelle in TABELLEN.items():
+                abfrage = select(tabelle).order_by(*tabelle.primary_key.columns)
+                for daten in connection.execution_options(yield_per=STAPEL).execute(abfrage).mappings():
+                    yield _zeile({"tabelle": name, "daten": dict(daten)})
+        finally:
+            connection.exec_driver_sql("COMMIT")
+
+
+def exportiere(engine, komprimiert=False):
+    packer = zlib.compressobj(6, zlib.DEFLATED, 31) if komprimiert else None
+    puffer = bytearray()
+    for zeile in _export_zeilen(engine):
+        puffer += packer.compress(zeile) if packer else zeile
+        if len(puffer) >= PUFFER_BYTES:
+            yield bytes(puffer)
+            puffer.clear()
+    if packer:
+        puffer += packer.flush()
+    if puffer:
+        yield bytes(puffer)
+
+
+class ImportFehler(ValueError):
+    pass
+
+
+# Liest einen Export in beliebig großen Stücken ein und schreibt ihn
+# stapelweise in einer einzigen Transaktion. Ids werden nicht über eine
+# Zuordnungstabelle umgeschrieben, sondern um das bisherige Maximum jeder
+# Tabelle verschoben; in eine leere Datenbank bleiben sie dadurch unverändert.
+class NdjsonImport:
+    def __init__(self, engine):
+        self.engine = engine
+        self.connection = None
+        self.versatz = {}
+        self.anzahl = {name: 0 for name in TABELLEN}
+        self._entpacker = None
+        self._rest = b""
+        self._zeilennummer = 0
+        self._kopf_gelesen = False
+        self._stapel = {}
+        # Exporte vor Schema-Version 5 speichern die Reihenfolge der KI-Antworten
+        # als Liste in der Notiz: {kiantwort_id: Stelle} und {notiz_id: Länge}
+        self._alte_stellen = {}
+        self._alte_laengen = {}
+
+    def beginne(self):
+        self.connection = self.engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+        self.connection.exec_driver_sql("BEGIN IMMEDIATE")
+        # Fremdschlüssel erst beim COMMIT prüfen, dann spielt die Reihenfolge keine Rolle
+        self.connection.exec_driver_sql("PRAGMA defer_foreign_keys=ON")
+        # Versatz ab der höchsten je vergebenen id; bei AUTOINCREMENT-Tabellen
+        # steht sie in sqlite_sequence, auch wenn die Zeile gelöscht ist
+        for name, tabelle in TABELLEN.items():
+            if "id" in tabelle.c:
+                hoechste = self.connection.execute(select(func.coalesce(func.max(tabelle.c.id), 0))).scalar()
+                vergeben = self.connection.exec_driver_sql(
+                    "SELECT seq FROM sqlite_sequence WHERE name = ?", (tabelle.name,)
+                ).scalar()
+                self.versatz[name] = max(hoechste, vergeben or 0)
+        pausiere_einfuege_trigger(self.connection)
+
+    def verarbeite(self, stueck: bytes):
+        if self._entpacker is None:
+            if not (self._rest + stueck):
+                return
+            gzip = (self._rest + stueck)[:2] == b"\x1f\x8b"
+            self._entpacker = zlib.decompressobj(31) if gzip else False
+        if self._entpacker:
+            try:
+                stueck = self._entpacker.decompress(stueck)
+            except zlib.error as fehler:
+                raise ImportFehler(f"Ungültige gzip-Daten: {fehler}")
+        zeilen = (self._rest + stueck).split(b"\n")
+        self._rest = zeilen.pop()
+        for zeile in zeilen:
+            self._verarbeite_zeile(zeile)
+
+    def abschliessen(self):
+        if self._rest:
+            self._verarbeite_zeile(self._rest)
+            self._rest = b""
+        if not self._kopf_gelesen:
+            raise ImportFehler("Leerer Import")
+        for schluessel in list(self._stapel):
+            self._schreibe(schluessel)
+        indexiere_nachtraeglich(self.connection, self.versatz)
+        self.connection.exec_driver_sql("COMMIT")
+        self._schliesse()
+        return {"importiert": self.anzahl, "id_versatz": self.versatz}
+
+    def abbrechen(self):
+        if self.connection is not None:
+            self.connection.exec_driver_sql("ROLLBACK")
+            self._schliesse()
+
+    def _schliesse(self):
+        self.connection.close()
+        self.connection = None
+
+    def _verarbeite_zeile(self, zeile: bytes):
+        self._zeilennummer += 1
+        if not zeile.strip():
+            return
+        try:
+            objekt = json.loads(zeile)
+        except ValueError:
+            raise ImportFehler(f"Zeile {self._zeilennummer}: kein gültiges JSON")
+        if not isinstance(objekt, dict):
+            raise ImportFehler(f"Zeile {self._zeilennummer}: Objekt erwartet")
+
+        if not self._kopf_gelesen:
+            if objekt.get("format") != FORMAT or objekt.get("version") != FORMAT_VERSION:
+                raise ImportFehler(f"Unbekanntes Format, erwartet {FORMAT} Version {FORMAT_VERSION}")
+            self._kopf_gelesen = True
+            return
+
+        name, daten = objekt.get("tabelle"), objekt.get("daten")
+        if name not in TABELLEN or not isinstance(daten, dict):
+            raise ImportFehler(f"Zeile {self._zeilennummer}: unbekannte Tabelle {name!r}")
+        tabelle = TABELLEN[name]
+        self._alte_reihenfolge(name, daten)
+        daten = {spalte: wert for spalte, wert in daten.items() if spalte in tabelle.c}
+        try:
+            self._verschiebe_ids(tabelle, daten)
+        except TypeError:
+            raise ImportFehler(f"Zeile {self._zeilennummer}: ungültige Id")
+        # Wird zum Pfad im Dateispeicher (siehe dateiSpeicher.blob_pfad)
+        if daten.get("inhalt_sha256") is not None and not ist_sha256(daten["inhalt_sha256"]):
+            raise ImportFehler(f"Zeile {self._zeilennummer}: ungültiger inhalt_sha256")
+
+        # executemany verlangt gleiche Spalten in allen Zeilen eines Stapels
+        schluessel = (name, tuple(sorted(daten)))
+        stapel = self._stapel.setdefault(schluessel, [])
+        stapel.append(daten)
+        if len(stapel) >= STAPEL:
+            self._schreibe(schluessel)
+
+    def _alte_reihenfolge(self, name, daten):
+        if name == "notizen" and isinstance(daten.get("reihenfolgeKiAntworten"), list):
+            liste = daten["reihenfolgeKiAntworten"]
+            for stelle, kiantwort_id in enumerate(liste, 1):
+                if isinstance(kiantwort_id, int):
+                    self._alte_stellen.setdefault(kiantwort_id, stelle)
+            self._alte_laengen[daten.get("id")] = len(liste)
+        elif name == "kiAntworten" and "position" not in daten and self._alte_laengen:
+            # Nicht aufgeführte Antworten folgen nach id hinter den aufgeführten
+            ende = self._alte_laengen.get(daten.get("notiz_id"), 0) + 1
+            daten["position"] = self._alte_stellen.get(daten.get("id"), ende) * ABSTAND
+
+    def _verschiebe_ids(self, tabelle, daten):
+        if daten.get("id") is not None and tabelle.name in self.versatz:
+            if daten["id"] < 1:
+                raise TypeError
+            daten["id"] += self.versatz[tabelle.name]
+        for fk in tabelle.foreign_keys:
+            spalte = fk.parent.name
+            if daten.get(spalte) is not None:
+                daten[spalte] += self.versatz[fk.column.table.name]
+
+    def _schreibe(self, schluessel):
+        zeilen = self._stapel.pop(schluessel)
+        self.connection.execute(insert(TABELLEN[schluessel[0]]), zeilen)
+        self.anzahl[schluessel[0]] += len(zeilen)
@@ -1,16 +1,197 @@
-from sqlalchemy.orm import Session
-from .modelle import Datei, Notiz, KiAntwort, QuizSession, QuizFrage
+import heapq
+from typing import List, Optional
+from sqlalchemy import and_, bindparam, case, delete, func, insert, intersect, literal_column, or_, select, text, union, union_all, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, selectinload
+from .modelle import Datei, Notiz, KiAntwort, KiAuftrag, QuizSession, QuizFrage, QuizVersuch, notiz_datei, datei_quizsession, notiz_label, datei_facetten, inhalt_abschnitte, inhalt_extraktion, ki_ergebnisse, quiz_wiederholung, statistik_gesamt, statistik_notizen, statistik_quiz_sessions, statistik_module
+from . import dateiSpeicher, statistik, wiederholung
+from .antwortCache import antwort_cache
+from .extraktion import WARTEND, extraktion
+from .facetten import SPALTEN as FACETTEN
+from .vektorIndex import INDIZES, vektor_index
+from .versionierung import VersionKonflikt
+from .volltextsuche import TYPEN, baue_fts_abfrage
 from .pydanticModelle import (
     DateiCreate, DateiUpdate,
     NotizCreate, NotizUpdate,
     KiAntwortCreate, KiAntwortUpdate,
     QuizSessionCreate, QuizSessionUpdate,
     QuizFrageCreate, QuizFrageUpdate,
+    DateiBatchUpdate, NotizBatchUpdate, KiAntwortBatchUpdate, QuizFrageBatchUpdate,
+    KiAuftragCreate,
 )
 
+# Keyset-Pagination über die Primärschlüssel: es wird immer ein Eintrag mehr
+# geladen als angefragt, um zu erkennen, ob es eine weitere Seite gibt.
+def _seite(query, modell, limit: int, after: Optional[int]):
+    if after is not None:
+        query = query.filter(modell.id > after)
+    eintraege = query.order_by(modell.id).limit(limit + 1).all()
+    naechster_cursor = eintraege[limit - 1].id if len(eintraege) > limit else None
+    return {"eintraege": eintraege[:limit], "naechster_cursor": naechster_cursor}
+
+
+# Löschen mit einer einzigen Anweisung: abhängige Zeilen und Verknüpfungen
+# entfernt SQLite per ON DELETE CASCADE, RETURNING liefert den gelöschten
+# Datensatz für die Antwort, ohne ihn vorher zu laden. Die Spalten werden als
+# dict zurückgegeben, ein ORM-Objekt wäre nach dem Commit nicht mehr lesbar.
+def _loesche(db: Session, modell, eintragId: int, tags):
+    geloescht = db.execute(delete(modell).where(modell.id == eintragId).returning(*modell.__table__.c)).mappings().first()
+    if geloescht is None:
+        db.rollback()
+        return None
+    db.commit()
+    antwort_cache.invalidiere(*tags)
+    return dict(geloescht)
+
+
+# Ändern mit einer einzigen Anweisung: UPDATE ... RETURNING schreibt die
+# gesetzten Felder, zählt version hoch und liefert die neue Zeile. Mit einer
+# erwarteten Version (If-Match oder "version" im Body) greift das UPDATE nur,
+# wenn sie noch aktuell ist, sonst VersionKonflikt.
+def _aktualisiere(db: Session, modell, eintragId: int, daten: dict, version, tags, vor_commit=None):
+    bodyVersion = daten.pop("version", None)
+    erwartet = version if version is not None else bodyVersion
+    bedingungen = [modell.id == eintragId]
+    if erwartet is not None:
+        bedingungen.append(modell.version == erwartet)
+    anweisung = (
+        update(modell)
+        .where(*bedingungen)
+        .values(**daten, version=modell.version + 1)
+        .returning(*modell.__table__.c)
+        .execution_options(synchronize_session=False)
+    )
+    geaendert = db.execute(anweisung).mappings().first()
+    if geaendert is None:
+        db.rollback()
+        aktuell = db.scalar(select(modell.version).where(modell.id == eintragId))
+        if aktuell is None:
+            return None
+        raise VersionKonflikt({eintragId: aktuell})
+    if vor_commit is not None:
+        vor_commit()
+    db.commit()
+    antwort_cache.invalidiere(*tags)
+    return dict(geaendert)
+
+
+# Cache-Invalidierung: Tags der gecachten GET-Antworten (siehe antwortCache.py),
+# die von einer Änderung der angegebenen Datensätze betroffen sind. Die Tags
+# werden vor dem Commit ermittelt und erst nach dem Commit invalidiert.
+def _tags_dateien(db: Session, ids):
+    if not antwort_cache.aktiv or not ids:
+        return set()
+    tags = {"datei"}
+    for i in ids:
+        tags |= {f"datei:{i}", f"datei:{i}/notizen", f"datei:{i}/quiz-sessions", f"datei:{i}/extraktion", f"datei:{i}/abschnitte"}
+    notiz_ids = db.scalars(select(notiz_datei.c.notiz_id).where(notiz_datei.c.datei_id.in_(ids))).all()
+    qs_ids = db.scalars(select(datei_quizsession.c.quiz_session_id).where(datei_quizsession.c.datei_id.in_(ids))).all()
+    tags |= {f"notiz:{n}/dateien" for n in notiz_ids} | {f"quiz_session:{q}/dateien" for q in qs_ids}
+    return tags
+
+
+def _tags_notizen(db: Session, ids, mit_kindern=False):
+    if not antwort_cache.aktiv or not ids:
+        return set()
+    tags = {"notiz"}
+    for i in ids:
+        tags |= {f"notiz:{i}", f"notiz:{i}/dateien", f"notiz:{i}/kiantworten"}
+    datei_ids = db.scalars(select(notiz_datei.c.datei_id).where(notiz_datei.c.notiz_id.in_(ids))).all()
+    tags |= {f"datei:{d}/notizen" for d in datei_ids}
+    if mit_kindern:
+        tags |= _tags_kiantworten(db, KiAntwort.notiz_id.in_(ids))
+    return tags
+
+
+def _tags_kiantworten(db: Session, bedingung):
+    if not antwort_cache.aktiv:
+        return set()
+    tags = {"kiantwort"}
+    for kia_id, notiz_id in db.execute(select(KiAntwort.id, KiAntwort.notiz_id).where(bedingung)):
+        tags |= {f"kiantwort:{kia_id}", f"notiz:{notiz_id}/kiantworten"}
+    return tags
+
+
+def _tags_quiz_sessions(db: Session, ids, mit_kindern=False):
+    if not antwort_cache.aktiv or not ids:
+        return set()
+    tags = {"quiz_session"}
+    for i in ids:
+        tags |= {f"quiz_session:{i}", f"quiz_session:{i}/dateien", f"quiz_session:{i}/fragen"}
+    datei_ids = db.scalars(select(datei_quizsession.c.datei_id).where(datei_quizsession.c.quiz_session_id.in_(ids))).all()
+    tags |= {f"datei:{d}/quiz-sessions" for d in datei_ids}
+    if mit_kindern:
+        tags |= _tags_quiz_fragen(db, QuizFrage.quiz_session_id.in_(ids))
+    return tags
+
+
+def _tags_quiz_fragen(db: Session, bedingung):
+    if not antwort_cache.aktiv:
+        return set()
+    tags = {"quiz_frage"}
+    for frage_id, qs_id in db.execute(select(QuizFrage.id, QuizFrage.quiz_session_id).where(bedingung)):
+        tags |= {f"quiz_frage:{frage_id}", f"quiz_frage:{frage_id}/wiederholung", f"quiz_session:{qs_id}/fragen"}
+    return tags
+
+
+# Ids der Kinder, die mit ihren Eltern per CASCADE gelöscht werden; nach dem
+# Commit werden sie aus dem Vektorindex entfernt
+def _kinder_ids(db: Session, modell, spalte, elternIds):
+    if not vektor_index.aktiv:
+        return []
+    return list(db.scalars(select(modell.id).where(spalte.in_(elternIds))))
+
+
+def _tags_verknuepfung(tabelle, elternTag, elternId, dateiIds):
+    # Verknüpfung Notiz/Datei bzw. Quiz-Session/Datei
+    relation = "notizen" if tabelle is notiz_datei else "quiz-sessions"
+    return {tabelle.name, f"{elternTag}:{elternId}/dateien"} | {f"datei:{d}/{relation}" for d in dateiIds}
+
+
 # CRUD für Dateien
-def get_dateien(db: Session):
-    return db.query(Datei).all()
+def _datei_filter(dateiart, dozent, semester, modul):
+    werte = {"dateiart": dateiart, "dozent": dozent, "semester": semester, "modul": modul}
+    return [getattr(Datei, spalte) == wert for spalte, wert in werte.items() if wert is not None]
+
+
+def get_dateien(
+    db: Session,
+    limit: int = 50,
+    after: Optional[int] = None,
+    dateiart: Optional[str] = None,
+    dozent: Optional[str] = None,
+    semester: Optional[str] = None,
+    modul: Optional[str] = None,
+):
+    query = db.query(Datei).filter(*_datei_filter(dateiart, dozent, semester, modul))
+    return _seite(query, Datei, limit, after)
+
+
+# Eine Seite Dateien wie get_dateien plus Anzahlen je Facettenwert. Gezählt
+# wird über datei_facetten; jede Facette berücksichtigt die Filter der
+# anderen, nicht ihren eigenen, damit alternative Werte sichtbar bleiben.
+def get_dateien_facetten(
+    db: Session,
+    limit: int = 50,
+    after: Optional[int] = None,
+    dateiart: Optional[str] = None,
+    dozent: Optional[str] = None,
+    semester: Optional[str] = None,
+    modul: Optional[str] = None,
+):
+    seite = get_dateien(db, limit, after, dateiart, dozent, semester, modul)
+    werte = {"dateiart": dateiart, "dozent": dozent, "semester": semester, "modul": modul}
+    summe = func.sum(datei_facetten.c.anzahl)
+    facetten = {}
+    for facette in FACETTEN:
+        bedingungen = [datei_facetten.c[spalte] == wert for spalte, wert in werte.items() if wert is not None and spalte != facette]
+        spalte = datei_facetten.c[facette]
+        zeilen = db.execute(select(spalte, summe).where(*bedingungen).group_by(spalte).order_by(summe.desc(), spalte)).all()
+        facetten[facette] = [{"wert": wert, "anzahl": anzahl} for wert, anzahl in zeilen]
+    bedingungen = [datei_facetten.c[spalte] == wert for spalte, wert in werte.items() if wert is not None]
+    gesamt = db.scalar(select(func.coalesce(summe, 0)).where(*bedingungen))
+    return {**seite, "gesamt": gesamt, "facetten": facetten}
 
 
 def get_datei(db: Session, dateiId: int):
@@ -21,34 +202,132 @@ def create_datei(db: Session, datei_data: DateiCreate):
     db_datei = Datei(**datei_data.dict(exclude_unset=True))
     db.add(db_datei)
     db.commit()
+    antwort_cache.invalidiere("datei")
     db.refresh(db_datei)
     return db_datei
 
 
-def update_datei(db: Session, dateiId: int, datei_data: DateiUpdate):
-    datei = get_datei(db, dateiId)
-    if not datei:
-        return None
-    update_fields = datei_data.dict(exclude_unset=True)
-    for key, value in update_fields.items():
-        setattr(datei, key, value)
-    db.commit()
-    db.refresh(datei)
-    return datei
+def update_datei(db: Session, dateiId: int, datei_data: DateiUpdate, version: Optional[int] = None):
+    return _aktualisiere(db, Datei, dateiId, datei_data.dict(exclude_unset=True), version, _tags_dateien(db, [dateiId]))
 
 
 def delete_datei(db: Session, dateiId: int):
-    datei = get_datei(db, dateiId)
-    if datei:
-        db.delete(datei)
-        db.commit()
-        return datei
-    return None
+    tags = _tags_dateien(db, [dateiId]) | {"notiz_datei", "datei_quizsession"}
+    geloescht = _loesche(db, Datei, dateiId, tags)
+    if geloescht is not None and geloescht["inhalt_sha256"] is not None:
+        dateiSpeicher.raeume_auf(db)
+    return geloescht
+
+
+# Dateiinhalte (siehe dateiSpeicher.py): der Inhalt wird abgelegt, nachdem der
+# Verweis darauf geschrieben ist (die Transaktion hält dann die Schreibsperre)
+# und bevor er committet wird. Ein bereits vorhandener Inhalt wird nicht noch
+# einmal gespeichert.
+def _inhalt(upload, sha256):
+    return {"inhalt_sha256": sha256, "inhalt_groesse": upload.groesse, "inhalt_typ": upload.mime_typ}
+
+
+def create_datei_mit_inhalt(db: Session, datei_data: DateiCreate, upload, sha256: str):
+    db_datei = Datei(**datei_data.dict(exclude_unset=True), **_inhalt(upload, sha256))
+    db.add(db_datei)
+    db.flush()
+    upload.uebernehme(sha256)
+    db.commit()
+    antwort_cache.invalidiere("datei")
+    extraktion.plane(db, sha256, upload.mime_typ, upload.dateiname or db_datei.pfad)
+    # Erst nach dem Commit in plane(), sonst lädt die Serialisierung die
+    # abgelaufenen Attribute nach, im synchronen Betrieb auf dem Event-Loop
+    db.refresh(db_datei)
+    return db_datei
+
+
+def set_datei_inhalt(db: Session, dateiId: int, upload, sha256: str, version: Optional[int] = None):
+    tags = _tags_dateien(db, [dateiId])
+    geaendert = _aktualisiere(
+        db, Datei, dateiId, _inhalt(upload, sha256), version, tags, vor_commit=lambda: upload.uebernehme(sha256)
+    )
+    if geaendert is not None:
+        # Der vorherige Inhalt hat eventuell keinen Verweis mehr
+        dateiSpeicher.raeume_auf(db)
+        extraktion.plane(db, sha256, upload.mime_typ, upload.dateiname or geaendert["pfad"])
+    return geaendert
+
+
+# Stand der Textextraktion (siehe extraktion.py) für den Inhalt einer Datei;
+# None, wenn die Datei nicht existiert oder keinen Inhalt hat
+def get_datei_extraktion(db: Session, dateiId: int):
+    sha256 = db.scalar(select(Datei.inhalt_sha256).where(Datei.id == dateiId))
+    if sha256 is None:
+        return None
+    stand = db.execute(select(inhalt_extraktion).where(inhalt_extraktion.c.sha256 == sha256)).mappings().first()
+    return dict(stand) if stand is not None else {"sha256": sha256, "status": WARTEND}
+
+
+# Extrahierte Abschnitte einer Datei, Keyset-Pagination über die Nummer
+def get_datei_abschnitte(db: Session, dateiId: int, limit: int = 20, after: Optional[int] = None):
+    sha256 = db.scalar(select(Datei.inhalt_sha256).where(Datei.id == dateiId))
+    if sha256 is None:
+        return None
+    query = select(inhalt_abschnitte.c.nr, inhalt_abschnitte.c.text).where(inhalt_abschnitte.c.sha256 == sha256)
+    if after is not None:
+        query = query.where(inhalt_abschnitte.c.nr > after)
+    eintraege = db.execute(query.order_by(inhalt_abschnitte.c.nr).limit(limit + 1)).mappings().all()
+    naechster_cursor = eintraege[limit - 1]["nr"] if len(eintraege) > limit else None
+    return {"eintraege": [dict(eintrag) for eintrag in eintraege[:limit]], "naechster_cursor": naechster_cursor}
+
+
+# Filter nach Labels über notiz_label (siehe labels.py). Ein Label ist
+# "schluessel:wert" oder nur "schluessel" (Notiz hat den Schlüssel). Jedes
+# Label ist eine Index-Suche; "und" schneidet die Ergebnisse, "oder" vereinigt sie.
+def _label_filter(labels: List[str], modus: str = "und"):
+    abfragen = []
+    for label in labels:
+        schluessel, trenner, wert = label.partition(":")
+        bedingungen = [notiz_label.c.schluessel == schluessel]
+        if trenner:
+            bedingungen.append(notiz_label.c.wert == wert)
+        abfragen.append(select(notiz_label.c.notiz_id).where(*bedingungen))
+    if len(abfragen) == 1:
+        return Notiz.id.in_(abfragen[0])
+    return Notiz.id.in_(intersect(*abfragen) if modus == "und" else union(*abfragen))
 
 
 # CRUD für Notizen
-def get_notizen(db: Session):
-    return db.query(Notiz).all()
+def get_notizen(
+    db: Session,
+    limit: int = 50,
+    after: Optional[int] = None,
+    datei_id: Optional[int] = None,
+    labels: Optional[List[str]] = None,
+    label_modus: str = "und",
+):
+    query = db.query(Notiz)
+    if datei_id is not None:
+        query = query.join(notiz_datei).filter(notiz_datei.c.datei_id == datei_id)
+    if labels:
+        query = query.filter(_label_filter(labels, label_modus))
+    return _seite(query, Notiz, limit, after)
+
+
+# Anzahl Notizen je Label, optional nur für einen Schlüssel und/oder nur über
+# die Notizen, die zu den übergebenen Labels passen
+def get_label_facetten(
+    db: Session,
+    schluessel: Optional[str] = None,
+    labels: Optional[List[str]] = None,
+    label_modus: str = "und",
+    limit: int = 100,
+):
+    anzahl = func.count().label("anzahl")
+    query = select(notiz_label.c.schluessel, notiz_label.c.wert, anzahl)
+    if schluessel is not None:
+        query = query.where(notiz_label.c.schluessel == schluessel)
+    if labels:
+        query = query.where(notiz_label.c.notiz_id.in_(select(Notiz.id).where(_label_filter(labels, label_modus))))
+    query = query.group_by(notiz_label.c.schluessel, notiz_label.c.wert).order_by(
+        anzahl.desc(), notiz_label.c.schluessel, notiz_label.c.wert
+    )
+    return [dict(zeile) for zeile in db.execute(query.limit(limit)).mappings()]
 
 
 def get_notiz(db: Session, notizId: int):
@@ -59,34 +338,109 @@ def create_notiz(db: Session, notiz_data: NotizCreate):
     db_notiz = Notiz(**notiz_data.dict(exclude_unset=True))
     db.add(db_notiz)
     db.commit()
+    antwort_cache.invalidiere("notiz")
     db.refresh(db_notiz)
     return db_notiz
 
 
-def update_notiz(db: Session, notizId: int, notiz_data: NotizUpdate):
-    notiz = get_notiz(db, notizId)
-    if not notiz:
-        return None
-    update_fields = notiz_data.dict(exclude_unset=True)
-    for key, value in update_fields.items():
-        setattr(notiz, key, value)
-    db.commit()
-    db.refresh(notiz)
-    return notiz
+def update_notiz(db: Session, notizId: int, notiz_data: NotizUpdate, version: Optional[int] = None):
+    return _aktualisiere(db, Notiz, notizId, notiz_data.dict(exclude_unset=True), version, _tags_notizen(db, [notizId]))
 
 
 def delete_notiz(db: Session, notizId: int):
-    notiz = get_notiz(db, notizId)
-    if notiz:
-        db.delete(notiz)
-        db.commit()
-        return notiz
+    tags = _tags_notizen(db, [notizId], mit_kindern=True) | {"notiz_datei"}
+    kiaIds = _kinder_ids(db, KiAntwort, KiAntwort.notiz_id, [notizId])
+    geloescht = _loesche(db, Notiz, notizId, tags)
+    if geloescht:
+        vektor_index.entferne("kiantworten", kiaIds)
+    return geloescht
+
+
+# Reihenfolge der KI-Antworten einer Notiz: position wird mit Lücken von
+# ABSTAND vergeben. Verschieben setzt die Antwort auf die Mitte zwischen ihre
+# neuen Nachbarn und ändert damit nur eine Zeile; erst wenn dort keine Lücke
+# mehr ist, werden die Positionen der Notiz neu verteilt. Gleiche Positionen
+# (gleichzeitiges Verschieben) entscheidet die id.
+ABSTAND = 1024
+
+
+def _position_am_ende(notizId):
+    # Alias, damit die Unterabfrage in einem UPDATE auf kiAntworten nicht mit
+    # der äußeren Tabelle korreliert wird
+    andere = KiAntwort.__table__.alias("andere")
+    return (
+        select(func.coalesce(func.max(andere.c.position), 0) + ABSTAND)
+        .where(andere.c.notiz_id == notizId)
+        .scalar_subquery()
+    )
+
+
+def _position_bei_notizwechsel(notizId):
+    # Wechselt die Antwort die Notiz, kommt sie dort ans Ende
+    return {"position": case((KiAntwort.notiz_id == notizId, KiAntwort.position), else_=_position_am_ende(notizId))}
+
+
+def _nachbar_position(db: Session, referenz, kiantwortId: int, davor: bool):
+    if davor:
+        naeher = or_(KiAntwort.position < referenz.position, and_(KiAntwort.position == referenz.position, KiAntwort.id < referenz.id))
+        reihenfolge = (KiAntwort.position.desc(), KiAntwort.id.desc())
+    else:
+        naeher = or_(KiAntwort.position > referenz.position, and_(KiAntwort.position == referenz.position, KiAntwort.id > referenz.id))
+        reihenfolge = (KiAntwort.position, KiAntwort.id)
+    return db.scalar(
+        select(KiAntwort.position)
+        .where(KiAntwort.notiz_id == referenz.notiz_id, KiAntwort.id != kiantwortId, naeher)
+        .order_by(*reihenfolge)
+        .limit(1)
+    )
+
+
+def _neue_position(db: Session, referenz, kiantwortId: int, davor: bool):
+    nachbar = _nachbar_position(db, referenz, kiantwortId, davor)
+    if nachbar is None:
+        return referenz.position - ABSTAND if davor else referenz.position + ABSTAND
+    if abs(referenz.position - nachbar) >= 2:
+        return (referenz.position + nachbar) // 2
     return None
 
 
+# Ändert nur die Abstände, nicht die Reihenfolge. position gehört aber zur
+# Antwort und damit zum ETag, deshalb steigt die version jeder verschobenen
+# Zeile; außer bei der zu verschiebenden, die das anschließende Update ohnehin
+# hochzählt und deren If-Match sonst nicht mehr passen würde.
+def _verteile_neu(db: Session, notizId: int, ausser: int):
+    db.execute(
+        text(
+            'UPDATE "kiAntworten" SET position = neu.position, '
+            'version = version + ("kiAntworten".id != :ausser) FROM ('
+            'SELECT id, ROW_NUMBER() OVER (ORDER BY position, id) * :abstand AS position '
+            'FROM "kiAntworten" WHERE notiz_id = :notiz'
+            ') AS neu WHERE "kiAntworten".id = neu.id AND "kiAntworten".position != neu.position'
+        ),
+        {"abstand": ABSTAND, "notiz": notizId, "ausser": ausser},
+    )
+
+
+def _referenz(db: Session, kiantwortId: int):
+    return db.execute(
+        select(KiAntwort.id, KiAntwort.notiz_id, KiAntwort.position).where(KiAntwort.id == kiantwortId)
+    ).first()
+
+
 # CRUD für Ki-Antworten
-def get_kiantworten(db: Session):
-    return db.query(KiAntwort).all()
+def get_kiantworten(
+    db: Session,
+    limit: int = 50,
+    after: Optional[int] = None,
+    notiz_id: Optional[int] = None,
+    typ: Optional[str] = None,
+):
+    query = db.query(KiAntwort)
+    if notiz_id is not None:
+        query = query.filter(KiAntwort.notiz_id == notiz_id)
+    if typ is not None:
+        query = query.filter(KiAntwort.typ == typ)
+    return _seite(query, KiAntwort, limit, after)
 
 
 def get_kiantwort(db: Session, kiantwortId: int):
@@ -94,37 +448,72 @@ def get_kiantwort(db: Session, kiantwortId: int):
 
 
 def create_kiantwort(db: Session, kiantwort_data: KiAntwortCreate):
-    db_kia = KiAntwort(**kiantwort_data.dict(exclude_unset=True))
+    db_kia = KiAntwort(**kiantwort_data.dict(exclude_unset=True), position=_position_am_ende(kiantwort_data.notiz_id))
     db.add(db_kia)
     db.commit()
+    antwort_cache.invalidiere("kiantwort", f"notiz:{db_kia.notiz_id}/kiantworten")
     db.refresh(db_kia)
+    vektor_index.aktualisiere(db, "kiantworten", [db_kia.id])
     return db_kia
 
 
-def update_kiantwort(db: Session, kiantwortId: int, kiantwort_data: KiAntwortUpdate):
-    kia = get_kiantwort(db, kiantwortId)
-    if not kia:
-        return None
-    update_fields = kiantwort_data.dict(exclude_unset=True)
-    for key, value in update_fields.items():
-        setattr(kia, key, value)
-    db.commit()
-    db.refresh(kia)
-    return kia
+def update_kiantwort(db: Session, kiantwortId: int, kiantwort_data: KiAntwortUpdate, version: Optional[int] = None):
+    tags = _tags_kiantworten(db, KiAntwort.id == kiantwortId)
+    daten = kiantwort_data.dict(exclude_unset=True)
+    if kiantwort_data.notiz_id is not None:
+        tags.add(f"notiz:{kiantwort_data.notiz_id}/kiantworten")
+        daten.update(_position_bei_notizwechsel(kiantwort_data.notiz_id))
+    geaendert = _aktualisiere(db, KiAntwort, kiantwortId, daten, version, tags)
+    if geaendert:
+        vektor_index.aktualisiere(db, "kiantworten", [kiantwortId])
+    return geaendert
 
 
 def delete_kiantwort(db: Session, kiantwortId: int):
-    kia = get_kiantwort(db, kiantwortId)
-    if kia:
-        db.delete(kia)
-        db.commit()
-        return kia
-    return None
+    tags = _tags_kiantworten(db, KiAntwort.id == kiantwortId)
+    geloescht = _loesche(db, KiAntwort, kiantwortId, tags)
+    if geloescht:
+        vektor_index.entferne("kiantworten", [kiantwortId])
+    return geloescht
+
+
+# Verschiebt eine KI-Antwort vor bzw. hinter eine andere, auch in deren Notiz.
+# None, wenn eine der beiden Antworten nicht existiert.
+def verschiebe_kiantwort(
+    db: Session,
+    kiantwortId: int,
+    vor: Optional[int] = None,
+    nach: Optional[int] = None,
+    version: Optional[int] = None,
+):
+    davor = vor is not None
+    referenz = _referenz(db, vor if davor else nach)
+    if referenz is None:
+        return None
+    if referenz.id == kiantwortId:
+        return get_kiantwort(db, kiantwortId)
+    tags = _tags_kiantworten(db, KiAntwort.id == kiantwortId) | {f"notiz:{referenz.notiz_id}/kiantworten"}
+    position = _neue_position(db, referenz, kiantwortId, davor)
+    if position is None:
+        _verteile_neu(db, referenz.notiz_id, kiantwortId)
+        tags |= _tags_kiantworten(db, KiAntwort.notiz_id == referenz.notiz_id)
+        referenz = _referenz(db, referenz.id)
+        position = _neue_position(db, referenz, kiantwortId, davor)
+    daten = {"notiz_id": referenz.notiz_id, "position": position}
+    return _aktualisiere(db, KiAntwort, kiantwortId, daten, version, tags)
 
 
 # CRUD für Quiz-Sessions
-def get_quiz_sessions(db: Session):
-    return db.query(QuizSession).all()
+def get_quiz_sessions(
+    db: Session,
+    limit: int = 50,
+    after: Optional[int] = None,
+    datei_id: Optional[int] = None,
+):
+    query = db.query(QuizSession)
+    if datei_id is not None:
+        query = query.join(datei_quizsession).filter(datei_quizsession.c.datei_id == datei_id)
+    return _seite(query, QuizSession, limit, after)
 
 
 def get_quiz_session(db: Session, quizSessionId: int):
@@ -135,34 +524,35 @@ def create_quiz_session(db: Session, qs_data: QuizSessionCreate):
     db_qs = QuizSession(**qs_data.dict(exclude_unset=True))
     db.add(db_qs)
     db.commit()
+    antwort_cache.invalidiere("quiz_session")
     db.refresh(db_qs)
     return db_qs
 
 
-def update_quiz_session(db: Session, quizSessionId: int, qs_data: QuizSessionUpdate):
-    qs = get_quiz_session(db, quizSessionId)
-    if not qs:
-        return None
-    update_fields = qs_data.dict(exclude_unset=True)
-    for key, value in update_fields.items():
-        setattr(qs, key, value)
-    db.commit()
-    db.refresh(qs)
-    return qs
+def update_quiz_session(db: Session, quizSessionId: int, qs_data: QuizSessionUpdate, version: Optional[int] = None):
+    return _aktualisiere(db, QuizSession, quizSessionId, qs_data.dict(exclude_unset=True), version, _tags_quiz_sessions(db, [quizSessionId]))
 
 
 def delete_quiz_session(db: Session, quizSessionId: int):
-    qs = get_quiz_session(db, quizSessionId)
-    if qs:
-        db.delete(qs)
-        db.commit()
-        return qs
-    return None
+    tags = _tags_quiz_sessions(db, [quizSessionId], mit_kindern=True) | {"datei_quizsession"}
+    frageIds = _kinder_ids(db, QuizFrage, QuizFrage.quiz_session_id, [quizSessionId])
+    geloescht = _loesche(db, QuizSession, quizSessionId, tags)
+    if geloescht:
+        vektor_index.entferne("quizfragen", frageIds)
+    return geloescht
 
 
 # CRUD für Quiz-Fragen
-def get_quiz_fragen(db: Session):
-    return db.query(QuizFrage).all()
+def get_quiz_fragen(
+    db: Session,
+    limit: int = 50,
+    after: Optional[int] = None,
+    quiz_session_id: Optional[int] = None,
+):
+    query = db.query(QuizFrage)
+    if quiz_session_id is not None:
+        query = query.filter(QuizFrage.quiz_session_id == quiz_session_id)
+    return _seite(query, QuizFrage, limit, after)
 
 
 def get_quiz_frage(db: Session, quizFrageId: int):
@@ -173,106 +563,718 @@ def create_quiz_frage(db: Session, frage_data: QuizFrageCreate):
     db_frage = QuizFrage(**frage_data.dict(exclude_unset=True))
     db.add(db_frage)
     db.commit()
+    antwort_cache.invalidiere("quiz_frage", f"quiz_session:{db_frage.quiz_session_id}/fragen")
     db.refresh(db_frage)
+    vektor_index.aktualisiere(db, "quizfragen", [db_frage.id])
     return db_frage
 
 
-def update_quiz_frage(db: Session, quizFrageId: int, frage_data: QuizFrageUpdate):
-    frage = get_quiz_frage(db, quizFrageId)
-    if not frage:
-        return None
-    update_fields = frage_data.dict(exclude_unset=True)
-    for key, value in update_fields.items():
-        setattr(frage, key, value)
-    db.commit()
-    db.refresh(frage)
-    return frage
+def update_quiz_frage(db: Session, quizFrageId: int, frage_data: QuizFrageUpdate, version: Optional[int] = None):
+    tags = _tags_quiz_fragen(db, QuizFrage.id == quizFrageId)
+    if frage_data.quiz_session_id is not None:
+        tags.add(f"quiz_session:{frage_data.quiz_session_id}/fragen")
+    geaendert = _aktualisiere(db, QuizFrage, quizFrageId, frage_data.dict(exclude_unset=True), version, tags)
+    if geaendert:
+        vektor_index.aktualisiere(db, "quizfragen", [quizFrageId])
+    return geaendert
 
 
 def delete_quiz_frage(db: Session, quizFrageId: int):
-    frage = get_quiz_frage(db, quizFrageId)
-    if frage:
-        db.delete(frage)
-        db.commit()
-        return frage
-    return None
+    tags = _tags_quiz_fragen(db, QuizFrage.id == quizFrageId)
+    geloescht = _loesche(db, QuizFrage, quizFrageId, tags)
+    if geloescht:
+        vektor_index.entferne("quizfragen", [quizFrageId])
+    return geloescht
+
+
+# Batch-Operationen: alle Zeilen werden vorab geprüft und dann mit einer
+# Anweisung (executemany bzw. INSERT ... RETURNING) in einer Transaktion
+# geschrieben. Fehlen referenzierte oder zu ändernde Datensätze, wird nichts
+# geschrieben und (None, fehlende_ids) zurückgegeben, sonst (ids, []).
+def _fehlende_ids(db: Session, modell, ids):
+    ids = set(ids)
+    if not ids:
+        return []
+    vorhanden = set(db.scalars(select(modell.id).where(modell.id.in_(ids))))
+    return sorted(ids - vorhanden)
+
+
+def _batch_einfuegen(db: Session, modell, zeilen, tags):
+    # Mehrzeiliges INSERT ... VALUES (...), (...) RETURNING id. SQLite vergibt
+    # die rowids innerhalb der Schreibtransaktion aufsteigend in der Reihenfolge
+    # der VALUES, sortiert entsprechen die ids also der Reihenfolge von daten.
+    # (sort_by_parameter_order würde auf SQLite eine Anweisung pro Zeile senden.)
+    ids = sorted(db.scalars(insert(modell).returning(modell.id), zeilen))
+    db.commit()
+    antwort_cache.invalidiere(*tags)
+    return ids
+
+
+def _batch_loeschen(db: Session, modell, ids, tags):
+    # Ein DELETE ... RETURNING; fehlt eine der Ids, wird zurückgerollt
+    geloescht = set(db.scalars(delete(modell).where(modell.id.in_(ids)).returning(modell.id)))
+    fehlend = sorted(set(ids) - geloescht)
+    if fehlend:
+        db.rollback()
+        return None, fehlend
+    db.commit()
+    antwort_cache.invalidiere(*tags)
+    return list(ids), []
+
+
+def _batch_aktualisieren(db: Session, modell, daten, tags, zusatz=None):
+    # executemany verlangt gleiche Spalten in allen Zeilen, deshalb eine
+    # Anweisung je Spaltenkombination. Zeilen mit "version" werden nur
+    # geändert, wenn sie noch aktuell ist. Trifft eine Anweisung nicht alle
+    # Zeilen (veraltete Version oder inzwischen gelöscht), wird alles
+    # zurückgerollt. zusatz(felder) liefert weitere, abgeleitete Werte.
+    tabelle = modell.__table__
+    gruppen = {}
+    for eintrag in daten:
+        werte = eintrag.dict(exclude_unset=True)
+        gruppen.setdefault(tuple(sorted(werte)), []).append(werte)
+    for spalten, zeilen in gruppen.items():
+        felder = [spalte for spalte in spalten if spalte not in ("id", "version")]
+        anweisung = update(tabelle).where(tabelle.c.id == bindparam("b_id"))
+        if "version" in spalten:
+            anweisung = anweisung.where(tabelle.c.version == bindparam("b_version"))
+        werte = {spalte: bindparam(f"w_{spalte}") for spalte in felder}
+        if zusatz is not None:
+            werte.update(zusatz(felder))
+        anweisung = anweisung.values({**werte, "version": tabelle.c.version + 1})
+        parameter = []
+        for zeile in zeilen:
+            werte = {f"w_{spalte}": zeile[spalte] for spalte in felder}
+            werte["b_id"] = zeile["id"]
+            if "version" in spalten:
+                werte["b_version"] = zeile["version"]
+            parameter.append(werte)
+        if db.execute(anweisung, parameter).rowcount < len(zeilen):
+            db.rollback()
+            ids = [zeile["id"] for zeile in zeilen]
+            aktuell = dict(db.execute(select(tabelle.c.id, tabelle.c.version).where(tabelle.c.id.in_(ids))).all())
+            fehlend = sorted(set(ids) - set(aktuell))
+            if fehlend:
+                return None, fehlend
+            raise VersionKonflikt({
+                zeile["id"]: aktuell[zeile["id"]]
+                for zeile in zeilen
+                if "version" in zeile and aktuell[zeile["id"]] != zeile["version"]
+            })
+    db.commit()
+    antwort_cache.invalidiere(*tags)
+    return [eintrag.id for eintrag in daten], []
+
+
+def create_dateien_batch(db: Session, dateien: List[DateiCreate]):
+    return _batch_einfuegen(db, Datei, [eintrag.dict() for eintrag in dateien], {"datei"})
+
+
+def update_dateien_batch(db: Session, dateien: List[DateiBatchUpdate]):
+    fehlend = _fehlende_ids(db, Datei, [datei.id for datei in dateien])
+    if fehlend:
+        return None, fehlend
+    tags = _tags_dateien(db, [datei.id for datei in dateien])
+    return _batch_aktualisieren(db, Datei, dateien, tags)
+
+
+def delete_dateien_batch(db: Session, dateiIds: List[int]):
+    tags = _tags_dateien(db, dateiIds) | {"notiz_datei", "datei_quizsession"}
+    ids, fehlend = _batch_loeschen(db, Datei, dateiIds, tags)
+    if ids:
+        dateiSpeicher.raeume_auf(db)
+    return ids, fehlend
+
+
+def create_notizen_batch(db: Session, notizen: List[NotizCreate]):
+    return _batch_einfuegen(db, Notiz, [eintrag.dict() for eintrag in notizen], {"notiz"})
+
+
+def update_notizen_batch(db: Session, notizen: List[NotizBatchUpdate]):
+    fehlend = _fehlende_ids(db, Notiz, [notiz.id for notiz in notizen])
+    if fehlend:
+        return None, fehlend
+    tags = _tags_notizen(db, [notiz.id for notiz in notizen])
+    return _batch_aktualisieren(db, Notiz, notizen, tags)
+
+
+def delete_notizen_batch(db: Session, notizIds: List[int]):
+    tags = _tags_notizen(db, notizIds, mit_kindern=True) | {"notiz_datei"}
+    kiaIds = _kinder_ids(db, KiAntwort, KiAntwort.notiz_id, notizIds)
+    ids, fehlend = _batch_loeschen(db, Notiz, notizIds, tags)
+    if ids:
+        vektor_index.entferne("kiantworten", kiaIds)
+    return ids, fehlend
+
+
+def _letzte_positionen(db: Session, notizIds):
+    return dict(db.execute(
+        select(KiAntwort.notiz_id, func.max(KiAntwort.position)).where(KiAntwort.notiz_id.in_(notizIds)).group_by(KiAntwort.notiz_id)
+    ).all())
+
+
+def create_kiantworten_batch(db: Session, kiantworten: List[KiAntwortCreate]):
+    fehlend = _fehlende_ids(db, Notiz, [kia.notiz_id for kia in kiantworten])
+    if fehlend:
+        return None, fehlend
+    tags = {"kiantwort"} | {f"notiz:{kia.notiz_id}/kiantworten" for kia in kiantworten}
+    # Neue Antworten kommen in der Reihenfolge des Batches ans Ende ihrer Notiz
+    letzte = _letzte_positionen(db, {kia.notiz_id for kia in kiantworten})
+    zeilen = []
+    for kia in kiantworten:
+        letzte[kia.notiz_id] = (letzte.get(kia.notiz_id) or 0) + ABSTAND
+        zeilen.append({**kia.dict(), "position": letzte[kia.notiz_id]})
+    ids = _batch_einfuegen(db, KiAntwort, zeilen, tags)
+    vektor_index.aktualisiere(db, "kiantworten", ids)
+    return ids, []
+
+
+def update_kiantworten_batch(db: Session, kiantworten: List[KiAntwortBatchUpdate]):
+    fehlend = _fehlende_ids(db, KiAntwort, [kia.id for kia in kiantworten])
+    fehlend += _fehlende_ids(db, Notiz, [kia.notiz_id for kia in kiantworten if kia.notiz_id is not None])
+    if fehlend:
+        return None, fehlend
+    tags = _tags_kiantworten(db, KiAntwort.id.in_([kia.id for kia in kiantworten]))
+    tags |= {f"notiz:{kia.notiz_id}/kiantworten" for kia in kiantworten if kia.notiz_id is not None}
+    ids, fehlend = _batch_aktualisieren(db, KiAntwort, kiantworten, tags, _kiantwort_zusatz)
+    if fehlend:
+        return None, fehlend
+    vektor_index.aktualisiere(db, "kiantworten", ids)
+    return ids, []
+
+
+def _kiantwort_zusatz(felder):
+    return _position_bei_notizwechsel(bindparam("w_notiz_id")) if "notiz_id" in felder else {}
+
+
+def delete_kiantworten_batch(db: Session, kiantwortIds: List[int]):
+    tags = _tags_kiantworten(db, KiAntwort.id.in_(kiantwortIds))
+    ids, fehlend = _batch_loeschen(db, KiAntwort, kiantwortIds, tags)
+    if ids:
+        vektor_index.entferne("kiantworten", ids)
+    return ids, fehlend
+
+
+def create_quiz_fragen_batch(db: Session, fragen: List[QuizFrageCreate]):
+    fehlend = _fehlende_ids(db, QuizSession, [frage.quiz_session_id for frage in fragen])
+    if fehlend:
+        return None, fehlend
+    tags = {"quiz_frage"} | {f"quiz_session:{frage.quiz_session_id}/fragen" for frage in fragen}
+    ids = _batch_einfuegen(db, QuizFrage, [eintrag.dict() for eintrag in fragen], tags)
+    vektor_index.aktualisiere(db, "quizfragen", ids)
+    return ids, []
+
+
+def update_quiz_fragen_batch(db: Session, fragen: List[QuizFrageBatchUpdate]):
+    fehlend = _fehlende_ids(db, QuizFrage, [frage.id for frage in fragen])
+    fehlend += _fehlende_ids(db, QuizSession, [frage.quiz_session_id for frage in fragen if frage.quiz_session_id is not None])
+    if fehlend:
+        return None, fehlend
+    tags = _tags_quiz_fragen(db, QuizFrage.id.in_([frage.id for frage in fragen]))
+    tags |= {f"quiz_session:{frage.quiz_session_id}/fragen" for frage in fragen if frage.quiz_session_id is not None}
+    ids, fehlend = _batch_aktualisieren(db, QuizFrage, fragen, tags)
+    if fehlend:
+        return None, fehlend
+    vektor_index.aktualisiere(db, "quizfragen", ids)
+    return ids, []
+
+
+def delete_quiz_fragen_batch(db: Session, quizFrageIds: List[int]):
+    tags = _tags_quiz_fragen(db, QuizFrage.id.in_(quizFrageIds))
+    ids, fehlend = _batch_loeschen(db, QuizFrage, quizFrageIds, tags)
+    if ids:
+        vektor_index.entferne("quizfragen", ids)
+    return ids, fehlend
+
+
+# Löschen nach Filter: eine DELETE-Anweisung, abhängige Zeilen folgen per
+# ON DELETE CASCADE. Die betroffenen Zeilen werden weder geladen noch ihre
+# Ids gesammelt, deshalb wird der Antwort-Cache vollständig geleert.
+def _loesche_gefiltert(db: Session, modell, bedingungen):
+    anzahl = db.execute(
+        delete(modell).where(*bedingungen).execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+    if anzahl:
+        antwort_cache.leeren()
+    return anzahl
+
+
+def delete_dateien_gefiltert(
+    db: Session,
+    dateiart: Optional[str] = None,
+    dozent: Optional[str] = None,
+    semester: Optional[str] = None,
+    modul: Optional[str] = None,
+):
+    anzahl = _loesche_gefiltert(db, Datei, _datei_filter(dateiart, dozent, semester, modul))
+    if anzahl:
+        dateiSpeicher.raeume_auf(db)
+    return anzahl
+
+
+def delete_notizen_fuer_datei(db: Session, dateiId: int):
+    notizIds = select(notiz_datei.c.notiz_id).where(notiz_datei.c.datei_id == dateiId)
+    anzahl = _loesche_gefiltert(db, Notiz, [Notiz.id.in_(notizIds)])
+    if anzahl:
+        vektor_index.abgleichen(db)
+    return anzahl
+
+
+def delete_quiz_sessions_fuer_datei(db: Session, dateiId: int):
+    sessionIds = select(datei_quizsession.c.quiz_session_id).where(datei_quizsession.c.datei_id == dateiId)
+    anzahl = _loesche_gefiltert(db, QuizSession, [QuizSession.id.in_(sessionIds)])
+    if anzahl:
+        vektor_index.abgleichen(db)
+    return anzahl
 
 
 # Besondere Anfragen / Relationen
 
+# Verknüpfen und Trennen schreiben direkt in die Zuordnungstabelle, ohne
+# Notiz, Datei oder die bestehenden Verknüpfungen zu laden. Ob Notiz bzw.
+# Quiz-Session und Dateien existieren, prüfen die Fremdschlüssel; bestehende
+# Verknüpfungen überspringt INSERT OR IGNORE.
+_VERKNUEPFUNGEN = {
+    "notiz_datei": (notiz_datei.c.notiz_id, Notiz, "notiz"),
+    "datei_quizsession": (datei_quizsession.c.quiz_session_id, QuizSession, "quiz_session"),
+}
+
+
+# Liefert (Anzahl neuer Verknüpfungen, []) oder bei fehlenden Datensätzen
+# (None, fehlende Datei-Ids); eine leere Liste heißt, das Elternobjekt fehlt.
+def _verknuepfe(db: Session, tabelle, elternId: int, dateiIds):
+    elternSpalte, elternModell, elternTag = _VERKNUEPFUNGEN[tabelle.name]
+    if not dateiIds:
+        return (None if db.get(elternModell, elternId) is None else 0), []
+    werte = [{elternSpalte.name: elternId, "datei_id": dateiId} for dateiId in dict.fromkeys(dateiIds)]
+    try:
+        anzahl = db.execute(insert(tabelle).prefix_with("OR IGNORE").values(werte)).rowcount
+    except IntegrityError:
+        db.rollback()
+        if db.get(elternModell, elternId) is None:
+            return None, []
+        return None, _fehlende_ids(db, Datei, dateiIds)
+    db.commit()
+    if anzahl:
+        antwort_cache.invalidiere(*_tags_verknuepfung(tabelle, elternTag, elternId, dateiIds))
+    return anzahl, []
+
+
+# Liefert die Anzahl getrennter Verknüpfungen, None wenn das Elternobjekt fehlt
+def _trenne(db: Session, tabelle, elternId: int, dateiIds):
+    elternSpalte, elternModell, elternTag = _VERKNUEPFUNGEN[tabelle.name]
+    anzahl = db.execute(
+        delete(tabelle).where(elternSpalte == elternId, tabelle.c.datei_id.in_(dateiIds))
+    ).rowcount
+    db.commit()
+    if anzahl:
+        antwort_cache.invalidiere(*_tags_verknuepfung(tabelle, elternTag, elternId, dateiIds))
+        return anzahl
+    # Nur wenn nichts getrennt wurde, muss das Elternobjekt geprüft werden
+    return 0 if db.get(elternModell, elternId) is not None else None
+
+
 # Notiz <-> Datei (Many-to-Many)
+# Die Relationen werden direkt über die Kindtabellen bzw. Zuordnungstabellen
+# abgefragt, statt erst das Elternobjekt zu laden und dann die Relation
+# nachzuladen (eine statt zwei Abfragen).
 def get_dateien_fuer_notiz(db: Session, notizId: int):
-    notiz = get_notiz(db, notizId)
-    return notiz.dateien if notiz else []
+    return db.query(Datei).join(notiz_datei).filter(notiz_datei.c.notiz_id == notizId).all()
 
 
 def get_notizen_fuer_datei(db: Session, dateiId: int):
-    datei = get_datei(db, dateiId)
-    return datei.notizen if datei else []
+    return db.query(Notiz).join(notiz_datei).filter(notiz_datei.c.datei_id == dateiId).all()
 
 
 def link_datei_zu_notiz(db: Session, notizId: int, dateiId: int):
-    notiz = get_notiz(db, notizId)
-    datei = get_datei(db, dateiId)
-    if not notiz or not datei:
-        return None
-    if datei not in notiz.dateien:
-        notiz.dateien.append(datei)
-        db.commit()
-        db.refresh(notiz)
-    return notiz
+    anzahl, _ = _verknuepfe(db, notiz_datei, notizId, [dateiId])
+    return None if anzahl is None else True
 
 
 def unlink_datei_von_notiz(db: Session, notizId: int, dateiId: int):
-    notiz = get_notiz(db, notizId)
-    datei = get_datei(db, dateiId)
-    if not notiz or not datei:
+    anzahl = _trenne(db, notiz_datei, notizId, [dateiId])
+    if anzahl is None or (anzahl == 0 and db.get(Datei, dateiId) is None):
         return None
-    if datei in notiz.dateien:
-        notiz.dateien.remove(datei)
-        db.commit()
-        db.refresh(notiz)
-    return notiz
+    return True
+
+
+def link_dateien_zu_notiz(db: Session, notizId: int, dateiIds: List[int]):
+    return _verknuepfe(db, notiz_datei, notizId, dateiIds)
+
+
+def unlink_dateien_von_notiz(db: Session, notizId: int, dateiIds: List[int]):
+    return _trenne(db, notiz_datei, notizId, dateiIds)
 
 
 # Ki-Antworten zu einer Notiz
 def get_kiantworten_fuer_notiz(db: Session, notizId: int):
-    notiz = get_notiz(db, notizId)
-    return notiz.kiAntworten if notiz else []
+    # Sortiert über den Index (notiz_id, position)
+    return db.query(KiAntwort).filter(KiAntwort.notiz_id == notizId).order_by(KiAntwort.position, KiAntwort.id).all()
 
 
 # Quiz-Fragen zu einer Quiz-Session
 def get_quiz_fragen_fuer_session(db: Session, quizSessionId: int):
-    qs = get_quiz_session(db, quizSessionId)
-    return qs.fragen if qs else []
+    return db.query(QuizFrage).filter(QuizFrage.quiz_session_id == quizSessionId).all()
 
 # QuizSession <-> Datei (Many-to-Many)
 def get_dateien_fuer_quiz_session(db: Session, quizSessionId: int):
-    qs = get_quiz_session(db, quizSessionId)
-    return qs.dateien if qs else []
+    return db.query(Datei).join(datei_quizsession).filter(datei_quizsession.c.quiz_session_id == quizSessionId).all()
 
 def get_quiz_sessions_fuer_datei(db: Session, dateiId: int):
-    datei = get_datei(db, dateiId)
-    return datei.quiz_sessions if datei else []
+    return db.query(QuizSession).join(datei_quizsession).filter(datei_quizsession.c.datei_id == dateiId).all()
 
 def link_datei_zu_quiz_session(db: Session, quizSessionId: int, dateiId: int):
-    qs = get_quiz_session(db, quizSessionId)
-    datei = get_datei(db, dateiId)
-    if not qs or not datei:
-        return None
-    if datei not in qs.dateien:
-        qs.dateien.append(datei)
-        db.commit()
-        db.refresh(qs)
-    return qs
+    anzahl, _ = _verknuepfe(db, datei_quizsession, quizSessionId, [dateiId])
+    return None if anzahl is None else True
+
 
 def unlink_datei_von_quiz_session(db: Session, quizSessionId: int, dateiId: int):
-    qs = get_quiz_session(db, quizSessionId)
-    datei = get_datei(db, dateiId)
-    if not qs or not datei:
+    anzahl = _trenne(db, datei_quizsession, quizSessionId, [dateiId])
+    if anzahl is None or (anzahl == 0 and db.get(Datei, dateiId) is None):
+        return None
+    return True
+
+
+def link_dateien_zu_quiz_session(db: Session, quizSessionId: int, dateiIds: List[int]):
+    return _verknuepfe(db, datei_quizsession, quizSessionId, dateiIds)
+
+
+def unlink_dateien_von_quiz_session(db: Session, quizSessionId: int, dateiIds: List[int]):
+    return _trenne(db, datei_quizsession, quizSessionId, dateiIds)
+
+
+# Zusammengesetzte Abfragen: Elternobjekt samt Kindern in einer festen Anzahl
+# von Abfragen (selectinload lädt jede Relation für alle Eltern mit einem IN).
+def _notiz_mit_kindern(db: Session):
+    return db.query(Notiz).options(selectinload(Notiz.kiAntworten), selectinload(Notiz.dateien))
+
+
+def _quiz_session_mit_kindern(db: Session):
+    return db.query(QuizSession).options(selectinload(QuizSession.fragen), selectinload(QuizSession.dateien))
+
+
+def get_notiz_vollstaendig(db: Session, notizId: int):
+    return _notiz_mit_kindern(db).filter(Notiz.id == notizId).first()
+
+
+def get_notizen_vollstaendig(
+    db: Session,
+    limit: int = 50,
+    after: Optional[int] = None,
+    datei_id: Optional[int] = None,
+    labels: Optional[List[str]] = None,
+    label_modus: str = "und",
+):
+    query = _notiz_mit_kindern(db)
+    if datei_id is not None:
+        query = query.join(notiz_datei).filter(notiz_datei.c.datei_id == datei_id)
+    if labels:
+        query = query.filter(_label_filter(labels, label_modus))
+    return _seite(query, Notiz, limit, after)
+
+
+def get_quiz_session_vollstaendig(db: Session, quizSessionId: int):
+    return _quiz_session_mit_kindern(db).filter(QuizSession.id == quizSessionId).first()
+
+
+def get_quiz_sessions_vollstaendig(
+    db: Session,
+    limit: int = 50,
+    after: Optional[int] = None,
+    datei_id: Optional[int] = None,
+):
+    query = _quiz_session_mit_kindern(db)
+    if datei_id is not None:
+        query = query.join(datei_quizsession).filter(datei_quizsession.c.datei_id == datei_id)
+    return _seite(query, QuizSession, limit, after)
+
+
+# Volltextsuche (FTS5) über Dateien, Notizen, KI-Antworten und Quiz-Fragen,
+# sortiert nach BM25; Titel werden stärker gewichtet als Inhalt und Zusatz.
+def suche(
+    db: Session,
+    suchbegriff: str,
+    typen: Optional[List[str]] = None,
+    limit: int = 20,
+    offset: int = 0,
+):
+    abfrage = baue_fts_abfrage(suchbegriff)
+    if abfrage is None:
+        return {"treffer": [], "naechster_offset": None}
+    typ_filter = ""
+    if typen:
+        codes = ", ".join(str(TYPEN[typ]) for typ in typen)
+        typ_filter = f"AND volltext.rowid % 4 IN ({codes})"
+    zeilen = db.execute(
+        text(
+            "SELECT volltext.rowid AS rowid, bm25(volltext, 3.0, 1.0, 0.5) AS rang, "
+            "snippet(volltext, -1, '<mark>', '</mark>', '…', 12) AS ausschnitt "
+            f"FROM volltext WHERE volltext MATCH :abfrage {typ_filter} "
+            "ORDER BY rang LIMIT :limit OFFSET :offset"
+        ),
+        {"abfrage": abfrage, "limit": limit + 1, "offset": offset},
+    ).all()
+    typ_namen = {code: typ for typ, code in TYPEN.items()}
+    treffer = [
+        {"typ": typ_namen[zeile.rowid % 4], "id": zeile.rowid // 4, "ausschnitt": zeile.ausschnitt, "rang": zeile.rang}
+        for zeile in zeilen[:limit]
+    ]
+    naechster_offset = offset + limit if len(zeilen) > limit else None
+    return {"treffer": treffer, "naechster_offset": naechster_offset}
+
+
+# Ähnlichkeitssuche über den Vektorindex (siehe vektorIndex.py). None, wenn
+# der Ausgangsdatensatz nicht existiert; sonst die Treffer absteigend nach
+# Ähnlichkeit, ohne den Ausgangsdatensatz selbst.
+def _aehnliche(db: Session, name: str, eintragId: int, k: int, min_aehnlichkeit: float):
+    modell, spalte = INDIZES[name]
+    inhalt = db.execute(select(spalte).where(modell.id == eintragId)).first()
+    if inhalt is None:
+        return None
+    treffer = [(i, wert) for i, wert in vektor_index.aehnliche(name, k, text=inhalt[0], eintrag=eintragId) if wert >= min_aehnlichkeit]
+    if not treffer:
+        return []
+    zeilen = {zeile["id"]: zeile for zeile in db.execute(select(modell.__table__).where(modell.id.in_([i for i, _ in treffer]))).mappings()}
+    return [{**zeilen[i], "aehnlichkeit": wert} for i, wert in treffer if i in zeilen]
+
+
+def get_aehnliche_quiz_fragen(db: Session, quizFrageId: int, k: int = 10, min_aehnlichkeit: float = 0.0):
+    return _aehnliche(db, "quizfragen", quizFrageId, k, min_aehnlichkeit)
+
+
+def get_aehnliche_kiantworten(db: Session, kiantwortId: int, k: int = 10, min_aehnlichkeit: float = 0.0):
+    return _aehnliche(db, "kiantworten", kiantwortId, k, min_aehnlichkeit)
+
+
+def pruefe_quiz_fragen_duplikate(db: Session, fragen: List[QuizFrageCreate], schwelle: float):
+    return vektor_index.duplikate("quizfragen", [frage.frage for frage in fragen], schwelle)
+
+
+# Verteiltes Wiederholen (siehe wiederholung.py)
+def get_wiederholung(db: Session, quizFrageId: int):
+    stand = db.execute(select(quiz_wiederholung).where(quiz_wiederholung.c.quiz_frage_id == quizFrageId)).mappings().first()
+    return dict(stand) if stand else None
+
+
+# Der neue Stand wird aus dem gelesenen berechnet und nur geschrieben, wenn
+# dieser noch aktuell ist (bewertungen unverändert); sonst erneut versuchen,
+# höchstens MAX_VERSUCHE-mal. None, wenn die Frage nicht existiert.
+def bewerte_quiz_frage(db: Session, quizFrageId: int, bewertung: int):
+    w = quiz_wiederholung.c
+    for _ in range(wiederholung.MAX_VERSUCHE):
+        stand = get_wiederholung(db, quizFrageId)
+        if stand is None:
+            db.rollback()
+            return None
+        zeitpunkt = wiederholung.jetzt()
+        werte = wiederholung.sm2(stand, bewertung, zeitpunkt)
+        geaendert = db.execute(
+            update(quiz_wiederholung)
+            .where(w.quiz_frage_id == quizFrageId, w.bewertungen == stand["bewertungen"])
+            .values(**werte, bewertungen=w.bewertungen + 1, letzte_bewertung=bewertung, zuletzt=zeitpunkt)
+            .returning(*quiz_wiederholung.c)
+        ).mappings().first()
+        if geaendert is not None:
+            db.commit()
+            antwort_cache.invalidiere(f"quiz_frage:{quizFrageId}/wiederholung")
+            return dict(geaendert)
+        db.rollback()
+    raise wiederholung.BewertungKonflikt(quizFrageId)
+
+
+# Die nächsten fälligen Fragen einer Quiz-Session bzw. aller Sessions, die mit
+# einer der Dateien verknüpft sind. Je Session liest eine Bereichssuche über
+# ix_quiz_wiederholung_session_faellig höchstens limit Zeilen; die Teilergebnisse
+# werden (in Gruppen per UNION ALL) zusammengeführt. None, wenn die angegebene
+# Quiz-Session nicht existiert.
+SESSIONS_JE_ABFRAGE = 200
+
+
+def get_naechste_quiz_fragen(
+    db: Session,
+    quiz_session_id: Optional[int] = None,
+    datei_ids: Optional[List[int]] = None,
+    limit: int = 20,
+    bis: Optional[int] = None,
+):
+    if quiz_session_id is not None:
+        if db.get(QuizSession, quiz_session_id) is None:
+            return None
+        sessionIds = [quiz_session_id]
+    else:
+        sessionIds = list(db.scalars(
+            select(datei_quizsession.c.quiz_session_id).where(datei_quizsession.c.datei_id.in_(datei_ids or [])).distinct()
+        ))
+    bis = wiederholung.jetzt() if bis is None else bis
+    w = quiz_wiederholung.c
+    kandidaten = []
+    for anfang in range(0, len(sessionIds), SESSIONS_JE_ABFRAGE):
+        teile = [
+            select(w.quiz_frage_id, w.faellig)
+            .where(w.quiz_session_id == qs, w.faellig <= bis)
+            .order_by(w.faellig, w.quiz_frage_id)
+            .limit(limit)
+            .subquery()
+            .select()
+            for qs in sessionIds[anfang : anfang + SESSIONS_JE_ABFRAGE]
+        ]
+        kandidaten += db.execute(union_all(*teile) if len(teile) > 1 else teile[0]).all()
+    ids = [zeile[0] for zeile in heapq.nsmallest(limit, kandidaten, key=lambda zeile: (zeile[1], zeile[0]))]
+    if not ids:
+        return []
+    fragen = {frage.id: frage for frage in db.query(QuizFrage).filter(QuizFrage.id.in_(ids))}
+    staende = {stand["quiz_frage_id"]: dict(stand) for stand in db.execute(select(quiz_wiederholung).where(w.quiz_frage_id.in_(ids))).mappings()}
+    return [{"frage": fragen[i], "wiederholung": staende[i]} for i in ids if i in fragen and i in staende]
+
+
+# Antwortversuche (siehe versuchsPuffer.py): ein INSERT ... SELECT je Versuch
+# per executemany in einer Transaktion. Versuche zu Fragen, die es nicht (mehr)
+# gibt, werden übersprungen statt den ganzen Stapel scheitern zu lassen.
+# Liefert die Anzahl geschriebener Versuche.
+def speichere_quiz_versuche(db: Session, versuche):
+    geschrieben = db.execute(
+        text(
+            'INSERT INTO "quizVersuche"(quiz_frage_id, antwort, richtig, dauer_ms, zeitpunkt) '
+            "SELECT :quiz_frage_id, :antwort, :richtig, :dauer_ms, :zeitpunkt "
+            'WHERE EXISTS (SELECT 1 FROM "quizFragen" WHERE id = :quiz_frage_id)'
+        ),
+        versuche,
+    ).rowcount
+    db.commit()
+    return geschrieben
+
+
+def get_quiz_versuche(
+    db: Session,
+    limit: int = 50,
+    after: Optional[int] = None,
+    quiz_frage_id: Optional[int] = None,
+):
+    query = db.query(QuizVersuch)
+    if quiz_frage_id is not None:
+        query = query.filter(QuizVersuch.quiz_frage_id == quiz_frage_id)
+    return _seite(query, QuizVersuch, limit, after)
+
+
+# Lernstatistiken (siehe statistik.py): jede Abfrage liest eine Zeile bzw. je
+# Modul eine Zeile, unabhängig von der Anzahl der Fragen und Versuche.
+# Quote richtiger Versuche; None ohne Versuche.
+def _mit_genauigkeit(zeile):
+    werte = dict(zeile)
+    werte["genauigkeit"] = werte["richtig"] / werte["versuche"] if werte["versuche"] else None
+    return werte
+
+
+def get_statistik_gesamt(db: Session):
+    return dict(db.execute(select(statistik_gesamt.c.name, statistik_gesamt.c.anzahl)).all())
+
+
+def get_statistik_quiz_session(db: Session, quizSessionId: int):
+    zeile = db.execute(
+        select(statistik_quiz_sessions).where(statistik_quiz_sessions.c.quiz_session_id == quizSessionId)
+    ).mappings().first()
+    return _mit_genauigkeit(zeile) if zeile else None
+
+
+def get_statistik_notiz(db: Session, notizId: int):
+    zeile = db.execute(select(statistik_notizen).where(statistik_notizen.c.notiz_id == notizId)).mappings().first()
+    return dict(zeile) if zeile else None
+
+
+def get_statistik_module(db: Session):
+    zeilen = db.execute(select(statistik_module).order_by(statistik_module.c.modul)).mappings().all()
+    return [_mit_genauigkeit(zeile) for zeile in zeilen]
+
+
+def get_statistik_modul(db: Session, modul: str):
+    zeile = db.execute(select(statistik_module).where(statistik_module.c.modul == modul)).mappings().first()
+    return _mit_genauigkeit(zeile) if zeile else None
+
+
+# Berechnet alle Statistiken in einer Schreibtransaktion neu aus den Grunddaten
+def baue_statistik_neu(db: Session):
+    statistik.baue_neu(db.connection())
+    db.commit()
+    return get_statistik_gesamt(db)
+
+
+# KI-Aufträge (siehe kiGenerierung.py). Ist die Warteschlange voll, wird kein
+# Auftrag angelegt und None geliefert. Der Vergleich mit einem Literal statt
+# eines Parameters erlaubt SQLite, den Teilindex ix_kiAuftraege_wartend zu nutzen.
+def create_ki_auftrag(db: Session, auftrag_data: KiAuftragCreate, max_wartend: int):
+    wartend = db.scalar(select(func.count()).where(KiAuftrag.status == literal_column("'wartend'")))
+    if wartend >= max_wartend:
         return None
-    if datei in qs.dateien:
-        qs.dateien.remove(datei)
-        db.commit()
-        db.refresh(qs)
-    return qs
+    db_auftrag = KiAuftrag(**auftrag_data.dict())
+    db.add(db_auftrag)
+    db.commit()
+    db.refresh(db_auftrag)
+    return db_auftrag
+
+
+def get_ki_auftrag(db: Session, auftragId: int):
+    return db.query(KiAuftrag).filter(KiAuftrag.id == auftragId).first()
+
+
+# Schreibt die Ergebnisse mehrerer Aufträge in einer Transaktion: alle neuen
+# KI-Antworten und Quiz-Fragen mit je einem INSERT, dazu die Zustände der
+# Aufträge und neu erzeugte Ergebnisse für ki_ergebnisse. Aufträge, deren
+# Notiz oder Quiz-Session inzwischen gelöscht wurde, sind per CASCADE
+# verschwunden; für sie wird nichts geschrieben.
+def speichere_ki_ergebnisse(db: Session, ergebnisse):
+    notizIds = {e["notiz_id"] for e in ergebnisse if e["notiz_id"] is not None}
+    notizIds -= set(_fehlende_ids(db, Notiz, notizIds))
+    qsIds = {e["quiz_session_id"] for e in ergebnisse if e["quiz_session_id"] is not None}
+    qsIds -= set(_fehlende_ids(db, QuizSession, qsIds))
+    erledigt = [e for e in ergebnisse if e["fehler"] is None and (e["notiz_id"] in notizIds or e["quiz_session_id"] in qsIds)]
+    letzte = _letzte_positionen(db, notizIds)
+    kiantworten, fragen = [], []
+    for e in erledigt:
+        for zeile in e["zeilen"]:
+            if e["notiz_id"] is not None:
+                letzte[e["notiz_id"]] = (letzte.get(e["notiz_id"]) or 0) + ABSTAND
+                kiantworten.append({**zeile, "notiz_id": e["notiz_id"], "position": letzte[e["notiz_id"]]})
+            else:
+                fragen.append({**zeile, "quiz_session_id": e["quiz_session_id"]})
+    # Die ids entsprechen sortiert der Reihenfolge der Zeilen (siehe _batch_einfuegen)
+    neue_kia_ids = sorted(db.scalars(insert(KiAntwort).returning(KiAntwort.id), kiantworten)) if kiantworten else []
+    neue_frage_ids = sorted(db.scalars(insert(QuizFrage).returning(QuizFrage.id), fragen)) if fragen else []
+    kia_ids, frage_ids = iter(neue_kia_ids), iter(neue_frage_ids)
+
+    zustaende = [
+        {"b_id": e["id"], "w_status": "fehler", "w_fehler": e["fehler"], "w_schluessel": e["schluessel"], "w_aus_cache": None, "w_ids": None}
+        for e in ergebnisse if e["fehler"] is not None
+    ]
+    for e in erledigt:
+        ids = kia_ids if e["notiz_id"] is not None else frage_ids
+        zustaende.append({
+            "b_id": e["id"], "w_status": "fertig", "w_fehler": None, "w_schluessel": e["schluessel"],
+            "w_aus_cache": not e["neu"], "w_ids": [next(ids) for _ in e["zeilen"]],
+        })
+    tabelle = KiAuftrag.__table__
+    if zustaende:
+        db.execute(
+            update(tabelle).where(tabelle.c.id == bindparam("b_id")).values(
+                status=bindparam("w_status"),
+                fehler=bindparam("w_fehler"),
+                schluessel=bindparam("w_schluessel"),
+                aus_cache=bindparam("w_aus_cache"),
+                ergebnis_ids=bindparam("w_ids"),
+            ),
+            zustaende,
+        )
+    neu = [{"schluessel": e["schluessel"], "backend": e["backend"], "ergebnis": e["zeilen"]} for e in erledigt if e["neu"]]
+    if neu:
+        db.execute(insert(ki_ergebnisse).prefix_with("OR IGNORE"), neu)
+    db.commit()
+
+    tags = set()
+    if kiantworten:
+        tags |= {"kiantwort"} | {f"notiz:{kia['notiz_id']}/kiantworten" for kia in kiantworten}
+    if fragen:
+        tags |= {"quiz_frage"} | {f"quiz_session:{frage['quiz_session_id']}/fragen" for frage in fragen}
+    antwort_cache.invalidiere(*tags)
+    vektor_index.aktualisiere(db, "kiantworten", neue_kia_ids)
+    vektor_index.aktualisiere(db, "quizfragen", neue_frage_ids)
+    return len(erledigt)
@@ -0,0 +1,132 @@
+import functools
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from . import crud
+
+
+# Asynchrone Varianten der CRUD-Funktionen. Mit einer AsyncSession läuft die
+# Funktion über run_sync auf der aiosqlite-Verbindung, ohne einen Worker aus dem
+# Threadpool zu belegen; mit einer normalen Session (LERNASSISTENT_ASYNC_DB=0)
+# wird sie wie bisher im Threadpool ausgeführt.
+def _asynchron(funktion):
+    @functools.wraps(funktion)
+    async def wrapper(db, *args, **kwargs):
+        if isinstance(db, AsyncSession):
+            return await db.run_sync(funktion, *args, **kwargs)
+        return await run_in_threadpool(funktion, db, *args, **kwargs)
+
+    return wrapper
+
+
+# CRUD für Dateien
+get_dateien = _asynchron(crud.get_dateien)
+get_dateien_facetten = _asynchron(crud.get_dateien_facetten)
+get_datei = _asynchron(crud.get_datei)
+create_datei = _asynchron(crud.create_datei)
+update_datei = _asynchron(crud.update_datei)
+delete_datei = _asynchron(crud.delete_datei)
+create_datei_mit_inhalt = _asynchron(crud.create_datei_mit_inhalt)
+set_datei_inhalt = _asynchron(crud.set_datei_inhalt)
+get_datei_extraktion = _asynchron(crud.get_datei_extraktion)
+get_datei_abschnitte = _asynchron(crud.get_datei_abschnitte)
+
+# CRUD für Notizen
+get_notizen = _asynchron(crud.get_notizen)
+get_notiz = _asynchron(crud.get_notiz)
+create_notiz = _asynchron(crud.create_notiz)
+update_notiz = _asynchron(crud.update_notiz)
+delete_notiz = _asynchron(crud.delete_notiz)
+get_label_facetten = _asynchron(crud.get_label_facetten)
+
+# CRUD für Ki-Antworten
+get_kiantworten = _asynchron(crud.get_kiantworten)
+get_kiantwort = _asynchron(crud.get_kiantwort)
+create_kiantwort = _asynchron(crud.create_kiantwort)
+update_kiantwort = _asynchron(crud.update_kiantwort)
+delete_kiantwort = _asynchron(crud.delete_kiantwort)
+verschiebe_kiantwort = _asynchron(crud.verschiebe_kiantwort)
+
+# CRUD für Quiz-Sessions
+get_quiz_sessions = _asynchron(crud.get_quiz_sessions)
+get_quiz_session = _asynchron(crud.get_quiz_session)
+create_quiz_session = _asynchron(crud.create_quiz_session)
+update_quiz_session = _asynchron(crud.update_quiz_session)
+delete_quiz_session = _asynchron(crud.delete_quiz_session)
+
+# CRUD für Quiz-Fragen
+get_quiz_fragen = _asynchron(crud.get_quiz_fragen)
+get_quiz_frage = _asynchron(crud.get_quiz_frage)
+create_quiz_frage = _asynchron(crud.create_quiz_frage)
+update_quiz_frage = _asynchron(crud.update_quiz_frage)
+delete_quiz_frage = _asynchron(crud.delete_quiz_frage)
+
+# Batch-Operationen
+create_dateien_batch = _asynchron(crud.create_dateien_batch)
+update_dateien_batch = _asynchron(crud.update_dateien_batch)
+delete_dateien_batch = _asynchron(crud.delete_dateien_batch)
+create_notizen_batch = _asynchron(crud.create_notizen_batch)
+update_notizen_batch = _asynchron(crud.update_notizen_batch)
+delete_notizen_batch = _asynchron(crud.delete_notizen_batch)
+create_kiantworten_batch = _asynchron(crud.create_kiantworten_batch)
+update_kiantworten_batch = _asynchron(crud.update_kiantworten_batch)
+delete_kiantworten_batch = _asynchron(crud.delete_kiantworten_batch)
+create_quiz_fragen_batch = _asynchron(crud.create_quiz_fragen_batch)
+update_quiz_fragen_batch = _asynchron(crud.update_quiz_fragen_batch)
+delete_quiz_fragen_batch = _asynchron(crud.delete_quiz_fragen_batch)
+
+# Löschen nach Filter
+delete_dateien_gefiltert = _asynchron(crud.delete_dateien_gefiltert)
+delete_notizen_fuer_datei = _asynchron(crud.delete_notizen_fuer_datei)
+delete_quiz_sessions_fuer_datei = _asynchron(crud.delete_quiz_sessions_fuer_datei)
+
+# Besondere Anfragen / Relationen
+get_dateien_fuer_notiz = _asynchron(crud.get_dateien_fuer_notiz)
+get_notizen_fuer_datei = _asynchron(crud.get_notizen_fuer_datei)
+link_datei_zu_notiz = _asynchron(crud.link_datei_zu_notiz)
+unlink_datei_von_notiz = _asynchron(crud.unlink_datei_von_notiz)
+link_dateien_zu_notiz = _asynchron(crud.link_dateien_zu_notiz)
+unlink_dateien_von_notiz = _asynchron(crud.unlink_dateien_von_notiz)
+get_kiantworten_fuer_notiz = _asynchron(crud.get_kiantworten_fuer_notiz)
+get_quiz_fragen_fuer_session = _asynchron(crud.get_quiz_fragen_fuer_session)
+get_dateien_fuer_quiz_session = _asynchron(crud.get_dateien_fuer_quiz_session)
+get_quiz_sessions_fuer_datei = _asynchron(crud.get_quiz_sessions_fuer_datei)
+link_datei_zu_quiz_session = _asynchron(crud.link_datei_zu_quiz_session)
+unlink_datei_von_quiz_session = _asynchron(crud.unlink_datei_von_quiz_session)
+link_dateien_zu_quiz_session = _asynchron(crud.link_dateien_zu_quiz_session)
+unlink_dateien_von_quiz_session = _asynchron(crud.unlink_dateien_von_quiz_session)
+
+# Zusammengesetzte Abfragen
+get_notiz_vollstaendig = _asynchron(crud.get_notiz_vollstaendig)
+get_notizen_vollstaendig = _asynchron(crud.get_notizen_vollstaendig)
+get_quiz_session_vollstaendig = _asynchron(crud.get_quiz_session_vollstaendig)
+get_quiz_sessions_vollstaendig = _asynchron(crud.get_quiz_sessions_vollstaendig)
+
+# Volltextsuche
+suche = _asynchron(crud.suche)
+
+# Ähnlichkeitssuche
+get_aehnliche_quiz_fragen = _asynchron(crud.get_aehnliche_quiz_fragen)
+get_aehnliche_kiantworten = _asynchron(crud.get_aehnliche_kiantworten)
+pruefe_quiz_fragen_duplikate = _asynchron(crud.pruefe_quiz_fragen_duplikate)
+
+# Verteiltes Wiederholen
+get_wiederholung = _asynchron(crud.get_wiederholung)
+bewerte_quiz_frage = _asynchron(crud.bewerte_quiz_frage)
+get_naechste_quiz_fragen = _asynchron(crud.get_naechste_quiz_fragen)
+
+# Antwortversuche
+get_quiz_versuche = _asynchron(crud.get_quiz_versuche)
+
+# Lernstatistiken
+get_statistik_gesamt = _asynchron(crud.get_statistik_gesamt)
+get_statistik_quiz_session = _asynchron(crud.get_statistik_quiz_session)
+get_statistik_notiz = _asynchron(crud.get_statistik_notiz)
+get_statistik_module = _asynchron(crud.get_statistik_module)
+get_statistik_modul = _asynchron(crud.get_statistik_modul)
+baue_statistik_neu = _asynchron(crud.baue_statistik_neu)
+
+# KI-Aufträge
+create_ki_auftrag = _asynchron(crud.create_ki_auftrag)
+get_ki_auftrag = _asynchron(crud.get_ki_auftrag)
@@ -0,0 +1,205 @@
+import hashlib
+import os
+import re
+import tempfile
+from pathlib import Path
+
+from sqlalchemy import text
+
+# Inhaltsadressierter Speicher für hochgeladene Dateien: jeder Inhalt liegt
+# genau einmal unter <Speicher>/<sha256[:2]>/<sha256>, egal wie viele Dateien
+# auf ihn verweisen. datei_inhalte (modelle.py) zählt die Verweise; Trigger auf
+# dateien.inhalt_sha256 halten den Zähler bei jedem INSERT, DELETE und UPDATE
+# aktuell. Inhalte ohne Verweis entfernt raeume_auf().
+SPEICHER_PFAD = Path(os.getenv("LERNASSISTENT_DATEI_SPEICHER", "./dateispeicher"))
+MAX_UPLOAD_BYTES = int(os.getenv("LERNASSISTENT_MAX_UPLOAD_BYTES", str(2**30)))
+
+# Formularfelder neben der Datei (titel, dozent, ...) werden im Speicher gesammelt
+MAX_FELD_BYTES = 64 * 1024
+
+# Hochladen und Aufräumen serialisiert die Schreibsperre von SQLite: ein Upload
+# legt den Inhalt erst ab, wenn sein INSERT bzw. UPDATE die Sperre hält, und
+# raeume_auf() löscht Dateien vor dem Commit. Sonst könnte raeume_auf() eine
+# Datei löschen, die ein gleichzeitiger Upload gerade wiederverwendet. Eine
+# Python-Sperre über Datenbankzugriffe hinweg ginge nicht: im asynchronen
+# Betrieb laufen sie per run_sync auf dem Event-Loop-Thread, ein zweiter
+# Upload würde dort auf die Sperre warten und die Schleife anhalten.
+
+
+_SHA256 = re.compile(r"[0-9a-f]{64}")
+
+
+def ist_sha256(wert):
+    return isinstance(wert, str) and _SHA256.fullmatch(wert) is not None
+
+
+# Der Hash wird Teil des Pfads; alles außer 64 Hex-Zeichen (etwa "../" aus
+# einem Import) könnte aus dem Speicher herausführen
+def blob_pfad(sha256):
+    if not ist_sha256(sha256):
+        raise ValueError(f"Ungültiger SHA-256: {sha256!r}")
+    return SPEICHER_PFAD / sha256[:2] / sha256
+
+
+class UploadFehler(ValueError):
+    def __init__(self, meldung, status_code=400):
+        super().__init__(meldung)
+        self.status_code = status_code
+
+
+# Nimmt einen Request-Body stückweise entgegen und schreibt den Inhalt in eine
+# temporäre Datei, während der SHA-256 mitgerechnet wird. Der Body ist entweder
+# multipart/form-data (der erste Teil mit Dateinamen ist der Inhalt, weitere
+# Teile sind Formularfelder) oder direkt der Inhalt.
+class Upload:
+    def __init__(self, content_type):
+        self.content_type = content_type or "application/octet-stream"
+        self.dateiname = None
+        self.mime_typ = None
+        self.felder = {}
+        self.groesse = 0
+        self._hash = hashlib.sha256()
+        self._datei = None
+        self._parser = None
+        self._teil = None
+
+    def beginne(self):
+        (SPEICHER_PFAD / "tmp").mkdir(parents=True, exist_ok=True)
+        self._datei = tempfile.NamedTemporaryFile(dir=SPEICHER_PFAD / "tmp", delete=False)
+        if self.content_type.startswith("multipart/form-data"):
+            self._parser = self._multipart_parser()
+        else:
+            self.mime_typ = self.content_type.split(";")[0].strip()
+            self._teil = {"datei": True}
+
+    def verarbeite(self, stueck: bytes):
+        if self._parser is not None:
+            self._parser.write(stueck)
+        else:
+            self._schreibe(stueck)
+
+    def abschliessen(self):
+        if self._parser is not None:
+            self._parser.finalize()
+            if self.dateiname is None:
+                raise UploadFehler("Kein Dateiinhalt im Formular")
+        self._datei.close()
+        return self._hash.hexdigest()
+
+    def abbrechen(self):
+        if self._datei is not None:
+            self._datei.close()
+            Path(self._datei.name).unlink(missing_ok=True)
+
+    # Legt den Inhalt unter seinem Hash ab, wenn er noch nicht vorhanden ist.
+    # Aufruf nach dem INSERT bzw. UPDATE, das auf ihn verweist, und vor dessen Commit.
+    def uebernehme(self, sha256):
+        ziel = blob_pfad(sha256)
+        if ziel.exists():
+            Path(self._datei.name).unlink()
+        else:
+            ziel.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(self._datei.name, ziel)
+
+    def _schreibe(self, daten):
+        self.groesse += len(daten)
+        if self.groesse > MAX_UPLOAD_BYTES:
+            raise UploadFehler(f"Datei größer als {MAX_UPLOAD_BYTES} Bytes", status_code=413)
+        self._hash.update(daten)
+        self._datei.write(daten)
+
+    def _multipart_parser(self):
+        # Erst bei Bedarf importiert, Uploads ohne Formular brauchen python-multipart nicht
+        from python_multipart.multipart import MultipartParser, parse_options_header
+
+        _, optionen = parse_options_header(self.content_type)
+        if b"boundary" not in optionen:
+            raise UploadFehler("multipart/form-data ohne boundary")
+        kopf = {}
+        feld = []
+
+        def kopf_name(daten, anfang, ende):
+            feld.append(daten[anfang:ende])
+
+        def kopf_wert(daten, anfang, ende):
+            kopf.setdefault(b"".join(feld).lower(), bytearray()).extend(daten[anfang:ende])
+
+        def kopf_ende():
+            feld.clear()
+
+        def kopf_fertig():
+            _, disposition = parse_options_header(bytes(kopf.get(b"content-disposition", b"")))
+            dateiname = disposition.get(b"filename")
+            if dateiname is not None and self.dateiname is None:
+                self.dateiname = dateiname.decode("utf-8", "replace")
+                self.mime_typ = bytes(kopf.get(b"content-type", b"application/octet-stream")).decode("latin-1")
+                self._teil = {"datei": True}
+            else:
+                self._teil = {"name": disposition.get(b"name", b"").decode("utf-8", "replace"), "wert": bytearray()}
+            kopf.clear()
+
+        def daten(daten, anfang, ende):
+            if self._teil.get("datei"):
+                self._schreibe(daten[anfang:ende])
+                return
+            self._teil["wert"] += daten[anfang:ende]
+            if len(self._teil["wert"]) > MAX_FELD_BYTES:
+                raise UploadFehler(f"Formularfeld {self._teil['name']!r} zu groß")
+
+        def teil_ende():
+            if not self._teil.get("datei") and self._teil["name"]:
+                self.felder[self._teil["name"]] = self._teil["wert"].decode("utf-8", "replace")
+            self._teil = None
+
+        return MultipartParser(
+            optionen[b"boundary"],
+            {
+                "on_header_field": kopf_name,
+                "on_header_value": kopf_wert,
+                "on_header_end": kopf_ende,
+                "on_headers_finished": kopf_fertig,
+                "on_part_data": daten,
+                "on_part_end": teil_ende,
+            },
+        )
+
+
+def _trigger():
+    dazu = (
+        "INSERT OR IGNORE INTO datei_inhalte(sha256, groesse, referenzen) "
+        "SELECT new.inhalt_sha256, new.inhalt_groesse, 0 WHERE new.inhalt_sha256 IS NOT NULL; "
+        "UPDATE datei_inhalte SET referenzen = referenzen + 1 WHERE sha256 = new.inhalt_sha256;"
+    )
+    weg = "UPDATE datei_inhalte SET referenzen = referenzen - 1 WHERE sha256 = old.inhalt_sha256;"
+    return [
+        f'CREATE TRIGGER IF NOT EXISTS "dateien_inhalte_ai" AFTER INSERT ON dateien BEGIN {dazu} END',
+        f'CREATE TRIGGER IF NOT EXISTS "dateien_inhalte_ad" AFTER DELETE ON dateien BEGIN {weg} END',
+        f'CREATE TRIGGER IF NOT EXISTS "dateien_inhalte_au" AFTER UPDATE OF inhalt_sha256 ON dateien '
+        f"WHEN old.inhalt_sha256 IS NOT new.inhalt_sha256 BEGIN {weg} {dazu} END",
+    ]
+
+
+def richte_speicher_ein(connection):
+    for ddl in _trigger():
+        connection.execute(text(ddl))
+    # Verweise aus den bestehenden Dateien (neu) zählen
+    connection.execute(text(
+        "INSERT OR IGNORE INTO datei_inhalte(sha256, groesse, referenzen) "
+        "SELECT inhalt_sha256, MAX(inhalt_groesse), 0 FROM dateien WHERE inhalt_sha256 IS NOT NULL GROUP BY inhalt_sha256"
+    ))
+    connection.execute(text(
+        "UPDATE datei_inhalte SET referenzen = (SELECT COUNT(*) FROM dateien WHERE inhalt_sha256 = datei_inhalte.sha256)"
+    ))
+
+
+# Entfernt Inhalte, auf die keine Datei mehr verweist, aus Tabelle und Speicher
+def raeume_auf(db):
+    sha256s = db.execute(text("DELETE FROM datei_inhalte WHERE referenzen <= 0 RETURNING sha256")).scalars().all()
+    # Noch in der Transaktion, also unter der Schreibsperre: kein Upload kann
+    # einen dieser Inhalte jetzt wiederverwenden. Scheitert der Commit, bleiben
+    # die Zeilen ohne Verweis stehen; ein späterer Upload legt den Inhalt neu ab.
+    for sha256 in sha256s:
+        if ist_sha256(sha256):
+            blob_pfad(sha256).unlink(missing_ok=True)
+    db.commit()
+    return len(sha256s)
@@ -1,18 +1,118 @@
-from sqlalchemy import create_engine
+import os
+from typing import Union
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+
+DATENBANK_PFAD = os.getenv("LERNASSISTENT_DB_PFAD", "./lernassistent.db")
+
+# Umschalter zwischen synchronem und asynchronem Datenbankzugriff,
+# z.B. LERNASSISTENT_ASYNC_DB=1 uvicorn main:app
+ASYNC_DB = os.getenv("LERNASSISTENT_ASYNC_DB", "0").lower() in ("1", "true", "ja")
+
+# Verbindungsprofil, das auf jede neue SQLite-Verbindung angewendet wird.
+# Jeder Wert lässt sich über LERNASSISTENT_SQLITE_<NAME> überschreiben,
+# z.B. LERNASSISTENT_SQLITE_MMAP_SIZE=0.
+STANDARD_PROFIL = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 268435456,  # 256 MiB
+    "cache_size": -65536,  # negativ = KiB, also 64 MiB
+    "busy_timeout": 5000,  # ms
+    "foreign_keys": "ON",
+}
+
+SQLITE_PROFIL = {
+    name: os.getenv(f"LERNASSISTENT_SQLITE_{name.upper()}", wert)
+    for name, wert in STANDARD_PROFIL.items()
+}
+
+
+def wende_profil_an(engine, profil=None, nur_lesen=False):
+    profil = SQLITE_PROFIL if profil is None else profil
 
-DATABASE_URL = "sqlite:///./lernassistent.db"
+    @event.listens_for(engine, "connect")
+    def _setze_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, wert in profil.items():
+            # Der Journal-Modus wird in der Datenbankdatei gespeichert und
+            # daher nur von schreibenden Verbindungen gesetzt.
+            if nur_lesen and name == "journal_mode":
+                continue
+            cursor.execute(f"PRAGMA {name}={wert}")
+        if nur_lesen:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+    return engine
+
+
+def erstelle_engine(pfad=DATENBANK_PFAD, profil=None, nur_lesen=False):
+    engine = create_engine(f"sqlite:///{pfad}", connect_args={"check_same_thread": False})
+    return wende_profil_an(engine, profil, nur_lesen)
+
+
+def erstelle_async_engine(pfad=DATENBANK_PFAD, profil=None, nur_lesen=False):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{pfad}")
+    wende_profil_an(engine.sync_engine, profil, nur_lesen)
+    return engine
+
+
+# Getrennte Engines für schreibende und lesende Zugriffe: Im WAL-Modus warten
+# Leser nicht auf die Schreibsperre, GET-Routen nutzen daher get_lese_db.
+engine = erstelle_engine()
+lese_engine = erstelle_engine(nur_lesen=True)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+LeseSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=lese_engine)
+
+# Die asynchronen Engines werden nur angelegt, wenn sie auch benutzt werden,
+# damit aiosqlite für den synchronen Betrieb nicht installiert sein muss.
+async_engine = erstelle_async_engine() if ASYNC_DB else None
+async_lese_engine = erstelle_async_engine(nur_lesen=True) if ASYNC_DB else None
+AsyncSessionLocal = (
+    async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+    if ASYNC_DB
+    else None
+)
+AsyncLeseSessionLocal = (
+    async_sessionmaker(bind=async_lese_engine, autoflush=False, expire_on_commit=False)
+    if ASYNC_DB
+    else None
+)
 
 Base = declarative_base()
 
 
-def get_db():
+def get_sync_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+def get_sync_lese_db():
+    db = LeseSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def get_async_lese_db():
+    async with AsyncLeseSessionLocal() as db:
+        yield db
+
+
+get_db = get_async_db if ASYNC_DB else get_sync_db
+get_lese_db = get_async_lese_db if ASYNC_DB else get_sync_lese_db
+
+# Typ der von get_db gelieferten Session, je nach Betriebsart
+DbSession = Union[Session, AsyncSession]
@@ -0,0 +1,205 @@
+import logging
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+from sqlalchemy import delete, insert, select, text, update
+from sqlalchemy.exc import IntegrityError
+
+from .antwortCache import antwort_cache
+from .dateiSpeicher import blob_pfad
+from .datenbank import SessionLocal
+from .modelle import Datei, inhalt_abschnitte, inhalt_extraktion
+
+# Textextraktion im Hintergrund: hochgeladene Inhalte (dateiSpeicher.py) werden
+# in einem Prozesspool gelesen, in Abschnitte zerlegt und in inhalt_abschnitte
+# gespeichert. Wie der Inhalt selbst ist das Ergebnis über den SHA-256
+# adressiert, ein bereits verarbeiteter Inhalt wird nie erneut gelesen.
+# LERNASSISTENT_EXTRAKTION_PROZESSE=0 schaltet die Extraktion ab.
+PROZESSE = int(os.getenv("LERNASSISTENT_EXTRAKTION_PROZESSE", "1"))
+ABSCHNITT_ZEICHEN = int(os.getenv("LERNASSISTENT_ABSCHNITT_ZEICHEN", "2000"))
+
+WARTEND = "wartend"
+FERTIG = "fertig"
+FEHLER = "fehler"
+NICHT_UNTERSTUETZT = "nicht_unterstuetzt"
+
+logger = logging.getLogger(__name__)
+
+
+def _art(mime_typ, dateiname):
+    endung = os.path.splitext(dateiname or "")[1].lower()
+    if mime_typ == "application/pdf" or endung == ".pdf":
+        return "pdf"
+    if (mime_typ or "").startswith("text/") or endung in (".txt", ".md", ".markdown"):
+        return "text"
+    return None
+
+
+def _lies_text(pfad):
+    with open(pfad, "rb") as datei:
+        inhalt = datei.read()
+    try:
+        return inhalt.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return inhalt.decode("cp1252", "replace")
+
+
+def _lies_pdf(pfad):
+    # Reiner Python-Parser; erst im Arbeitsprozess importiert, damit pypdf
+    # nur installiert sein muss, wenn PDFs verarbeitet werden
+    from pypdf import PdfReader
+
+    return "\n\n".join(seite.extract_text() or "" for seite in PdfReader(pfad).pages)
+
+
+def _teile(absatz, laenge):
+    while len(absatz) > laenge:
+        schnitt = absatz.rfind(" ", 0, laenge)
+        if schnitt <= 0:
+            schnitt = laenge
+        yield absatz[:schnitt].rstrip()
+        absatz = absatz[schnitt:].lstrip()
+    if absatz:
+        yield absatz
+
+
+# Fasst Absätze zu Abschnitten von höchstens laenge Zeichen zusammen; längere
+# Absätze werden an Leerzeichen geteilt.
+def zerlege(inhalt, laenge=ABSCHNITT_ZEICHEN):
+    abschnitte = []
+    aktuell = ""
+    for absatz in re.split(r"\n\s*\n", inhalt):
+        for teil in _teile(absatz.strip(), laenge):
+            if aktuell and len(aktuell) + 2 + len(teil) > laenge:
+                abschnitte.append(aktuell)
+                aktuell = teil
+            else:
+                aktuell = f"{aktuell}\n\n{teil}" if aktuell else teil
+    if aktuell:
+        abschnitte.append(aktuell)
+    return abschnitte
+
+
+# Läuft im Arbeitsprozess: liefert die Abschnitte oder None für nicht
+# unterstützte Formate
+def verarbeite(pfad, mime_typ, dateiname, laenge=ABSCHNITT_ZEICHEN):
+    art = _art(mime_typ, dateiname)
+    if art is None:
+        return None
+    return zerlege(_lies_pdf(pfad) if art == "pdf" else _lies_text(pfad), laenge)
+
+
+class Extraktion:
+    def __init__(self, sessions=SessionLocal, prozesse=PROZESSE):
+        self.sessions = sessions
+        self.prozesse = prozesse
+        self._pool = None
+        self._sperre = threading.Lock()
+
+    def starte(self):
+        if self.prozesse <= 0:
+            return
+        self._pool = self._neuer_pool()
+        self.nachholen()
+
+    def _neuer_pool(self):
+        # spawn statt fork: der API-Prozess hat Threads und offene Verbindungen
+        return ProcessPoolExecutor(self.prozesse, mp_context=multiprocessing.get_context("spawn"))
+
+    def stoppe(self):
+        with self._sperre:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    # Aufruf nach dem Commit eines neuen Inhalts, mit der Session des Aufrufers
+    def plane(self, db, sha256, mime_typ, dateiname):
+        neu = db.execute(
+            insert(inhalt_extraktion).prefix_with("OR IGNORE").values(sha256=sha256, status=WARTEND)
+        ).rowcount
+        db.commit()
+        if neu:
+            self._reiche_ein(sha256, mime_typ, dateiname)
+
+    # Beim Start: Inhalte, deren Extraktion unterbrochen wurde oder die vor
+    # Einführung der Extraktion hochgeladen wurden
+    def nachholen(self):
+        with self.sessions() as db:
+            offen = db.execute(text(
+                "SELECT d.inhalt_sha256, MIN(d.inhalt_typ), MIN(d.pfad) FROM dateien d "
+                "LEFT JOIN inhalt_extraktion e ON e.sha256 = d.inhalt_sha256 "
+                f"WHERE d.inhalt_sha256 IS NOT NULL AND (e.sha256 IS NULL OR e.status = '{WARTEND}') "
+                "GROUP BY d.inhalt_sha256"
+            )).all()
+            if offen:
+                db.execute(
+                    insert(inhalt_extraktion).prefix_with("OR IGNORE"),
+                    [{"sha256": sha256, "status": WARTEND} for sha256, _, _ in offen],
+                )
+                db.commit()
+        for sha256, mime_typ, dateiname in offen:
+            self._reiche_ein(sha256, mime_typ, dateiname)
+        return len(offen)
+
+    def _reiche_ein(self, sha256, mime_typ, dateiname):
+        try:
+            pfad = str(blob_pfad(sha256))
+        except ValueError as fehler:
+            # Ungültiger Hash aus einer älteren Datenbank: als Fehler vermerken
+            auftrag = Future()
+            auftrag.set_exception(fehler)
+            self._fertig(sha256, auftrag)
+            return
+        with self._sperre:
+            if self._pool is None:
+                return
+            try:
+                auftrag = self._pool.submit(verarbeite, pfad, mime_typ, dateiname)
+            except BrokenProcessPool:
+                # Ein abgestürzter Arbeitsprozess macht den ganzen Pool unbrauchbar
+                self._pool.shutdown(wait=False)
+                self._pool = self._neuer_pool()
+                auftrag = self._pool.submit(verarbeite, pfad, mime_typ, dateiname)
+        auftrag.add_done_callback(partial(self._fertig, sha256))
+
+    # Läuft im Verwaltungsthread des Pools und schreibt das Ergebnis
+    def _fertig(self, sha256, auftrag):
+        if auftrag.cancelled():
+            return
+        werte = {}
+        abschnitte = []
+        try:
+            abschnitte = auftrag.result()
+        except Exception as fehler:
+            logger.warning("Extraktion von %s fehlgeschlagen: %s", sha256, fehler)
+            werte = {"status": FEHLER, "fehler": f"{type(fehler).__name__}: {fehler}"[:500]}
+        else:
+            if abschnitte is None:
+                werte = {"status": NICHT_UNTERSTUETZT}
+                abschnitte = []
+            else:
+                werte = {"status": FERTIG, "abschnitte": len(abschnitte), "zeichen": sum(map(len, abschnitte))}
+        with self.sessions() as db:
+            try:
+                db.execute(delete(inhalt_abschnitte).where(inhalt_abschnitte.c.sha256 == sha256))
+                if abschnitte:
+                    db.execute(
+                        insert(inhalt_abschnitte),
+                        [{"sha256": sha256, "nr": nr, "text": abschnitt} for nr, abschnitt in enumerate(abschnitte)],
+                    )
+                db.execute(update(inhalt_extraktion).where(inhalt_extraktion.c.sha256 == sha256).values(**werte))
+                db.commit()
+            except IntegrityError:
+                # Der Inhalt wurde inzwischen gelöscht
+                db.rollback()
+                return
+            ids = db.scalars(select(Datei.id).where(Datei.inhalt_sha256 == sha256)).all()
+        antwort_cache.invalidiere(*{f"datei:{i}/{teil}" for i in ids for teil in ("extraktion", "abschnitte")})
+
+
+extraktion = Extraktion()
@@ -0,0 +1,51 @@
+from sqlalchemy import text
+
+# Vorberechnete Anzahlen für den Dateibrowser: datei_facetten (modelle.py)
+# enthält je vorkommender Kombination von dateiart, dozent, semester und modul
+# die Anzahl der Dateien. Trigger halten sie bei jedem INSERT, DELETE und
+# UPDATE dieser Spalten aktuell; Facetten werden dann über diese wenigen
+# Kombinationen statt über alle Dateien gezählt. NULL ist ein eigener Wert,
+# verglichen wird deshalb mit IS.
+SPALTEN = ("dateiart", "dozent", "semester", "modul")
+
+
+def _gleich(zeile):
+    return " AND ".join(f'datei_facetten."{spalte}" IS {zeile}."{spalte}"' for spalte in SPALTEN)
+
+
+def _erhoehe(zeile):
+    spalten = ", ".join(f'"{spalte}"' for spalte in SPALTEN)
+    werte = ", ".join(f'{zeile}."{spalte}"' for spalte in SPALTEN)
+    return (
+        f"INSERT INTO datei_facetten({spalten}, anzahl) SELECT {werte}, 0 "
+        f"WHERE NOT EXISTS (SELECT 1 FROM datei_facetten WHERE {_gleich(zeile)}); "
+        f"UPDATE datei_facetten SET anzahl = anzahl + 1 WHERE {_gleich(zeile)};"
+    )
+
+
+def _verringere(zeile):
+    return (
+        f"UPDATE datei_facetten SET anzahl = anzahl - 1 WHERE {_gleich(zeile)}; "
+        f"DELETE FROM datei_facetten WHERE {_gleich(zeile)} AND anzahl <= 0;"
+    )
+
+
+def _trigger():
+    geaendert = ", ".join(f'"{spalte}"' for spalte in SPALTEN)
+    return [
+        f'CREATE TRIGGER IF NOT EXISTS "dateien_facetten_ai" AFTER INSERT ON dateien BEGIN {_erhoehe("new")} END',
+        f'CREATE TRIGGER IF NOT EXISTS "dateien_facetten_ad" AFTER DELETE ON dateien BEGIN {_verringere("old")} END',
+        f'CREATE TRIGGER IF NOT EXISTS "dateien_facetten_au" AFTER UPDATE OF {geaendert} ON dateien '
+        f"BEGIN {_verringere('old')} {_erhoehe('new')} END",
+    ]
+
+
+def richte_facetten_ein(connection):
+    for ddl in _trigger():
+        connection.execute(text(ddl))
+    # Anzahlen aus den bestehenden Dateien (neu) berechnen
+    spalten = ", ".join(f'"{spalte}"' for spalte in SPALTEN)
+    connection.execute(text("DELETE FROM datei_facetten"))
+    connection.execute(text(
+        f"INSERT INTO datei_facetten({spalten}, anzahl) SELECT {spalten}, COUNT(*) FROM dateien GROUP BY {spalten}"
+    ))
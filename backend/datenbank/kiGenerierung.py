@@ -0,0 +1,292 @@
+import hashlib
+import importlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from sqlalchemy import select, text, update
+
+from . import crud
+from .datenbank import SessionLocal
+from .modelle import Datei, KiAuftrag, Notiz, QuizSession, datei_quizsession, inhalt_abschnitte, ki_ergebnisse, notiz_datei
+from .pydanticModelle import KiAntwortCreate, QuizFrageCreate
+
+# Serverseitige Erzeugung von KI-Antworten und Quiz-Fragen. Aufträge liegen in
+# kiAuftraege und werden von einer festen Zahl Worker-Threads abgeholt; das
+# Modell steckt hinter einem austauschbaren Backend. Die Ergebnisse schreibt
+# ein einzelner Thread stapelweise (crud.speichere_ki_ergebnisse). Eine Anfrage
+# mit gleichem Kontext (gleicher Schlüssel) wird aus ki_ergebnisse beantwortet.
+#
+# Ein Backend hat ein Attribut name und eine Methode generiere(anfrage), die
+# eine Liste von Dicts liefert: inhalt/kommentar/typ für KI-Antworten,
+# frage/Antwort/Erklaerung für Quiz-Fragen. anfrage enthält ziel
+# ("kiantworten" oder "quizfragen"), typ, anzahl, titel, prompt und kontext
+# (Texte der verknüpften Dateien). LERNASSISTENT_KI_BACKEND ist "stub" oder
+# "modul:Klasse"; LERNASSISTENT_KI_WORKER=0 schaltet die Verarbeitung ab.
+BACKEND = os.getenv("LERNASSISTENT_KI_BACKEND", "stub")
+WORKER = int(os.getenv("LERNASSISTENT_KI_WORKER", "2"))
+MAX_WARTEND = int(os.getenv("LERNASSISTENT_KI_MAX_WARTEND", "1000"))
+SCHREIB_BATCH = int(os.getenv("LERNASSISTENT_KI_SCHREIB_BATCH", "50"))
+KONTEXT_ZEICHEN = int(os.getenv("LERNASSISTENT_KI_KONTEXT_ZEICHEN", "12000"))
+
+# Ohne Weckruf sehen die Worker in diesem Abstand nach neuen Aufträgen
+PAUSE = 5.0
+
+logger = logging.getLogger(__name__)
+
+
+# Deterministisches lokales Backend für Entwicklung und Tests: gleiche Anfrage,
+# gleiches Ergebnis, ohne Netzwerk. LERNASSISTENT_KI_STUB_DAUER simuliert die
+# Antwortzeit eines Modells in Sekunden.
+class StubBackend:
+    name = "stub"
+
+    def __init__(self, dauer=None):
+        self.dauer = float(os.getenv("LERNASSISTENT_KI_STUB_DAUER", "0")) if dauer is None else dauer
+        self.aufrufe = 0
+
+    def generiere(self, anfrage):
+        self.aufrufe += 1
+        if self.dauer:
+            time.sleep(self.dauer)
+        kennung = hashlib.sha256(json.dumps(anfrage, sort_keys=True).encode()).hexdigest()[:12]
+        auszug = " ".join(" ".join(anfrage["kontext"]).split())[:200] or anfrage["titel"]
+        anzahl = anfrage["anzahl"]
+        if anfrage["ziel"] == "kiantworten":
+            return [
+                {"inhalt": f"{anfrage['titel']} ({nr}/{anzahl}): {auszug}", "kommentar": f"stub {kennung}", "typ": anfrage["typ"]}
+                for nr in range(1, anzahl + 1)
+            ]
+        return [
+            {"frage": f"Frage {nr} zu {anfrage['titel']}?", "Antwort": auszug, "Erklaerung": f"stub {kennung}"}
+            for nr in range(1, anzahl + 1)
+        ]
+
+
+def lade_backend(angabe=BACKEND):
+    if angabe == "stub":
+        return StubBackend()
+    modul, _, klasse = angabe.partition(":")
+    return getattr(importlib.import_module(modul), klasse)()
+
+
+def _kontext(db, verknuepfung, spalte, elternId):
+    # Je verknüpfter Datei der Titel und, soweit extrahiert (extraktion.py),
+    # ihr Text; insgesamt höchstens KONTEXT_ZEICHEN Zeichen
+    kontext = []
+    rest = KONTEXT_ZEICHEN
+    dateien = db.execute(
+        select(Datei.titel, Datei.inhalt_sha256).join(verknuepfung).where(spalte == elternId).order_by(Datei.id)
+    ).all()
+    for titel, sha256 in dateien:
+        teile = [titel]
+        if sha256 is not None and rest > 0:
+            for abschnitt in db.scalars(
+                select(inhalt_abschnitte.c.text).where(inhalt_abschnitte.c.sha256 == sha256).order_by(inhalt_abschnitte.c.nr)
+            ):
+                teile.append(abschnitt[:rest])
+                rest -= len(teile[-1])
+                if rest <= 0:
+                    break
+        kontext.append("\n\n".join(teile))
+    return kontext
+
+
+def baue_anfrage(db, auftrag):
+    anzahl, typ = auftrag["anzahl"], auftrag["typ"]
+    if auftrag["notiz_id"] is not None:
+        notiz = db.get(Notiz, auftrag["notiz_id"])
+        if notiz is None:
+            return None
+        titel = notiz.titel
+        standard = f"Erstelle {anzahl} KI-Antwort(en) vom Typ {typ or 'Erklärung'} zur Notiz."
+        zusatz = f"\nLabels: {json.dumps(notiz.labels, ensure_ascii=False, sort_keys=True)}" if notiz.labels else ""
+        kontext = _kontext(db, notiz_datei, notiz_datei.c.notiz_id, notiz.id)
+        ziel = "kiantworten"
+    else:
+        quiz_session = db.get(QuizSession, auftrag["quiz_session_id"])
+        if quiz_session is None:
+            return None
+        titel = quiz_session.titel
+        standard = f"Erstelle {anzahl} Quiz-Frage(n) mit Antwort und Erklärung."
+        zusatz = ""
+        kontext = _kontext(db, datei_quizsession, datei_quizsession.c.quiz_session_id, quiz_session.id)
+        ziel = "quizfragen"
+    prompt = f"{auftrag['anweisung'] or standard}\nTitel: {titel}{zusatz}"
+    return {"ziel": ziel, "typ": typ, "anzahl": anzahl, "titel": titel, "prompt": prompt, "kontext": kontext}
+
+
+def schluessel_fuer(backend_name, anfrage):
+    inhalt = json.dumps({"backend": backend_name, **anfrage}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(inhalt.encode()).hexdigest()
+
+
+# Prüft die Ausgabe des Backends mit den Create-Modellen und behält nur deren Felder
+def _pruefe(anfrage, zeilen):
+    if not isinstance(zeilen, list):
+        raise ValueError("Backend muss eine Liste liefern")
+    if anfrage["ziel"] == "kiantworten":
+        modell, eltern, felder = KiAntwortCreate, "notiz_id", {"inhalt", "kommentar", "typ"}
+    else:
+        modell, eltern, felder = QuizFrageCreate, "quiz_session_id", {"frage", "Antwort", "Erklaerung"}
+    return [modell(**{**zeile, eltern: 0}).dict(include=felder) for zeile in zeilen]
+
+
+class KiGenerierung:
+    def __init__(self, sessions=SessionLocal, worker=WORKER, backend=None):
+        self.sessions = sessions
+        self.worker = worker
+        self.backend = backend
+        self._wecker = threading.Semaphore(0)
+        self._ergebnisse = queue.Queue()
+        self._stopp = threading.Event()
+        self._threads = []
+        self._schreiber = None
+        # Schlüssel -> Future, solange ein Ergebnis erzeugt und noch nicht
+        # gespeichert ist; gleiche Anfragen warten darauf statt auf das Modell
+        self._ausstehend = {}
+        self._sperre = threading.Lock()
+
+    def starte(self):
+        if self.worker <= 0:
+            return
+        if self.backend is None:
+            self.backend = lade_backend()
+        # Beim letzten Beenden unterbrochene Aufträge neu einreihen
+        with self.sessions() as db:
+            db.execute(update(KiAuftrag).where(KiAuftrag.status == "laeuft").values(status="wartend"))
+            db.commit()
+        self._stopp.clear()
+        self._threads = [threading.Thread(target=self._arbeite, name=f"ki-worker-{nr}", daemon=True) for nr in range(self.worker)]
+        self._schreiber = threading.Thread(target=self._schreibe, name="ki-schreiber", daemon=True)
+        for thread in (*self._threads, self._schreiber):
+            thread.start()
+
+    def stoppe(self, warten=5.0):
+        if self._schreiber is None:
+            return
+        self._stopp.set()
+        for _ in self._threads:
+            self._wecker.release()
+        for thread in self._threads:
+            thread.join(warten)
+        self._ergebnisse.put(None)
+        self._schreiber.join(warten)
+        self._threads, self._schreiber = [], None
+
+    # Nach dem Anlegen eines Auftrags: einen wartenden Worker wecken
+    def wecke(self):
+        self._wecker.release()
+
+    def _arbeite(self):
+        while not self._stopp.is_set():
+            try:
+                auftrag = self._hole()
+            except Exception:
+                logger.exception("KI-Auftrag konnte nicht abgeholt werden")
+                auftrag = None
+            if auftrag is None:
+                self._wecker.acquire(timeout=PAUSE)
+                continue
+            self._ergebnisse.put(self._bearbeite(auftrag))
+
+    def _hole(self):
+        with self.sessions() as db:
+            auftrag = db.execute(text(
+                "UPDATE \"kiAuftraege\" SET status = 'laeuft' WHERE id = ("
+                "SELECT id FROM \"kiAuftraege\" WHERE status = 'wartend' ORDER BY id LIMIT 1"
+                ") RETURNING id, notiz_id, quiz_session_id, typ, anweisung, anzahl"
+            )).mappings().first()
+            db.commit()
+        return dict(auftrag) if auftrag is not None else None
+
+    def _bearbeite(self, auftrag):
+        ergebnis = {
+            "id": auftrag["id"], "notiz_id": auftrag["notiz_id"], "quiz_session_id": auftrag["quiz_session_id"],
+            "backend": self.backend.name, "schluessel": None, "zeilen": [], "neu": False, "fehler": None,
+        }
+        try:
+            # Die Session wird vor dem Aufruf des Modells geschlossen, damit
+            # keine Lesetransaktion über die ganze Laufzeit offen bleibt
+            with self.sessions() as db:
+                anfrage = baue_anfrage(db, auftrag)
+            if anfrage is None:
+                ergebnis["fehler"] = "Notiz bzw. Quiz-Session nicht gefunden"
+                return ergebnis
+            ergebnis["schluessel"] = schluessel_fuer(self.backend.name, anfrage)
+            ergebnis["zeilen"], ergebnis["neu"] = self._erzeuge(ergebnis["schluessel"], anfrage)
+        except Exception as fehler:
+            logger.warning("KI-Auftrag %s fehlgeschlagen: %s", auftrag["id"], fehler)
+            ergebnis["fehler"] = f"{type(fehler).__name__}: {fehler}"[:500]
+        return ergebnis
+
+    # Liefert (zeilen, neu): aus einer laufenden gleichen Anfrage, aus
+    # ki_ergebnisse oder, nur wenn beides fehlt, vom Backend
+    def _erzeuge(self, schluessel, anfrage):
+        with self._sperre:
+            zukunft = self._ausstehend.get(schluessel)
+            eigene = zukunft is None
+            if eigene:
+                zukunft = self._ausstehend[schluessel] = Future()
+        if not eigene:
+            return zukunft.result(), False
+        try:
+            with self.sessions() as db:
+                zeilen = db.scalar(select(ki_ergebnisse.c.ergebnis).where(ki_ergebnisse.c.schluessel == schluessel))
+            neu = zeilen is None
+            if neu:
+                zeilen = _pruefe(anfrage, self.backend.generiere(anfrage))
+        except Exception as fehler:
+            with self._sperre:
+                del self._ausstehend[schluessel]
+            zukunft.set_exception(fehler)
+            raise
+        zukunft.set_result(zeilen)
+        if not neu:
+            with self._sperre:
+                del self._ausstehend[schluessel]
+        return zeilen, neu
+
+    # Ein Stapel umfasst alles, was während des vorigen Schreibens fertig wurde
+    def _schreibe(self):
+        ende = False
+        while not ende:
+            stapel = [self._ergebnisse.get()]
+            while len(stapel) < SCHREIB_BATCH:
+                try:
+                    stapel.append(self._ergebnisse.get_nowait())
+                except queue.Empty:
+                    break
+            ende = None in stapel
+            stapel = [ergebnis for ergebnis in stapel if ergebnis is not None]
+            if stapel:
+                self._speichere(stapel)
+
+    def _speichere(self, stapel):
+        try:
+            with self.sessions() as db:
+                crud.speichere_ki_ergebnisse(db, stapel)
+        except Exception as fehler:
+            logger.exception("KI-Ergebnisse konnten nicht gespeichert werden")
+            self._markiere_fehler([ergebnis["id"] for ergebnis in stapel], f"{type(fehler).__name__}: {fehler}"[:500])
+        finally:
+            with self._sperre:
+                for ergebnis in stapel:
+                    if ergebnis["neu"]:
+                        self._ausstehend.pop(ergebnis["schluessel"], None)
+
+    def _markiere_fehler(self, ids, meldung):
+        try:
+            with self.sessions() as db:
+                db.execute(update(KiAuftrag).where(KiAuftrag.id.in_(ids)).values(status="fehler", fehler=meldung))
+                db.commit()
+        except Exception:
+            # Bleiben auf "laeuft" und werden beim nächsten Start neu eingereiht
+            logger.exception("Status der KI-Aufträge %s nicht gespeichert", ids)
+
+
+ki_generierung = KiGenerierung()
@@ -0,0 +1,46 @@
+from sqlalchemy import text
+
+# Notiz.labels ist ein freies JSON-Objekt. Für Abfragen nach Labels wird es in
+# die Tabelle notiz_label (modelle.py) zerlegt: eine Zeile je Schlüssel und
+# Wert, Listen ergeben eine Zeile je Element (z.B. "tags"), verschachtelte
+# Objekte werden nicht indexiert. Werte werden als Text gespeichert, damit sie
+# sich direkt mit Query-Parametern vergleichen lassen (3 -> "3", true -> "true").
+# Trigger halten die Tabelle bei INSERT und UPDATE OF labels aktuell, beim
+# Löschen einer Notiz entfernt ON DELETE CASCADE die Zeilen.
+
+
+def _als_text(alias):
+    return (
+        f"CASE {alias}.type WHEN 'true' THEN 'true' WHEN 'false' THEN 'false' "
+        f"WHEN 'null' THEN 'null' ELSE CAST({alias}.value AS TEXT) END"
+    )
+
+
+def _zeilen(notiz_id, labels, von=""):
+    # SELECT (notiz_id, schluessel, wert) für die Labels einer oder aller Notizen
+    objekt = f"CASE WHEN json_valid({labels}) AND json_type({labels}) = 'object' THEN {labels} ELSE '{{}}' END"
+    return (
+        f"SELECT {notiz_id}, k.key, {_als_text('k')} FROM {von} json_each({objekt}) k "
+        "WHERE k.type NOT IN ('array', 'object') "
+        f"UNION ALL SELECT {notiz_id}, k.key, {_als_text('e')} FROM {von} json_each({objekt}) k, json_each(k.value) e "
+        "WHERE k.type = 'array' AND e.type NOT IN ('array', 'object')"
+    )
+
+
+def _trigger():
+    neu = f"INSERT OR IGNORE INTO notiz_label(notiz_id, schluessel, wert) {_zeilen('new.id', 'new.labels')};"
+    alt = "DELETE FROM notiz_label WHERE notiz_id = old.id;"
+    return [
+        f'CREATE TRIGGER IF NOT EXISTS "notizen_label_ai" AFTER INSERT ON notizen BEGIN {neu} END',
+        f'CREATE TRIGGER IF NOT EXISTS "notizen_label_au" AFTER UPDATE OF labels ON notizen BEGIN {alt} {neu} END',
+    ]
+
+
+def richte_labels_ein(connection):
+    for ddl in _trigger():
+        connection.execute(text(ddl))
+    # Bestehende Notizen (neu) übernehmen
+    connection.execute(text("DELETE FROM notiz_label"))
+    connection.execute(text(
+        f"INSERT OR IGNORE INTO notiz_label(notiz_id, schluessel, wert) {_zeilen('n.id', 'n.labels', 'notizen n,')}"
+    ))
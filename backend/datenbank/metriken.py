@@ -0,0 +1,234 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from fastapi import Response
+from sqlalchemy import event
+
+# Laufzeitmetriken je Route im Prometheus-Textformat unter /metrics: Dauer der
+# Anfragen als Histogramm, Anzahl der SQL-Abfragen und deren Dauer. Jede
+# Antwort trägt X-DB-Queries und Server-Timing (db = SQL, app = Rest, also
+# ORM, Pydantic und Routing). Nur mit LERNASSISTENT_METRIKEN=1; sonst richtet
+# main.py weder Middleware noch Engine-Events ein und es entstehen keine Kosten.
+#
+# Gemessen wird bis zum Beginn der Antwort; was eine StreamingResponse (Export)
+# danach noch liest, fehlt in den Zahlen. Als SQL-Zeit zählt cursor.execute;
+# das Abholen großer Ergebnisse mit fetchall fällt unter app.
+AKTIV = os.getenv("LERNASSISTENT_METRIKEN", "0").lower() in ("1", "true", "ja")
+
+DAUER_GRENZEN = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ABFRAGEN_GRENZEN = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+# Obergrenze für gemerkte Pfad -> Route-Zuordnungen (für Cache-Treffer)
+MAX_PFADE = 10000
+
+# Messwerte der laufenden Anfrage; die Engine-Events zählen nur, wenn gesetzt
+_anfrage = ContextVar("metriken_anfrage", default=None)
+
+
+# Vorlage der Route einer Anfrage, z.B. /api/dateien/{datei_id}; None vor dem
+# Routing bzw. ohne passende Route. Je nach FastAPI-Version ist route.path
+# relativ zum Präfix des Routers, das Präfix kommt dann aus dem Pfad.
+def route_vorlage(scope):
+    route = scope.get("route")
+    if route is None:
+        return None
+    pfad = scope["path"]
+    vorlage = [teil for teil in route.path.split("/") if teil]
+    teile = [teil for teil in pfad.split("/") if teil]
+    vorlage = "/" + "/".join(teile[:len(teile) - len(vorlage)] + vorlage)
+    if pfad.endswith("/") and vorlage != "/":
+        vorlage += "/"
+    return vorlage
+
+
+class _Messung:
+    __slots__ = ("abfragen", "sql_sekunden")
+
+    def __init__(self):
+        self.abfragen = 0
+        self.sql_sekunden = 0.0
+
+
+class _Histogramm:
+    __slots__ = ("grenzen", "eimer", "summe", "anzahl")
+
+    def __init__(self, grenzen):
+        self.grenzen = grenzen
+        self.eimer = [0] * len(grenzen)
+        self.summe = 0.0
+        self.anzahl = 0
+
+    def beobachte(self, wert):
+        stelle = bisect_left(self.grenzen, wert)
+        if stelle < len(self.eimer):
+            self.eimer[stelle] += 1
+        self.summe += wert
+        self.anzahl += 1
+
+    def zeilen(self, name, labels):
+        kumuliert = 0
+        for grenze, anzahl in zip(self.grenzen, self.eimer):
+            kumuliert += anzahl
+            yield f'{name}_bucket{{{labels},le="{grenze}"}} {kumuliert}'
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {self.anzahl}'
+        yield f"{name}_sum{{{labels}}} {self.summe}"
+        yield f"{name}_count{{{labels}}} {self.anzahl}"
+
+
+class Metriken:
+    def __init__(self):
+        self._sperre = threading.Lock()
+        self._dauer = {}
+        self._abfragen = {}
+        self._sql_sekunden = {}
+        self._status = {}
+        self._pfade = {}
+
+    def erfasse(self, methode, route, status, dauer, messung):
+        schluessel = (methode, route)
+        with self._sperre:
+            if schluessel not in self._dauer:
+                self._dauer[schluessel] = _Histogramm(DAUER_GRENZEN)
+                self._abfragen[schluessel] = _Histogramm(ABFRAGEN_GRENZEN)
+                self._sql_sekunden[schluessel] = 0.0
+            self._dauer[schluessel].beobachte(dauer)
+            self._abfragen[schluessel].beobachte(messung.abfragen)
+            self._sql_sekunden[schluessel] += messung.sql_sekunden
+            status_schluessel = (methode, route, status)
+            self._status[status_schluessel] = self._status.get(status_schluessel, 0) + 1
+
+    # Route-Vorlage statt des konkreten Pfads, damit die Anzahl der
+    # Zeitreihen begrenzt bleibt
+    def route(self, scope):
+        pfad = scope["path"]
+        vorlage = route_vorlage(scope)
+        if vorlage is None:
+            # Antwort aus dem Cache, ohne Routing: Vorlage des letzten Aufrufs
+            return self._pfade.get(pfad, "unbekannt")
+        if self._pfade.get(pfad) != vorlage:
+            with self._sperre:
+                if len(self._pfade) >= MAX_PFADE:
+                    self._pfade.clear()
+                self._pfade[pfad] = vorlage
+        return vorlage
+
+    def prometheus(self):
+        with self._sperre:
+            dauer = {schluessel: _kopie(h) for schluessel, h in self._dauer.items()}
+            abfragen = {schluessel: _kopie(h) for schluessel, h in self._abfragen.items()}
+            sql_sekunden = dict(self._sql_sekunden)
+            status = dict(self._status)
+        zeilen = [
+            "# HELP lernassistent_http_anfragen_gesamt Anzahl HTTP-Anfragen",
+            "# TYPE lernassistent_http_anfragen_gesamt counter",
+        ]
+        for (methode, route, code), anzahl in sorted(status.items()):
+            zeilen.append(f"lernassistent_http_anfragen_gesamt{{{_labels(methode, route)},status=\"{code}\"}} {anzahl}")
+        zeilen += [
+            "# HELP lernassistent_http_anfrage_dauer_sekunden Dauer bis zum Beginn der Antwort",
+            "# TYPE lernassistent_http_anfrage_dauer_sekunden histogram",
+        ]
+        for schluessel, histogramm in sorted(dauer.items()):
+            zeilen.extend(histogramm.zeilen("lernassistent_http_anfrage_dauer_sekunden", _labels(*schluessel)))
+        zeilen += [
+            "# HELP lernassistent_db_abfragen_je_anfrage SQL-Abfragen je HTTP-Anfrage",
+            "# TYPE lernassistent_db_abfragen_je_anfrage histogram",
+        ]
+        for schluessel, histogramm in sorted(abfragen.items()):
+            zeilen.extend(histogramm.zeilen("lernassistent_db_abfragen_je_anfrage", _labels(*schluessel)))
+        zeilen += [
+            "# HELP lernassistent_db_dauer_sekunden_gesamt Summe der SQL-Ausführungszeit",
+            "# TYPE lernassistent_db_dauer_sekunden_gesamt counter",
+        ]
+        for schluessel, sekunden in sorted(sql_sekunden.items()):
+            zeilen.append(f"lernassistent_db_dauer_sekunden_gesamt{{{_labels(*schluessel)}}} {sekunden}")
+        return "\n".join(zeilen) + "\n"
+
+
+def _kopie(histogramm):
+    kopie = _Histogramm(histogramm.grenzen)
+    kopie.eimer = list(histogramm.eimer)
+    kopie.summe = histogramm.summe
+    kopie.anzahl = histogramm.anzahl
+    return kopie
+
+
+def _wert(text):
+    return text.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(methode, route):
+    return f'methode="{_wert(methode)}",route="{_wert(route)}"'
+
+
+metriken = Metriken()
+
+
+# Engine-Events: Startzeit am Ausführungskontext, Dauer beim Abschluss. Die
+# Anfrage wird über die ContextVar gefunden, auch in den Threads von
+# run_in_threadpool und in run_sync der asynchronen Sessions.
+def _vor_abfrage(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and _anfrage.get() is not None:
+        context._metriken_start = time.perf_counter()
+
+
+def _nach_abfrage(conn, cursor, statement, parameters, context, executemany):
+    messung = _anfrage.get()
+    start = getattr(context, "_metriken_start", None)
+    if messung is not None and start is not None:
+        messung.abfragen += 1
+        messung.sql_sekunden += time.perf_counter() - start
+
+
+def beobachte(*engines):
+    for engine in engines:
+        if engine is None:
+            continue
+        engine = getattr(engine, "sync_engine", engine)
+        event.listen(engine, "before_cursor_execute", _vor_abfrage)
+        event.listen(engine, "after_cursor_execute", _nach_abfrage)
+
+
+# Reine ASGI-Middleware statt app.middleware("http"): sie ergänzt die Header
+# beim Start der Antwort, ohne den Body durch einen weiteren Task zu leiten
+class MetrikenMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        messung = _Messung()
+        token = _anfrage.set(messung)
+        beginn = time.perf_counter()
+        erfasst = False
+
+        async def sende(nachricht):
+            nonlocal erfasst
+            if nachricht["type"] == "http.response.start":
+                dauer = time.perf_counter() - beginn
+                sql_ms = messung.sql_sekunden * 1000
+                nachricht = {**nachricht, "headers": [
+                    *nachricht.get("headers", ()),
+                    (b"x-db-queries", str(messung.abfragen).encode()),
+                    (b"server-timing", f"db;dur={sql_ms:.2f}, app;dur={max(dauer * 1000 - sql_ms, 0):.2f}".encode()),
+                ]}
+                metriken.erfasse(scope["method"], metriken.route(scope), nachricht["status"], dauer, messung)
+                erfasst = True
+            await send(nachricht)
+
+        try:
+            await self.app(scope, receive, sende)
+        except BaseException:
+            if not erfasst:
+                metriken.erfasse(scope["method"], metriken.route(scope), 500, time.perf_counter() - beginn, messung)
+            raise
+        finally:
+            _anfrage.reset(token)
+
+
+async def metriken_endpunkt():
+    return Response(content=metriken.prometheus(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,236 @@
+import re
+from collections import namedtuple
+
+from .dateiSpeicher import richte_speicher_ein
+from .facetten import richte_facetten_ein
+from .labels import richte_labels_ein
+from .statistik import richte_statistik_ein
+from .volltextsuche import richte_volltextsuche_ein
+from .wiederholung import richte_wiederholung_ein
+
+# Versionierte Schema-Migrationen. Der Stand einer Datenbank steht in
+# PRAGMA user_version; main.py ruft nach create_all() migriere() auf, das alle
+# neueren Migrationen der Reihe nach in je einer Transaktion ausführt.
+# create_all() legt neue Tabellen bereits im aktuellen Stand an, deshalb müssen
+# Migrationen auch auf einem frischen Schema fehlerfrei durchlaufen.
+Migration = namedtuple("Migration", ["version", "beschreibung", "funktion"])
+
+MIGRATIONEN = []
+
+
+def migration(version, beschreibung):
+    def registriere(funktion):
+        MIGRATIONEN.append(Migration(version, beschreibung, funktion))
+        MIGRATIONEN.sort(key=lambda eintrag: eintrag.version)
+        return funktion
+
+    return registriere
+
+
+def schema_version(connection):
+    return connection.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def migriere(engine):
+    # AUTOCOMMIT, damit BEGIN/COMMIT explizit gesetzt werden können: pysqlite
+    # startet vor DDL-Anweisungen sonst keine Transaktion. foreign_keys lässt
+    # sich nur außerhalb einer Transaktion umschalten und wird für Tabellen-
+    # Umbauten abgeschaltet, am Ende aber per foreign_key_check geprüft.
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        aktuell = schema_version(connection)
+        for eintrag in MIGRATIONEN:
+            if eintrag.version <= aktuell:
+                continue
+            connection.exec_driver_sql("PRAGMA foreign_keys=OFF")
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+            try:
+                eintrag.funktion(connection)
+                verletzungen = connection.exec_driver_sql("PRAGMA foreign_key_check").all()
+                if verletzungen:
+                    raise RuntimeError(
+                        f"Migration {eintrag.version} verletzt Fremdschlüssel: {verletzungen[:5]}"
+                    )
+                connection.exec_driver_sql(f"PRAGMA user_version = {eintrag.version}")
+                connection.exec_driver_sql("COMMIT")
+            except Exception:
+                connection.exec_driver_sql("ROLLBACK")
+                raise
+            finally:
+                connection.exec_driver_sql("PRAGMA foreign_keys=ON")
+
+
+@migration(1, "Volltextsuche (FTS5) mit Triggern")
+def _volltextsuche(connection):
+    richte_volltextsuche_ein(connection)
+
+
+# Indizes aus den ersten Modellversionen (index=True auf fast jeder Spalte).
+# Freitextspalten werden nie per Gleichheit gesucht, die ix_*_id-Indizes
+# doppeln den INTEGER PRIMARY KEY (rowid) und einzelne Spalten sind durch die
+# zusammengesetzten Indizes in modelle.py abgedeckt.
+ALTE_INDIZES = [
+    ("dateien", "id"), ("dateien", "titel"), ("dateien", "pfad"), ("dateien", "semester"),
+    ("notizen", "id"), ("notizen", "titel"),
+    ("kiAntworten", "id"), ("kiAntworten", "inhalt"), ("kiAntworten", "kommentar"), ("kiAntworten", "notiz_id"),
+    ("quizSessions", "id"), ("quizSessions", "titel"),
+    ("quizFragen", "id"), ("quizFragen", "frage"), ("quizFragen", "Antwort"), ("quizFragen", "Erklaerung"),
+]
+
+NEUE_INDIZES = [
+    ("ix_dateien_semester_modul_dozent", "dateien", ("semester", "modul", "dozent")),
+    ("ix_kiAntworten_notiz_id_typ", "kiAntworten", ("notiz_id", "typ")),
+    ("ix_notiz_datei_datei_id", "notiz_datei", ("datei_id", "notiz_id")),
+    ("ix_datei_quizsession_quiz_session_id", "datei_quizsession", ("quiz_session_id", "datei_id")),
+]
+
+
+@migration(2, "Ungenutzte Einzelindizes entfernen, zusammengesetzte Indizes anlegen")
+def _indizes(connection):
+    for tabelle, spalte in ALTE_INDIZES:
+        connection.exec_driver_sql(f'DROP INDEX IF EXISTS "ix_{tabelle}_{spalte}"')
+    for name, tabelle, index_spalten in NEUE_INDIZES:
+        liste = ", ".join(f'"{spalte}"' for spalte in index_spalten)
+        connection.exec_driver_sql(f'CREATE INDEX IF NOT EXISTS "{name}" ON "{tabelle}" ({liste})')
+    connection.exec_driver_sql("ANALYZE")
+
+
+# Tabellen, deren Zeilen beim Löschen des Elternteils mitgelöscht werden.
+# SQLite kann Constraints nicht per ALTER TABLE ändern; die Tabellen werden
+# deshalb aus ihrem gespeicherten CREATE TABLE neu aufgebaut (Verfahren aus
+# der SQLite-Dokumentation zu ALTER TABLE), Indizes und Trigger anschließend
+# unverändert wiederhergestellt.
+KASKADIERENDE_TABELLEN = ["kiAntworten", "quizFragen", "notiz_datei", "datei_quizsession"]
+
+
+def _mit_kaskade(sql):
+    return re.sub(r"(REFERENCES\s+\S+\s*\([^)]*\))(?!\s*ON DELETE)", r"\1 ON DELETE CASCADE", sql)
+
+
+def _baue_neu(connection, tabelle, create_sql):
+    abhaengige = connection.exec_driver_sql(
+        "SELECT sql FROM sqlite_master WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL",
+        (tabelle,),
+    ).scalars().all()
+    neu = f"{tabelle}__neu"
+    create_sql = re.sub(r'^CREATE TABLE\s+("[^"]+"|\S+)', f'CREATE TABLE "{neu}"', create_sql)
+    connection.exec_driver_sql(create_sql)
+    connection.exec_driver_sql(f'INSERT INTO "{neu}" SELECT * FROM "{tabelle}"')
+    connection.exec_driver_sql(f'DROP TABLE "{tabelle}"')
+    # Trigger anderer Tabellen verweisen auf den alten Namen; ohne legacy_alter_table
+    # prüft RENAME sie und bricht ab, solange die Tabelle fehlt
+    connection.exec_driver_sql("PRAGMA legacy_alter_table=ON")
+    try:
+        connection.exec_driver_sql(f'ALTER TABLE "{neu}" RENAME TO "{tabelle}"')
+    finally:
+        connection.exec_driver_sql("PRAGMA legacy_alter_table=OFF")
+    for sql in abhaengige:
+        connection.exec_driver_sql(sql)
+
+
+@migration(3, "ON DELETE CASCADE für abhängige Tabellen und Verknüpfungen")
+def _kaskaden(connection):
+    for tabelle in KASKADIERENDE_TABELLEN:
+        fremdschluessel = connection.exec_driver_sql(f'PRAGMA foreign_key_list("{tabelle}")').mappings().all()
+        if all(fk["on_delete"] == "CASCADE" for fk in fremdschluessel):
+            continue
+        create_sql = connection.exec_driver_sql(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (tabelle,)
+        ).scalar()
+        _baue_neu(connection, tabelle, _mit_kaskade(create_sql))
+
+
+# Versionsspalte für optimistische Nebenläufigkeit (siehe versionierung.py)
+VERSIONIERTE_TABELLEN = ["dateien", "notizen", "kiAntworten", "quizSessions", "quizFragen"]
+
+
+@migration(4, "Versionsspalte für optimistische Nebenläufigkeit")
+def _versionen(connection):
+    for tabelle in VERSIONIERTE_TABELLEN:
+        spalten = {zeile[1] for zeile in connection.exec_driver_sql(f'PRAGMA table_info("{tabelle}")')}
+        if "version" not in spalten:
+            connection.exec_driver_sql(f'ALTER TABLE "{tabelle}" ADD COLUMN version INTEGER NOT NULL DEFAULT 1')
+
+
+# Reihenfolge der KI-Antworten: statt der JSON-Liste notizen.reihenfolgeKiAntworten
+# eine Spalte kiAntworten.position mit Lücken (siehe crud.py). Antworten aus der
+# Liste behalten ihre Reihenfolge, nicht aufgeführte folgen nach id. Der
+# Abstand ist bewusst fest und nicht aus crud.py importiert, damit die
+# Migration unverändert bleibt.
+ABSTAND = 1024
+
+
+@migration(5, "Spalte position für die Reihenfolge der KI-Antworten")
+def _positionen(connection):
+    ki_spalten = {zeile[1] for zeile in connection.exec_driver_sql('PRAGMA table_info("kiAntworten")')}
+    if "position" not in ki_spalten:
+        connection.exec_driver_sql('ALTER TABLE "kiAntworten" ADD COLUMN position INTEGER NOT NULL DEFAULT 0')
+    connection.exec_driver_sql(
+        'CREATE INDEX IF NOT EXISTS "ix_kiAntworten_notiz_id_position" ON "kiAntworten" (notiz_id, position)'
+    )
+    notiz_spalten = {zeile[1] for zeile in connection.exec_driver_sql('PRAGMA table_info("notizen")')}
+    if "reihenfolgeKiAntworten" not in notiz_spalten:
+        return
+    connection.exec_driver_sql(
+        'UPDATE "kiAntworten" SET position = neu.rang * ? FROM ('
+        "SELECT k.id, ROW_NUMBER() OVER ("
+        "PARTITION BY k.notiz_id ORDER BY liste.stelle IS NULL, liste.stelle, k.id"
+        ') AS rang FROM "kiAntworten" k LEFT JOIN ('
+        "SELECT n.id AS notiz_id, r.value AS kiantwort_id, MIN(r.key) AS stelle "
+        "FROM notizen n, json_each(CASE WHEN json_valid(n.reihenfolgeKiAntworten) "
+        "AND json_type(n.reihenfolgeKiAntworten) = 'array' THEN n.reihenfolgeKiAntworten ELSE '[]' END) r "
+        "GROUP BY n.id, r.value"
+        ") liste ON liste.notiz_id = k.notiz_id AND liste.kiantwort_id = k.id"
+        ') AS neu WHERE "kiAntworten".id = neu.id',
+        (ABSTAND,),
+    )
+    connection.exec_driver_sql('ALTER TABLE notizen DROP COLUMN "reihenfolgeKiAntworten"')
+
+
+@migration(6, "Tabelle notiz_label für Abfragen nach Labels")
+def _labels(connection):
+    richte_labels_ein(connection)
+
+
+@migration(7, "Vorberechnete Facetten-Anzahlen für Dateien")
+def _facetten(connection):
+    richte_facetten_ein(connection)
+    connection.exec_driver_sql('CREATE INDEX IF NOT EXISTS "ix_dateien_semester_id" ON dateien (semester, id)')
+
+
+@migration(8, "Inhaltsadressierter Speicher für Dateiinhalte")
+def _dateiinhalte(connection):
+    spalten = {zeile[1] for zeile in connection.exec_driver_sql('PRAGMA table_info("dateien")')}
+    for spalte, typ in (("inhalt_sha256", "VARCHAR"), ("inhalt_groesse", "INTEGER"), ("inhalt_typ", "VARCHAR")):
+        if spalte not in spalten:
+            connection.exec_driver_sql(f'ALTER TABLE dateien ADD COLUMN "{spalte}" {typ}')
+    richte_speicher_ein(connection)
+
+
+@migration(9, "Lernstand je Quiz-Frage für verteiltes Wiederholen")
+def _wiederholung(connection):
+    richte_wiederholung_ein(connection)
+
+
+@migration(10, "Vorberechnete Lernstatistiken je Quiz-Session, Notiz und Modul")
+def _statistik(connection):
+    richte_statistik_ein(connection)
+
+
+# Ohne AUTOINCREMENT vergibt SQLite die id der zuletzt gelöschten Zeile mit der
+# höchsten id erneut, und der neue Datensatz beginnt wieder bei version 1. Da
+# der ETag nur aus der Version besteht, würde er dann zum gelöschten Datensatz
+# passen (304 bzw. If-Match ohne 412). Das Einfügen in die neue Tabelle setzt
+# sqlite_sequence auf die bisher höchste id.
+def _mit_autoincrement(sql):
+    sql = re.sub(r",\s*PRIMARY KEY \(id\)", "", sql)
+    return re.sub(r"\bid INTEGER NOT NULL\b", "id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT", sql, count=1)
+
+
+@migration(11, "AUTOINCREMENT für versionierte Tabellen, damit ids nicht wiederverwendet werden")
+def _autoincrement(connection):
+    for tabelle in VERSIONIERTE_TABELLEN:
+        create_sql = connection.exec_driver_sql(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (tabelle,)
+        ).scalar()
+        if "AUTOINCREMENT" not in create_sql.upper():
+            _baue_neu(connection, tabelle, _mit_autoincrement(create_sql))
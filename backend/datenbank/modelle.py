@@ -1,11 +1,74 @@
-from sqlalchemy import Column, Integer, String, JSON, ForeignKey, Table
+from sqlalchemy import Boolean, Column, Float, Integer, String, JSON, ForeignKey, Table, Index, text
 from sqlalchemy.orm import relationship
 from .datenbank import Base
 
+# Abhängige Datensätze und Verknüpfungen löscht SQLite per ON DELETE CASCADE
+# (PRAGMA foreign_keys=ON, siehe datenbank.py); passive_deletes verhindert,
+# dass das ORM sie vorher lädt.
+
 # Zuordnungstabelle Notiz/Datei
-notiz_datei = Table( "notiz_datei", Base.metadata, Column("notiz_id", ForeignKey("notizen.id"), primary_key=True), Column("datei_id", ForeignKey("dateien.id"), primary_key=True), )
+notiz_datei = Table( "notiz_datei", Base.metadata, Column("notiz_id", ForeignKey("notizen.id", ondelete="CASCADE"), primary_key=True), Column("datei_id", ForeignKey("dateien.id", ondelete="CASCADE"), primary_key=True), Index("ix_notiz_datei_datei_id", "datei_id", "notiz_id"), )
+
+datei_quizsession = Table( "datei_quizsession", Base.metadata, Column("datei_id", ForeignKey("dateien.id", ondelete="CASCADE"), primary_key=True), Column("quiz_session_id", ForeignKey("quizSessions.id", ondelete="CASCADE"), primary_key=True), Index("ix_datei_quizsession_quiz_session_id", "quiz_session_id", "datei_id"), )
+
+# Labels der Notizen, zerlegt in Schlüssel/Wert-Paare (siehe labels.py). Der
+# Primärschlüssel beginnt mit (schluessel, wert), Abfragen nach Labels sind
+# damit Index-Suchen; ohne rowid liegen die Zeilen direkt im Index.
+notiz_label = Table(
+    "notiz_label",
+    Base.metadata,
+    Column("schluessel", String, primary_key=True),
+    Column("wert", String, primary_key=True),
+    Column("notiz_id", ForeignKey("notizen.id", ondelete="CASCADE"), primary_key=True),
+    Index("ix_notiz_label_notiz_id", "notiz_id"),
+    sqlite_with_rowid=False,
+)
+
+# Anzahl Dateien je Kombination der Facetten (siehe facetten.py)
+datei_facetten = Table(
+    "datei_facetten",
+    Base.metadata,
+    Column("dateiart", String),
+    Column("dozent", String),
+    Column("semester", String),
+    Column("modul", String),
+    Column("anzahl", Integer, nullable=False),
+    Index("ix_datei_facetten_kombination", "semester", "modul", "dozent", "dateiart"),
+)
 
-datei_quizsession = Table( "datei_quizsession", Base.metadata, Column("datei_id", ForeignKey("dateien.id"), primary_key=True), Column("quiz_session_id", ForeignKey("quizSessions.id"), primary_key=True), )
+# Hochgeladene Inhalte, einmal je SHA-256, mit Anzahl verweisender Dateien
+# (siehe dateiSpeicher.py). Der Teilindex findet unbenutzte Inhalte ohne Scan.
+datei_inhalte = Table(
+    "datei_inhalte",
+    Base.metadata,
+    Column("sha256", String, primary_key=True),
+    Column("groesse", Integer, nullable=True),
+    Column("referenzen", Integer, nullable=False, default=0, server_default="0"),
+    Index("ix_datei_inhalte_unbenutzt", "sha256", sqlite_where=text("referenzen <= 0")),
+    sqlite_with_rowid=False,
+)
+
+# Ergebnis der Textextraktion je Inhalt (siehe extraktion.py); beide Tabellen
+# verschwinden mit dem Inhalt per ON DELETE CASCADE.
+inhalt_extraktion = Table(
+    "inhalt_extraktion",
+    Base.metadata,
+    Column("sha256", ForeignKey("datei_inhalte.sha256", ondelete="CASCADE"), primary_key=True),
+    Column("status", String, nullable=False),
+    Column("fehler", String, nullable=True),
+    Column("abschnitte", Integer, nullable=True),
+    Column("zeichen", Integer, nullable=True),
+    sqlite_with_rowid=False,
+)
+
+inhalt_abschnitte = Table(
+    "inhalt_abschnitte",
+    Base.metadata,
+    Column("sha256", ForeignKey("inhalt_extraktion.sha256", ondelete="CASCADE"), primary_key=True),
+    Column("nr", Integer, primary_key=True),
+    Column("text", String, nullable=False),
+    sqlite_with_rowid=False,
+)
 
 
     
@@ -13,53 +76,115 @@ datei_quizsession = Table( "datei_quizsession", Base.metadata, Column("datei_id"
 class Datei(Base):
     __tablename__="dateien"
     
-    id = Column(Integer, primary_key=True, index=True)
-    titel = Column(String, index=True, nullable=False)
-    pfad = Column(String, index=True,nullable=False)
+    id = Column(Integer, primary_key=True)
+    titel = Column(String, nullable=False)
+    pfad = Column(String, nullable=False)
     dateiart = Column(String, index=True, nullable=True)
     dozent = Column(String, index=True, nullable=True)
-    semester = Column(String, index=True, nullable=True)
+    semester = Column(String, nullable=True)
     modul = Column(String, index=True, nullable=True)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    # Hochgeladener Inhalt, falls vorhanden (Datei unter dateiSpeicher.blob_pfad)
+    inhalt_sha256 = Column(String, nullable=True)
+    inhalt_groesse = Column(Integer, nullable=True)
+    inhalt_typ = Column(String, nullable=True)
     
-    quiz_sessions = relationship("QuizSession", secondary=datei_quizsession, back_populates="dateien")
-    notizen = relationship("Notiz", secondary=notiz_datei, back_populates="dateien")
+    quiz_sessions = relationship("QuizSession", secondary=datei_quizsession, back_populates="dateien", passive_deletes=True)
+    notizen = relationship("Notiz", secondary=notiz_datei, back_populates="dateien", passive_deletes=True)
+
+    # (semester, id) erlaubt das seitenweise Blättern nach Semester ohne Sortieren
+    __table_args__ = (
+        Index("ix_dateien_semester_modul_dozent", "semester", "modul", "dozent"),
+        Index("ix_dateien_semester_id", "semester", "id"),
+        {"sqlite_autoincrement": True},
+    )
 
     
 # Speichern von Notizen
 class Notiz(Base):
     __tablename__="notizen"
     
-    id = Column(Integer, primary_key=True, index=True)
-    titel = Column(String, index=True, nullable=False)
+    id = Column(Integer, primary_key=True)
+    titel = Column(String, nullable=False)
     labels = Column(JSON, nullable=False)
-    reihenfolgeKiAntworten = Column(JSON, nullable=False, default=list)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+
+    kiAntworten = relationship("KiAntwort", back_populates="notiz", cascade="all, delete-orphan", passive_deletes=True, order_by="[KiAntwort.position, KiAntwort.id]")
+    dateien = relationship("Datei", secondary=notiz_datei, back_populates="notizen", passive_deletes=True)
 
-    kiAntworten = relationship("KiAntwort", back_populates="notiz", cascade="all, delete-orphan")
-    dateien = relationship("Datei", secondary=notiz_datei, back_populates="notizen")
+    __table_args__ = {"sqlite_autoincrement": True}
 
 
 # Speichern von KI-Antworten
 class KiAntwort(Base):
     __tablename__="kiAntworten"
     
-    id = Column(Integer, primary_key=True, index=True)
-    inhalt = Column(String, index=True, nullable=True)
-    kommentar = Column(String, index=True, nullable=True)
+    id = Column(Integer, primary_key=True)
+    inhalt = Column(String, nullable=True)
+    kommentar = Column(String, nullable=True)
     typ = Column(String, index=True, nullable=True)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    # Reihenfolge innerhalb der Notiz, mit Lücken vergeben (siehe crud.py)
+    position = Column(Integer, nullable=False, default=0, server_default="0")
 
-    notiz_id = Column(Integer, ForeignKey("notizen.id"), nullable=False, index=True)
+    notiz_id = Column(Integer, ForeignKey("notizen.id", ondelete="CASCADE"), nullable=False)
     notiz = relationship("Notiz", back_populates="kiAntworten")
+
+    __table_args__ = (
+        Index("ix_kiAntworten_notiz_id_typ", "notiz_id", "typ"),
+        Index("ix_kiAntworten_notiz_id_position", "notiz_id", "position"),
+        {"sqlite_autoincrement": True},
+    )
+
+
+# Aufträge zur serverseitigen Erzeugung von KI-Antworten bzw. Quiz-Fragen
+# (siehe kiGenerierung.py); genau eins von notiz_id und quiz_session_id ist
+# gesetzt. Der Teilindex liefert den ältesten wartenden Auftrag ohne Scan.
+class KiAuftrag(Base):
+    __tablename__="kiAuftraege"
+
+    id = Column(Integer, primary_key=True)
+    notiz_id = Column(Integer, ForeignKey("notizen.id", ondelete="CASCADE"), nullable=True, index=True)
+    quiz_session_id = Column(Integer, ForeignKey("quizSessions.id", ondelete="CASCADE"), nullable=True, index=True)
+    typ = Column(String, nullable=True)
+    anweisung = Column(String, nullable=True)
+    anzahl = Column(Integer, nullable=False, default=1, server_default="1")
+    status = Column(String, nullable=False, default="wartend", server_default="wartend")
+    fehler = Column(String, nullable=True)
+    # SHA-256 über Anfrage und Kontext, Schlüssel in ki_ergebnisse
+    schluessel = Column(String, nullable=True)
+    aus_cache = Column(Boolean, nullable=True)
+    ergebnis_ids = Column(JSON, nullable=True)
+
+    __table_args__ = (
+        Index("ix_kiAuftraege_wartend", "id", sqlite_where=text("status = 'wartend'")),
+    )
+
+
+# Bereits erzeugte Ergebnisse je Schlüssel: eine gleiche Anfrage mit gleichem
+# Kontext wird aus dieser Tabelle beantwortet, ohne das Modell aufzurufen.
+ki_ergebnisse = Table(
+    "ki_ergebnisse",
+    Base.metadata,
+    Column("schluessel", String, primary_key=True),
+    Column("backend", String, nullable=False),
+    Column("ergebnis", JSON, nullable=False),
+    sqlite_with_rowid=False,
+)
     
     
  # Speichern von Quiz-Sessions
 class QuizSession(Base):
     __tablename__="quizSessions"
     
-    id = Column(Integer, primary_key=True, index=True)
-    titel = Column(String, index=True, nullable=False)
+    id = Column(Integer, primary_key=True)
+    titel = Column(String, nullable=False)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
-    fragen = relationship("QuizFrage", back_populates="quiz_session", cascade="all, delete-orphan")
-    dateien = relationship("Datei", secondary=datei_quizsession, back_populates="quiz_sessions")
+    fragen = relationship("QuizFrage", back_populates="quiz_session", cascade="all, delete-orphan", passive_deletes=True)
+    dateien = relationship("Datei", secondary=datei_quizsession, back_populates="quiz_sessions", passive_deletes=True)
+
+    __table_args__ = {"sqlite_autoincrement": True}
 
 
     
@@ -67,10 +192,106 @@ class QuizSession(Base):
 class QuizFrage(Base):
     __tablename__="quizFragen"
     
-    id = Column(Integer, primary_key=True, index=True)
-    frage = Column(String, index=True, nullable=False)
-    Antwort = Column(String, index=True, nullable=False)
-    Erklaerung = Column(String, index=True, nullable=False)
+    id = Column(Integer, primary_key=True)
+    frage = Column(String, nullable=False)
+    Antwort = Column(String, nullable=False)
+    Erklaerung = Column(String, nullable=False)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
-    quiz_session_id = Column(Integer, ForeignKey("quizSessions.id"), nullable=False, index=True)
+    quiz_session_id = Column(Integer, ForeignKey("quizSessions.id", ondelete="CASCADE"), nullable=False, index=True)
     quiz_session = relationship("QuizSession", back_populates="fragen")
+
+    __table_args__ = {"sqlite_autoincrement": True}
+
+
+
+# Antwortversuche auf Quiz-Fragen; geschrieben stapelweise von
+# versuchsPuffer.py. zeitpunkt in Unix-Sekunden.
+class QuizVersuch(Base):
+    __tablename__="quizVersuche"
+
+    id = Column(Integer, primary_key=True)
+    quiz_frage_id = Column(Integer, ForeignKey("quizFragen.id", ondelete="CASCADE"), nullable=False)
+    antwort = Column(String, nullable=True)
+    richtig = Column(Boolean, nullable=True)
+    dauer_ms = Column(Integer, nullable=True)
+    zeitpunkt = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index("ix_quizVersuche_quiz_frage_id", "quiz_frage_id", "id"),
+    )
+
+
+# Lernstand je Quiz-Frage (siehe wiederholung.py), angelegt per Trigger. Der
+# Index liefert die fälligen Fragen einer Session sortiert nach faellig (und
+# quiz_frage_id, dem Primärschlüssel) als Bereichssuche.
+quiz_wiederholung = Table(
+    "quiz_wiederholung",
+    Base.metadata,
+    Column("quiz_frage_id", ForeignKey("quizFragen.id", ondelete="CASCADE"), primary_key=True),
+    Column("quiz_session_id", Integer, nullable=False),
+    Column("faellig", Integer, nullable=False),
+    Column("ease", Float, nullable=False, server_default="2.5"),
+    Column("intervall", Float, nullable=False, server_default="0"),
+    Column("wiederholungen", Integer, nullable=False, server_default="0"),
+    Column("fehlversuche", Integer, nullable=False, server_default="0"),
+    Column("bewertungen", Integer, nullable=False, server_default="0"),
+    Column("letzte_bewertung", Integer, nullable=True),
+    Column("zuletzt", Integer, nullable=True),
+    Index("ix_quiz_wiederholung_session_faellig", "quiz_session_id", "faellig"),
+    sqlite_with_rowid=False,
+)
+
+
+# Vorberechnete Lernstatistiken (siehe statistik.py), gepflegt per Trigger.
+# statistik_gesamt hält je Name (z. B. "quiz_fragen") eine Gesamtanzahl.
+statistik_gesamt = Table(
+    "statistik_gesamt",
+    Base.metadata,
+    Column("name", String, primary_key=True),
+    Column("anzahl", Integer, nullable=False, server_default="0"),
+    sqlite_with_rowid=False,
+)
+
+statistik_notizen = Table(
+    "statistik_notizen",
+    Base.metadata,
+    Column("notiz_id", ForeignKey("notizen.id", ondelete="CASCADE"), primary_key=True),
+    Column("kiantworten", Integer, nullable=False, server_default="0"),
+    Column("dateien", Integer, nullable=False, server_default="0"),
+    sqlite_with_rowid=False,
+)
+
+statistik_quiz_sessions = Table(
+    "statistik_quiz_sessions",
+    Base.metadata,
+    Column("quiz_session_id", ForeignKey("quizSessions.id", ondelete="CASCADE"), primary_key=True),
+    Column("fragen", Integer, nullable=False, server_default="0"),
+    Column("versuche", Integer, nullable=False, server_default="0"),
+    Column("richtig", Integer, nullable=False, server_default="0"),
+    sqlite_with_rowid=False,
+)
+
+statistik_module = Table(
+    "statistik_module",
+    Base.metadata,
+    Column("modul", String, primary_key=True),
+    Column("dateien", Integer, nullable=False, server_default="0"),
+    Column("quiz_sessions", Integer, nullable=False, server_default="0"),
+    Column("fragen", Integer, nullable=False, server_default="0"),
+    Column("versuche", Integer, nullable=False, server_default="0"),
+    Column("richtig", Integer, nullable=False, server_default="0"),
+    sqlite_with_rowid=False,
+)
+
+# Anzahl Verknüpfungen je Modul und Quiz-Session, damit eine Session je Modul
+# nur einmal zählt; der Index findet die Module einer Session
+statistik_modul_sessions = Table(
+    "statistik_modul_sessions",
+    Base.metadata,
+    Column("modul", String, primary_key=True),
+    Column("quiz_session_id", Integer, primary_key=True),
+    Column("verknuepfungen", Integer, nullable=False, server_default="0"),
+    Index("ix_statistik_modul_sessions_quiz_session_id", "quiz_session_id", "modul"),
+    sqlite_with_rowid=False,
+)
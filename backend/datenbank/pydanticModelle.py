@@ -1,5 +1,6 @@
-from pydantic import BaseModel, Field
-from typing import Optional, List, Dict, Any
+from datetime import datetime
+from pydantic import BaseModel, Field, model_validator
+from typing import Optional, List, Dict, Any, Literal
 
 
 # Datei
@@ -19,6 +20,11 @@ class DateiUpdate(BaseModel):
     dozent: Optional[str] = None
     semester: Optional[str] = None
     modul: Optional[str] = None
+    version: Optional[int] = None
+
+
+class DateiBatchUpdate(DateiUpdate):
+    id: int
 
 
 class DateiResponse(BaseModel):
@@ -29,34 +35,85 @@ class DateiResponse(BaseModel):
     dozent: Optional[str] = None
     semester: Optional[str] = None
     modul: Optional[str] = None
+    version: int
+    inhalt_sha256: Optional[str] = None
+    inhalt_groesse: Optional[int] = None
+    inhalt_typ: Optional[str] = None
 
     class Config:
         from_attributes = True
 
 
+class DateiSeite(BaseModel):
+    eintraege: List[DateiResponse]
+    naechster_cursor: Optional[int] = None
+
+
+class FacettenWert(BaseModel):
+    wert: Optional[str] = None
+    anzahl: int
+
+
+class DateiFacettenSeite(DateiSeite):
+    gesamt: int
+    facetten: Dict[str, List[FacettenWert]]
+
+
+class ExtraktionStatus(BaseModel):
+    sha256: str
+    status: str
+    fehler: Optional[str] = None
+    abschnitte: Optional[int] = None
+    zeichen: Optional[int] = None
+
+
+class Abschnitt(BaseModel):
+    nr: int
+    text: str
+
+
+class AbschnittSeite(BaseModel):
+    eintraege: List[Abschnitt]
+    naechster_cursor: Optional[int] = None
+
+
 # Notiz
 class NotizCreate(BaseModel):
     titel: str
     labels: Dict[str, Any]
-    reihenfolgeKiAntworten: List[Any] = Field(default_factory=list)
 
 
 class NotizUpdate(BaseModel):
     titel: Optional[str] = None
     labels: Optional[Dict[str, Any]] = None
-    reihenfolgeKiAntworten: Optional[List[Any]] = None
+    version: Optional[int] = None
+
+
+class NotizBatchUpdate(NotizUpdate):
+    id: int
 
 
 class NotizResponse(BaseModel):
     id: int
     titel: str
     labels: Dict[str, Any]
-    reihenfolgeKiAntworten: List[Any] = Field(default_factory=list)
+    version: int
 
     class Config:
         from_attributes = True
 
 
+class NotizSeite(BaseModel):
+    eintraege: List[NotizResponse]
+    naechster_cursor: Optional[int] = None
+
+
+class LabelFacette(BaseModel):
+    schluessel: str
+    wert: str
+    anzahl: int
+
+
 # KiAntwort
 class KiAntwortCreate(BaseModel):
     inhalt: Optional[str] = None
@@ -70,6 +127,11 @@ class KiAntwortUpdate(BaseModel):
     kommentar: Optional[str] = None
     typ: Optional[str] = None
     notiz_id: Optional[int] = None
+    version: Optional[int] = None
+
+
+class KiAntwortBatchUpdate(KiAntwortUpdate):
+    id: int
 
 
 class KiAntwortResponse(BaseModel):
@@ -78,6 +140,60 @@ class KiAntwortResponse(BaseModel):
     kommentar: Optional[str] = None
     typ: Optional[str] = None
     notiz_id: int
+    position: int
+    version: int
+
+    class Config:
+        from_attributes = True
+
+
+class KiAntwortSeite(BaseModel):
+    eintraege: List[KiAntwortResponse]
+    naechster_cursor: Optional[int] = None
+
+
+# Verschieben vor oder hinter eine andere KI-Antwort (genau eins von beiden)
+class KiAntwortVerschieben(BaseModel):
+    vor: Optional[int] = None
+    nach: Optional[int] = None
+
+    @model_validator(mode="after")
+    def _genau_ein_ziel(self):
+        if (self.vor is None) == (self.nach is None):
+            raise ValueError("Genau eins von 'vor' und 'nach' angeben")
+        return self
+
+
+# KiAuftrag: erzeugt KI-Antworten zu einer Notiz oder Quiz-Fragen zu einer
+# Quiz-Session (genau eins von beiden)
+MAX_KI_ANZAHL = 20
+
+
+class KiAuftragCreate(BaseModel):
+    notiz_id: Optional[int] = None
+    quiz_session_id: Optional[int] = None
+    typ: Optional[str] = None
+    anweisung: Optional[str] = Field(None, max_length=4000)
+    anzahl: int = Field(1, ge=1, le=MAX_KI_ANZAHL)
+
+    @model_validator(mode="after")
+    def _genau_ein_ziel(self):
+        if (self.notiz_id is None) == (self.quiz_session_id is None):
+            raise ValueError("Genau eins von 'notiz_id' und 'quiz_session_id' angeben")
+        return self
+
+
+class KiAuftragResponse(BaseModel):
+    id: int
+    notiz_id: Optional[int] = None
+    quiz_session_id: Optional[int] = None
+    typ: Optional[str] = None
+    anweisung: Optional[str] = None
+    anzahl: int
+    status: str
+    fehler: Optional[str] = None
+    aus_cache: Optional[bool] = None
+    ergebnis_ids: Optional[List[int]] = None
 
     class Config:
         from_attributes = True
@@ -90,16 +206,23 @@ class QuizSessionCreate(BaseModel):
 
 class QuizSessionUpdate(BaseModel):
     titel: Optional[str] = None
+    version: Optional[int] = None
 
 
 class QuizSessionResponse(BaseModel):
     id: int
     titel: str
+    version: int
 
     class Config:
         from_attributes = True
 
 
+class QuizSessionSeite(BaseModel):
+    eintraege: List[QuizSessionResponse]
+    naechster_cursor: Optional[int] = None
+
+
 # QuizFrage
 class QuizFrageCreate(BaseModel):
     frage: str
@@ -113,6 +236,11 @@ class QuizFrageUpdate(BaseModel):
     Antwort: Optional[str] = None
     Erklaerung: Optional[str] = None
     quiz_session_id: Optional[int] = None
+    version: Optional[int] = None
+
+
+class QuizFrageBatchUpdate(QuizFrageUpdate):
+    id: int
 
 
 class QuizFrageResponse(BaseModel):
@@ -121,6 +249,195 @@ class QuizFrageResponse(BaseModel):
     Antwort: str
     Erklaerung: str
     quiz_session_id: int
+    version: int
+
+    class Config:
+        from_attributes = True
+
+
+class QuizFrageSeite(BaseModel):
+    eintraege: List[QuizFrageResponse]
+    naechster_cursor: Optional[int] = None
+
+
+# Zusammengesetzte Antworten (Elternobjekt mit Kindern)
+class NotizVollstaendig(NotizResponse):
+    kiAntworten: List[KiAntwortResponse] = Field(default_factory=list)
+    dateien: List[DateiResponse] = Field(default_factory=list)
+
+
+class NotizVollstaendigSeite(BaseModel):
+    eintraege: List[NotizVollstaendig]
+    naechster_cursor: Optional[int] = None
+
+
+class QuizSessionVollstaendig(QuizSessionResponse):
+    fragen: List[QuizFrageResponse] = Field(default_factory=list)
+    dateien: List[DateiResponse] = Field(default_factory=list)
+
+
+class QuizSessionVollstaendigSeite(BaseModel):
+    eintraege: List[QuizSessionVollstaendig]
+    naechster_cursor: Optional[int] = None
+
+
+# Batch-Operationen
+MAX_BATCH_GROESSE = 5000
+
+
+class BatchIds(BaseModel):
+    ids: List[int] = Field(max_length=MAX_BATCH_GROESSE)
+
+
+class LoeschErgebnis(BaseModel):
+    geloescht: int
+
+
+class VerknuepfungsErgebnis(BaseModel):
+    anzahl: int
+
+
+# Volltextsuche
+class SuchTreffer(BaseModel):
+    typ: Literal["datei", "notiz", "kiantwort", "quizfrage"]
+    id: int
+    ausschnitt: str
+    rang: float
+
+
+class SuchErgebnis(BaseModel):
+    treffer: List[SuchTreffer]
+    naechster_offset: Optional[int] = None
+
+
+# Ähnlichkeitssuche (Vektorindex)
+class AehnlicheQuizFrage(QuizFrageResponse):
+    aehnlichkeit: float
+
+
+class AehnlicheKiAntwort(KiAntwortResponse):
+    aehnlichkeit: float
+
+
+# Je Frage des Batches (index): die ähnlichste vorhandene Frage bzw. die
+# ähnlichste frühere Frage des Batches, falls über der Schwelle
+class DuplikatPruefung(BaseModel):
+    index: int
+    duplikat_von: Optional[int] = None
+    duplikat_im_batch: Optional[int] = None
+    aehnlichkeit: Optional[float] = None
+
+
+class QuizFragenBatchIds(BatchIds):
+    uebersprungen: List[DuplikatPruefung] = Field(default_factory=list)
+
+
+# Verteiltes Wiederholen (SM-2)
+class QuizBewertung(BaseModel):
+    # 0 = keine Ahnung ... 5 = sofort gewusst; unter 3 gilt als nicht gewusst
+    bewertung: int = Field(ge=0, le=5)
+
+
+class WiederholungsStand(BaseModel):
+    quiz_frage_id: int
+    quiz_session_id: int
+    faellig: datetime
+    ease: float
+    intervall: float
+    wiederholungen: int
+    fehlversuche: int
+    bewertungen: int
+    letzte_bewertung: Optional[int] = None
+    zuletzt: Optional[datetime] = None
+
+
+class FaelligeQuizFrage(BaseModel):
+    frage: QuizFrageResponse
+    wiederholung: WiederholungsStand
+
+
+# Antwortversuche
+class QuizVersuchCreate(BaseModel):
+    quiz_frage_id: int
+    antwort: Optional[str] = None
+    richtig: Optional[bool] = None
+    dauer_ms: Optional[int] = Field(None, ge=0)
+    # Ohne Angabe der Zeitpunkt des Eingangs
+    zeitpunkt: Optional[datetime] = None
+
+
+class QuizVersuchResponse(BaseModel):
+    id: int
+    quiz_frage_id: int
+    antwort: Optional[str] = None
+    richtig: Optional[bool] = None
+    dauer_ms: Optional[int] = None
+    zeitpunkt: datetime
 
     class Config:
         from_attributes = True
+
+
+class QuizVersuchSeite(BaseModel):
+    eintraege: List[QuizVersuchResponse]
+    naechster_cursor: Optional[int] = None
+
+
+class VersucheAngenommen(BaseModel):
+    angenommen: int
+
+
+# Lernstatistiken
+class StatistikGesamt(BaseModel):
+    dateien: int
+    notizen: int
+    kiantworten: int
+    quiz_sessions: int
+    quiz_fragen: int
+    quiz_versuche: int
+    quiz_versuche_richtig: int
+
+
+class QuizSessionStatistik(BaseModel):
+    quiz_session_id: int
+    fragen: int
+    versuche: int
+    richtig: int
+    # Anteil richtiger Versuche; None ohne Versuche
+    genauigkeit: Optional[float] = None
+
+
+class NotizStatistik(BaseModel):
+    notiz_id: int
+    kiantworten: int
+    dateien: int
+
+
+class ModulStatistik(BaseModel):
+    modul: str
+    dateien: int
+    quiz_sessions: int
+    fragen: int
+    versuche: int
+    richtig: int
+    genauigkeit: Optional[float] = None
+
+
+# Langsame Abfragen (abfrageProfil.py), je normalisierter Anweisung
+class LangsameAbfrage(BaseModel):
+    sql: str
+    anzahl: int
+    gesamt_ms: float
+    max_ms: float
+    mittel_ms: float
+    # Parameter der langsamsten Ausführung, gekürzt
+    parameter: Optional[str] = None
+    routen: List[str]
+    plan: List[str]
+    scan: bool
+
+
+# Export/Import
+class ImportErgebnis(BaseModel):
+    importiert: Dict[str, int]
+    id_versatz: Dict[str, int]
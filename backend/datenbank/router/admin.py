@@ -0,0 +1,21 @@
+from typing import List, Literal
+from fastapi import APIRouter, Query
+from ..abfrageProfil import abfrage_profil
+from ..pydanticModelle import LangsameAbfrage, LoeschErgebnis
+
+router = APIRouter()
+
+
+# Die langsamsten SQL-Anweisungen seit dem Start bzw. dem letzten Leeren,
+# sortiert nach Höchstdauer, Gesamtdauer oder Anzahl
+@router.get("/langsame-abfragen", response_model=List[LangsameAbfrage])
+async def get_langsame_abfragen_endpoint(
+    limit: int = Query(20, ge=1, le=500),
+    sortierung: Literal["max", "gesamt", "anzahl"] = "max",
+):
+    return abfrage_profil.langsamste(limit, sortierung)
+
+
+@router.delete("/langsame-abfragen", response_model=LoeschErgebnis)
+async def delete_langsame_abfragen_endpoint():
+    return {"geloescht": abfrage_profil.leeren()}
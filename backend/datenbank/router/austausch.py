@@ -0,0 +1,47 @@
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from ..datenbank import SessionLocal, engine, lese_engine
+from ..antwortCache import antwort_cache
+from ..austausch import ImportFehler, NdjsonImport, exportiere
+from ..vektorIndex import vektor_index
+from ..pydanticModelle import ImportErgebnis
+
+router = APIRouter()
+
+
+@router.get("/export")
+async def export_endpoint(gzip: bool = Query(False)):
+    dateiname = "lernassistent.ndjson.gz" if gzip else "lernassistent.ndjson"
+    return StreamingResponse(
+        exportiere(lese_engine, komprimiert=gzip),
+        media_type="application/gzip" if gzip else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{dateiname}"'},
+    )
+
+
+# Der Body wird stückweise gelesen und verarbeitet, nie vollständig im Speicher
+# gehalten. Der Import läuft in einer Transaktion: bei einem Fehler bleibt die
+# Datenbank unverändert.
+@router.post("/import", response_model=ImportErgebnis)
+async def import_endpoint(request: Request):
+    importer = NdjsonImport(engine)
+    await run_in_threadpool(importer.beginne)
+    try:
+        async for stueck in request.stream():
+            await run_in_threadpool(importer.verarbeite, stueck)
+        ergebnis = await run_in_threadpool(importer.abschliessen)
+    except ImportFehler as fehler:
+        await run_in_threadpool(importer.abbrechen)
+        raise HTTPException(status_code=400, detail=str(fehler))
+    except BaseException:
+        await run_in_threadpool(importer.abbrechen)
+        raise
+    antwort_cache.leeren()
+    await run_in_threadpool(_vektor_index_abgleichen)
+    return ergebnis
+
+
+def _vektor_index_abgleichen():
+    with SessionLocal() as db:
+        vektor_index.abgleichen(db)
@@ -1,53 +1,236 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from ..datenbank import get_db
-from ..crud import (
+import os
+from typing import List, Optional
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse
+from starlette.concurrency import run_in_threadpool
+from ..datenbank import DbSession, get_db, get_lese_db
+from ..crudAsync import (
     create_datei,
     get_datei,
     get_dateien,
+    get_dateien_facetten,
     update_datei,
     delete_datei,
     get_notizen_fuer_datei,
     get_quiz_sessions_fuer_datei,
+    create_dateien_batch,
+    update_dateien_batch,
+    delete_dateien_batch,
+    delete_dateien_gefiltert,
+    create_datei_mit_inhalt,
+    set_datei_inhalt,
+    get_datei_extraktion,
+    get_datei_abschnitte,
 )
-from ..pydanticModelle import DateiCreate, DateiResponse, DateiUpdate, NotizResponse, QuizSessionResponse
+from ..antwortCache import etag_passt
+from ..dateiSpeicher import Upload, blob_pfad, ist_sha256
+from ..versionierung import if_match_version, setze_etag
+from ..pydanticModelle import MAX_BATCH_GROESSE, AbschnittSeite, BatchIds, LoeschErgebnis, DateiBatchUpdate, DateiFacettenSeite, DateiCreate, DateiResponse, DateiSeite, DateiUpdate, ExtraktionStatus, NotizResponse, QuizSessionResponse
 
 
 router = APIRouter()
 
 @router.post("/", response_model=DateiResponse)
-def create_datei_endpoint(payload: DateiCreate, db: Session = Depends(get_db)):
-    return create_datei(db, payload)
+async def create_datei_endpoint(payload: DateiCreate, db: DbSession = Depends(get_db)):
+    return await create_datei(db, payload)
 
-@router.get("/", response_model=list[DateiResponse])
-def get_dateien_endpoint(db: Session = Depends(get_db)):
-    return get_dateien(db)
+@router.post("/batch", response_model=BatchIds)
+async def create_dateien_batch_endpoint(
+    payload: List[DateiCreate] = Body(..., min_length=1, max_length=MAX_BATCH_GROESSE),
+    db: DbSession = Depends(get_db),
+):
+    return {"ids": await create_dateien_batch(db, payload)}
+
+@router.put("/batch", response_model=BatchIds)
+async def update_dateien_batch_endpoint(
+    payload: List[DateiBatchUpdate] = Body(..., min_length=1, max_length=MAX_BATCH_GROESSE),
+    db: DbSession = Depends(get_db),
+):
+    ids, fehlend = await update_dateien_batch(db, payload)
+    if fehlend:
+        raise HTTPException(status_code=404, detail=f"Dateien nicht gefunden: {fehlend}")
+    return {"ids": ids}
+
+@router.post("/batch/loeschen", response_model=BatchIds)
+async def delete_dateien_batch_endpoint(payload: BatchIds, db: DbSession = Depends(get_db)):
+    ids, fehlend = await delete_dateien_batch(db, payload.ids)
+    if fehlend:
+        raise HTTPException(status_code=404, detail=f"Dateien nicht gefunden: {fehlend}")
+    return {"ids": ids}
+
+@router.delete("/", response_model=LoeschErgebnis)
+async def delete_dateien_gefiltert_endpoint(
+    dateiart: Optional[str] = None,
+    dozent: Optional[str] = None,
+    semester: Optional[str] = None,
+    modul: Optional[str] = None,
+    db: DbSession = Depends(get_db),
+):
+    if dateiart is None and dozent is None and semester is None and modul is None:
+        raise HTTPException(status_code=400, detail="Mindestens ein Filter erforderlich")
+    geloescht = await delete_dateien_gefiltert(db, dateiart=dateiart, dozent=dozent, semester=semester, modul=modul)
+    return {"geloescht": geloescht}
+
+@router.get("/", response_model=DateiSeite)
+async def get_dateien_endpoint(
+    limit: int = Query(50, ge=1, le=500),
+    after: Optional[int] = None,
+    dateiart: Optional[str] = None,
+    dozent: Optional[str] = None,
+    semester: Optional[str] = None,
+    modul: Optional[str] = None,
+    db: DbSession = Depends(get_lese_db),
+):
+    return await get_dateien(db, limit, after, dateiart=dateiart, dozent=dozent, semester=semester, modul=modul)
+
+# Wie GET /, zusätzlich Anzahl Dateien je dateiart, dozent, semester und modul
+@router.get("/facetten", response_model=DateiFacettenSeite)
+async def get_dateien_facetten_endpoint(
+    limit: int = Query(50, ge=1, le=500),
+    after: Optional[int] = None,
+    dateiart: Optional[str] = None,
+    dozent: Optional[str] = None,
+    semester: Optional[str] = None,
+    modul: Optional[str] = None,
+    db: DbSession = Depends(get_lese_db),
+):
+    return await get_dateien_facetten(db, limit, after, dateiart=dateiart, dozent=dozent, semester=semester, modul=modul)
+
+# Der Body wird stückweise in den Speicher geschrieben und dabei gehasht,
+# nie vollständig im Arbeitsspeicher gehalten (wie beim Import).
+async def _empfange(request: Request):
+    upload = Upload(request.headers.get("content-type"))
+    try:
+        await run_in_threadpool(upload.beginne)
+        async for stueck in request.stream():
+            await run_in_threadpool(upload.verarbeite, stueck)
+        sha256 = await run_in_threadpool(upload.abschliessen)
+    except ValueError as fehler:
+        await run_in_threadpool(upload.abbrechen)
+        raise HTTPException(status_code=getattr(fehler, "status_code", 400), detail=str(fehler))
+    except BaseException:
+        await run_in_threadpool(upload.abbrechen)
+        raise
+    return upload, sha256
+
+
+# multipart/form-data mit der Datei und optional titel, pfad, dateiart, dozent,
+# semester, modul; titel und pfad sind sonst der Dateiname
+@router.post("/hochladen", response_model=DateiResponse)
+async def hochladen_endpoint(request: Request, db: DbSession = Depends(get_db)):
+    if not request.headers.get("content-type", "").startswith("multipart/form-data"):
+        raise HTTPException(status_code=415, detail="multipart/form-data erwartet")
+    upload, sha256 = await _empfange(request)
+    try:
+        felder = {"titel": upload.dateiname, "pfad": upload.dateiname, **upload.felder}
+        return await create_datei_mit_inhalt(db, DateiCreate(**felder), upload, sha256)
+    finally:
+        await run_in_threadpool(upload.abbrechen)
 
 @router.get("/{datei_id}", response_model=DateiResponse)
-def get_datei_endpoint(datei_id: int, db: Session = Depends(get_db)):
-    datei = get_datei(db, datei_id)
+async def get_datei_endpoint(datei_id: int, response: Response, db: DbSession = Depends(get_lese_db)):
+    datei = await get_datei(db, datei_id)
     if not datei:
         raise HTTPException(status_code=404, detail="Datei nicht gefunden")
+    setze_etag(response, datei)
     return datei
 
+# PUT und PATCH ändern nur die übergebenen Felder
 @router.put("/{datei_id}", response_model=DateiResponse)
-def update_datei_endpoint(datei_id: int, payload: DateiUpdate, db: Session = Depends(get_db)):
-    updated = update_datei(db, datei_id, payload)
+@router.patch("/{datei_id}", response_model=DateiResponse)
+async def update_datei_endpoint(
+    datei_id: int,
+    payload: DateiUpdate,
+    response: Response,
+    version: Optional[int] = Depends(if_match_version),
+    db: DbSession = Depends(get_db),
+):
+    updated = await update_datei(db, datei_id, payload, version)
     if not updated:
         raise HTTPException(status_code=404, detail="Datei nicht gefunden")
+    setze_etag(response, updated)
     return updated
 
 @router.delete("/{datei_id}", response_model=DateiResponse)
-def delete_datei_endpoint(datei_id: int, db: Session = Depends(get_db)):
-    deleted = delete_datei(db, datei_id)
+async def delete_datei_endpoint(datei_id: int, db: DbSession = Depends(get_db)):
+    deleted = await delete_datei(db, datei_id)
     if not deleted:
         raise HTTPException(status_code=404, detail="Datei nicht gefunden")
     return deleted
 
+# Ersetzt den Inhalt einer Datei: multipart/form-data oder der Inhalt direkt
+# als Body (Content-Type wird übernommen)
+@router.put("/{datei_id}/inhalt", response_model=DateiResponse)
+async def set_datei_inhalt_endpoint(
+    datei_id: int,
+    request: Request,
+    response: Response,
+    version: Optional[int] = Depends(if_match_version),
+    db: DbSession = Depends(get_db),
+):
+    upload, sha256 = await _empfange(request)
+    try:
+        updated = await set_datei_inhalt(db, datei_id, upload, sha256, version)
+    finally:
+        await run_in_threadpool(upload.abbrechen)
+    if not updated:
+        raise HTTPException(status_code=404, detail="Datei nicht gefunden")
+    setze_etag(response, updated)
+    return updated
+
+# Liefert den Inhalt mit dem SHA-256 als ETag; Range-Anfragen und die
+# Übertragung per sendfile (http.response.pathsend) übernimmt FileResponse
+@router.get("/{datei_id}/inhalt")
+async def get_datei_inhalt_endpoint(datei_id: int, request: Request, db: DbSession = Depends(get_lese_db)):
+    datei = await get_datei(db, datei_id)
+    if not datei:
+        raise HTTPException(status_code=404, detail="Datei nicht gefunden")
+    if not datei.inhalt_sha256:
+        raise HTTPException(status_code=404, detail="Kein Inhalt hochgeladen")
+    if not ist_sha256(datei.inhalt_sha256):
+        raise HTTPException(status_code=404, detail="Inhalt fehlt im Speicher")
+    etag = f'"{datei.inhalt_sha256}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_passt(request, etag):
+        return Response(status_code=304, headers=headers)
+    pfad = blob_pfad(datei.inhalt_sha256)
+    try:
+        stat = await run_in_threadpool(os.stat, pfad)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Inhalt fehlt im Speicher")
+    return FileResponse(
+        pfad,
+        headers=headers,
+        media_type=datei.inhalt_typ or "application/octet-stream",
+        filename=os.path.basename(datei.pfad) or None,
+        stat_result=stat,
+        content_disposition_type="inline",
+    )
+
+# Stand der Textextraktion: wartend, fertig, fehler oder nicht_unterstuetzt
+@router.get("/{datei_id}/extraktion", response_model=ExtraktionStatus)
+async def get_datei_extraktion_endpoint(datei_id: int, db: DbSession = Depends(get_lese_db)):
+    stand = await get_datei_extraktion(db, datei_id)
+    if stand is None:
+        raise HTTPException(status_code=404, detail="Datei nicht gefunden oder ohne Inhalt")
+    return stand
+
+@router.get("/{datei_id}/abschnitte", response_model=AbschnittSeite)
+async def get_datei_abschnitte_endpoint(
+    datei_id: int,
+    limit: int = Query(20, ge=1, le=200),
+    after: Optional[int] = None,
+    db: DbSession = Depends(get_lese_db),
+):
+    seite = await get_datei_abschnitte(db, datei_id, limit, after)
+    if seite is None:
+        raise HTTPException(status_code=404, detail="Datei nicht gefunden oder ohne Inhalt")
+    return seite
+
 @router.get("/{datei_id}/notizen", response_model=list[NotizResponse])
-def get_notizen_fuer_datei_endpoint(datei_id: int, db: Session = Depends(get_db)):
-    return get_notizen_fuer_datei(db, datei_id)
+async def get_notizen_fuer_datei_endpoint(datei_id: int, db: DbSession = Depends(get_lese_db)):
+    return await get_notizen_fuer_datei(db, datei_id)
 
 @router.get("/{datei_id}/quiz-sessions", response_model=list[QuizSessionResponse])
-def get_quiz_sessions_fuer_datei_endpoint(datei_id: int, db: Session = Depends(get_db)):
-    return get_quiz_sessions_fuer_datei(db, datei_id)
+async def get_quiz_sessions_fuer_datei_endpoint(datei_id: int, db: DbSession = Depends(get_lese_db)):
+    return await get_quiz_sessions_fuer_datei(db, datei_id)
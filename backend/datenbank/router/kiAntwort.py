@@ -1,55 +1,137 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from ..datenbank import get_db
-from ..crud import (
+from typing import List, Optional
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Response
+from ..datenbank import DbSession, get_db, get_lese_db
+from ..crudAsync import (
     create_kiantwort,
     get_kiantwort,
     get_kiantworten,
     update_kiantwort,
     delete_kiantwort,
+    verschiebe_kiantwort,
     get_kiantworten_fuer_notiz,
+    create_kiantworten_batch,
+    update_kiantworten_batch,
+    delete_kiantworten_batch,
+    get_aehnliche_kiantworten,
 )
-from ..pydanticModelle import KiAntwortCreate, KiAntwortResponse, KiAntwortUpdate
+from ..vektorIndex import vektor_index
+from ..versionierung import if_match_version, setze_etag
+from ..pydanticModelle import MAX_BATCH_GROESSE, AehnlicheKiAntwort, BatchIds, KiAntwortBatchUpdate, KiAntwortCreate, KiAntwortResponse, KiAntwortSeite, KiAntwortUpdate, KiAntwortVerschieben
 
 router = APIRouter()
 
 
 @router.post("/", response_model=KiAntwortResponse)
-def create_kiantwort_endpoint(payload: KiAntwortCreate, db: Session = Depends(get_db)):
-    return create_kiantwort(db, payload)
+async def create_kiantwort_endpoint(payload: KiAntwortCreate, db: DbSession = Depends(get_db)):
+    return await create_kiantwort(db, payload)
 
 
-@router.get("/", response_model=list[KiAntwortResponse])
-def get_kiantworten_endpoint(db: Session = Depends(get_db)):
-    return get_kiantworten(db)
+@router.post("/batch", response_model=BatchIds)
+async def create_kiantworten_batch_endpoint(
+    payload: List[KiAntwortCreate] = Body(..., min_length=1, max_length=MAX_BATCH_GROESSE),
+    db: DbSession = Depends(get_db),
+):
+    ids, fehlend = await create_kiantworten_batch(db, payload)
+    if fehlend:
+        raise HTTPException(status_code=404, detail=f"Notizen nicht gefunden: {fehlend}")
+    return {"ids": ids}
+
+
+@router.put("/batch", response_model=BatchIds)
+async def update_kiantworten_batch_endpoint(
+    payload: List[KiAntwortBatchUpdate] = Body(..., min_length=1, max_length=MAX_BATCH_GROESSE),
+    db: DbSession = Depends(get_db),
+):
+    ids, fehlend = await update_kiantworten_batch(db, payload)
+    if fehlend:
+        raise HTTPException(status_code=404, detail=f"KI-Antworten oder Notizen nicht gefunden: {fehlend}")
+    return {"ids": ids}
+
+
+@router.post("/batch/loeschen", response_model=BatchIds)
+async def delete_kiantworten_batch_endpoint(payload: BatchIds, db: DbSession = Depends(get_db)):
+    ids, fehlend = await delete_kiantworten_batch(db, payload.ids)
+    if fehlend:
+        raise HTTPException(status_code=404, detail=f"KI-Antworten nicht gefunden: {fehlend}")
+    return {"ids": ids}
+
+
+@router.get("/", response_model=KiAntwortSeite)
+async def get_kiantworten_endpoint(
+    limit: int = Query(50, ge=1, le=500),
+    after: Optional[int] = None,
+    notiz_id: Optional[int] = None,
+    typ: Optional[str] = None,
+    db: DbSession = Depends(get_lese_db),
+):
+    return await get_kiantworten(db, limit, after, notiz_id=notiz_id, typ=typ)
 
 
 @router.get("/{kiantwort_id}", response_model=KiAntwortResponse)
-def get_kiantwort_endpoint(kiantwort_id: int, db: Session = Depends(get_db)):
-    kiantwort = get_kiantwort(db, kiantwort_id)
+async def get_kiantwort_endpoint(kiantwort_id: int, response: Response, db: DbSession = Depends(get_lese_db)):
+    kiantwort = await get_kiantwort(db, kiantwort_id)
     if not kiantwort:
         raise HTTPException(status_code=404, detail="KI-Antwort nicht gefunden")
+    setze_etag(response, kiantwort)
     return kiantwort
 
 
+@router.get("/{kiantwort_id}/aehnliche", response_model=List[AehnlicheKiAntwort])
+async def get_aehnliche_kiantworten_endpoint(
+    kiantwort_id: int,
+    k: int = Query(10, ge=1, le=100),
+    min_aehnlichkeit: float = Query(0.0, ge=-1.0, le=1.0),
+    db: DbSession = Depends(get_lese_db),
+):
+    if not vektor_index.aktiv:
+        raise HTTPException(status_code=503, detail="Vektorindex ist nicht aktiv")
+    treffer = await get_aehnliche_kiantworten(db, kiantwort_id, k, min_aehnlichkeit)
+    if treffer is None:
+        raise HTTPException(status_code=404, detail="KI-Antwort nicht gefunden")
+    return treffer
+
+
+# PUT und PATCH ändern nur die übergebenen Felder
 @router.put("/{kiantwort_id}", response_model=KiAntwortResponse)
-def update_kiantwort_endpoint(
-    kiantwort_id: int, payload: KiAntwortUpdate, db: Session = Depends(get_db)
+@router.patch("/{kiantwort_id}", response_model=KiAntwortResponse)
+async def update_kiantwort_endpoint(
+    kiantwort_id: int,
+    payload: KiAntwortUpdate,
+    response: Response,
+    version: Optional[int] = Depends(if_match_version),
+    db: DbSession = Depends(get_db),
 ):
-    updated = update_kiantwort(db, kiantwort_id, payload)
+    updated = await update_kiantwort(db, kiantwort_id, payload, version)
     if not updated:
         raise HTTPException(status_code=404, detail="KI-Antwort nicht gefunden")
+    setze_etag(response, updated)
     return updated
 
 
+# Vor oder hinter eine andere KI-Antwort setzen (ggf. in deren Notiz)
+@router.post("/{kiantwort_id}/verschieben", response_model=KiAntwortResponse)
+async def verschiebe_kiantwort_endpoint(
+    kiantwort_id: int,
+    payload: KiAntwortVerschieben,
+    response: Response,
+    version: Optional[int] = Depends(if_match_version),
+    db: DbSession = Depends(get_db),
+):
+    verschoben = await verschiebe_kiantwort(db, kiantwort_id, payload.vor, payload.nach, version)
+    if not verschoben:
+        raise HTTPException(status_code=404, detail="KI-Antwort nicht gefunden")
+    setze_etag(response, verschoben)
+    return verschoben
+
+
 @router.delete("/{kiantwort_id}", response_model=KiAntwortResponse)
-def delete_kiantwort_endpoint(kiantwort_id: int, db: Session = Depends(get_db)):
-    deleted = delete_kiantwort(db, kiantwort_id)
+async def delete_kiantwort_endpoint(kiantwort_id: int, db: DbSession = Depends(get_db)):
+    deleted = await delete_kiantwort(db, kiantwort_id)
     if not deleted:
         raise HTTPException(status_code=404, detail="KI-Antwort nicht gefunden")
     return deleted
 
 
 @router.get("/notiz/{notiz_id}", response_model=list[KiAntwortResponse])
-def get_kiantworten_fuer_notiz_endpoint(notiz_id: int, db: Session = Depends(get_db)):
-    return get_kiantworten_fuer_notiz(db, notiz_id)
+async def get_kiantworten_fuer_notiz_endpoint(notiz_id: int, db: DbSession = Depends(get_lese_db)):
+    return await get_kiantworten_fuer_notiz(db, notiz_id)
@@ -0,0 +1,25 @@
+from fastapi import APIRouter, Depends, HTTPException
+from ..datenbank import DbSession, get_db, get_lese_db
+from ..crudAsync import create_ki_auftrag, get_ki_auftrag
+from ..kiGenerierung import MAX_WARTEND, ki_generierung
+from ..pydanticModelle import KiAuftragCreate, KiAuftragResponse
+
+router = APIRouter()
+
+
+# Legt einen Auftrag an und antwortet sofort; den Fortschritt liefert GET /{id}
+@router.post("/", response_model=KiAuftragResponse, status_code=202)
+async def create_ki_auftrag_endpoint(payload: KiAuftragCreate, db: DbSession = Depends(get_db)):
+    auftrag = await create_ki_auftrag(db, payload, MAX_WARTEND)
+    if auftrag is None:
+        raise HTTPException(status_code=503, detail="Zu viele wartende KI-Aufträge", headers={"Retry-After": "5"})
+    ki_generierung.wecke()
+    return auftrag
+
+
+@router.get("/{auftrag_id}", response_model=KiAuftragResponse)
+async def get_ki_auftrag_endpoint(auftrag_id: int, db: DbSession = Depends(get_lese_db)):
+    auftrag = await get_ki_auftrag(db, auftrag_id)
+    if not auftrag:
+        raise HTTPException(status_code=404, detail="KI-Auftrag nicht gefunden")
+    return auftrag
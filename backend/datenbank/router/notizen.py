@@ -1,79 +1,186 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from ..datenbank import get_db
-from ..crud import (
+from typing import List, Literal, Optional
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Response
+from ..datenbank import DbSession, get_db, get_lese_db
+from ..crudAsync import (
     create_notiz,
     get_notiz,
     get_notizen,
     update_notiz,
     delete_notiz,
+    get_label_facetten,
     get_dateien_fuer_notiz,
     get_kiantworten_fuer_notiz,
     link_datei_zu_notiz,
     unlink_datei_von_notiz,
+    link_dateien_zu_notiz,
+    unlink_dateien_von_notiz,
+    create_notizen_batch,
+    update_notizen_batch,
+    delete_notizen_batch,
+    get_notiz_vollstaendig,
+    get_notizen_vollstaendig,
+    delete_notizen_fuer_datei,
 )
-from ..pydanticModelle import NotizCreate, NotizResponse, NotizUpdate, DateiResponse, KiAntwortResponse
+from ..versionierung import if_match_version, setze_etag
+from ..pydanticModelle import LabelFacette, VerknuepfungsErgebnis, MAX_BATCH_GROESSE, BatchIds, LoeschErgebnis, NotizBatchUpdate, NotizCreate, NotizResponse, NotizSeite, NotizUpdate, NotizVollstaendig, NotizVollstaendigSeite, DateiResponse, KiAntwortResponse
 
 router = APIRouter()
 
 
 @router.post("/", response_model=NotizResponse)
-def create_notiz_endpoint(payload: NotizCreate, db: Session = Depends(get_db)):
-    return create_notiz(db, payload)
+async def create_notiz_endpoint(payload: NotizCreate, db: DbSession = Depends(get_db)):
+    return await create_notiz(db, payload)
 
 
-@router.get("/", response_model=list[NotizResponse])
-def get_notizen_endpoint(db: Session = Depends(get_db)):
-    return get_notizen(db)
+@router.post("/batch", response_model=BatchIds)
+async def create_notizen_batch_endpoint(
+    payload: List[NotizCreate] = Body(..., min_length=1, max_length=MAX_BATCH_GROESSE),
+    db: DbSession = Depends(get_db),
+):
+    return {"ids": await create_notizen_batch(db, payload)}
+
+
+@router.put("/batch", response_model=BatchIds)
+async def update_notizen_batch_endpoint(
+    payload: List[NotizBatchUpdate] = Body(..., min_length=1, max_length=MAX_BATCH_GROESSE),
+    db: DbSession = Depends(get_db),
+):
+    ids, fehlend = await update_notizen_batch(db, payload)
+    if fehlend:
+        raise HTTPException(status_code=404, detail=f"Notizen nicht gefunden: {fehlend}")
+    return {"ids": ids}
+
+
+@router.post("/batch/loeschen", response_model=BatchIds)
+async def delete_notizen_batch_endpoint(payload: BatchIds, db: DbSession = Depends(get_db)):
+    ids, fehlend = await delete_notizen_batch(db, payload.ids)
+    if fehlend:
+        raise HTTPException(status_code=404, detail=f"Notizen nicht gefunden: {fehlend}")
+    return {"ids": ids}
+
+
+# Löscht alle Notizen, die mit der Datei verknüpft sind, samt KI-Antworten
+@router.delete("/", response_model=LoeschErgebnis)
+async def delete_notizen_gefiltert_endpoint(datei_id: int = Query(...), db: DbSession = Depends(get_db)):
+    return {"geloescht": await delete_notizen_fuer_datei(db, datei_id)}
+
+
+# label=fach:Mathematik&label=tags:Vektoren, mehrfach angebbar;
+# label_modus=und (alle Labels) oder oder (mindestens eins)
+@router.get("/", response_model=NotizSeite)
+async def get_notizen_endpoint(
+    limit: int = Query(50, ge=1, le=500),
+    after: Optional[int] = None,
+    datei_id: Optional[int] = None,
+    label: Optional[List[str]] = Query(None),
+    label_modus: Literal["und", "oder"] = "und",
+    db: DbSession = Depends(get_lese_db),
+):
+    return await get_notizen(db, limit, after, datei_id=datei_id, labels=label, label_modus=label_modus)
+
+
+@router.get("/vollstaendig", response_model=NotizVollstaendigSeite)
+async def get_notizen_vollstaendig_endpoint(
+    limit: int = Query(50, ge=1, le=500),
+    after: Optional[int] = None,
+    datei_id: Optional[int] = None,
+    label: Optional[List[str]] = Query(None),
+    label_modus: Literal["und", "oder"] = "und",
+    db: DbSession = Depends(get_lese_db),
+):
+    return await get_notizen_vollstaendig(db, limit, after, datei_id=datei_id, labels=label, label_modus=label_modus)
+
+
+@router.get("/facetten", response_model=List[LabelFacette])
+async def get_label_facetten_endpoint(
+    schluessel: Optional[str] = None,
+    label: Optional[List[str]] = Query(None),
+    label_modus: Literal["und", "oder"] = "und",
+    limit: int = Query(100, ge=1, le=1000),
+    db: DbSession = Depends(get_lese_db),
+):
+    return await get_label_facetten(db, schluessel, label, label_modus, limit)
 
 
 @router.get("/{notiz_id}", response_model=NotizResponse)
-def get_notiz_endpoint(notiz_id: int, db: Session = Depends(get_db)):
-    notiz = get_notiz(db, notiz_id)
+async def get_notiz_endpoint(notiz_id: int, response: Response, db: DbSession = Depends(get_lese_db)):
+    notiz = await get_notiz(db, notiz_id)
     if not notiz:
         raise HTTPException(status_code=404, detail="Notiz nicht gefunden")
+    setze_etag(response, notiz)
     return notiz
 
 
+# PUT und PATCH ändern nur die übergebenen Felder
 @router.put("/{notiz_id}", response_model=NotizResponse)
-def update_notiz_endpoint(
-    notiz_id: int, payload: NotizUpdate, db: Session = Depends(get_db)
+@router.patch("/{notiz_id}", response_model=NotizResponse)
+async def update_notiz_endpoint(
+    notiz_id: int,
+    payload: NotizUpdate,
+    response: Response,
+    version: Optional[int] = Depends(if_match_version),
+    db: DbSession = Depends(get_db),
 ):
-    updated = update_notiz(db, notiz_id, payload)
+    updated = await update_notiz(db, notiz_id, payload, version)
     if not updated:
         raise HTTPException(status_code=404, detail="Notiz nicht gefunden")
+    setze_etag(response, updated)
     return updated
 
 
 @router.delete("/{notiz_id}", response_model=NotizResponse)
-def delete_notiz_endpoint(notiz_id: int, db: Session = Depends(get_db)):
-    deleted = delete_notiz(db, notiz_id)
+async def delete_notiz_endpoint(notiz_id: int, db: DbSession = Depends(get_db)):
+    deleted = await delete_notiz(db, notiz_id)
     if not deleted:
         raise HTTPException(status_code=404, detail="Notiz nicht gefunden")
     return deleted
 
 @router.get("/{notiz_id}/dateien", response_model=list[DateiResponse])
-def get_dateien_fuer_notiz_endpoint(notiz_id: int, db: Session = Depends(get_db)):
-    return get_dateien_fuer_notiz(db, notiz_id)
+async def get_dateien_fuer_notiz_endpoint(notiz_id: int, db: DbSession = Depends(get_lese_db)):
+    return await get_dateien_fuer_notiz(db, notiz_id)
 
 @router.get("/{notiz_id}/kiantworten", response_model=list[KiAntwortResponse])
-def get_kiantworten_fuer_notiz_endpoint(notiz_id: int, db: Session = Depends(get_db)):
-    return get_kiantworten_fuer_notiz(db, notiz_id)
+async def get_kiantworten_fuer_notiz_endpoint(notiz_id: int, db: DbSession = Depends(get_lese_db)):
+    return await get_kiantworten_fuer_notiz(db, notiz_id)
+
+@router.get("/{notiz_id}/vollstaendig", response_model=NotizVollstaendig)
+async def get_notiz_vollstaendig_endpoint(notiz_id: int, db: DbSession = Depends(get_lese_db)):
+    notiz = await get_notiz_vollstaendig(db, notiz_id)
+    if not notiz:
+        raise HTTPException(status_code=404, detail="Notiz nicht gefunden")
+    return notiz
+
+# Verknüpft bzw. trennt mehrere Dateien mit einer Anweisung
+@router.post("/{notiz_id}/dateien", response_model=VerknuepfungsErgebnis)
+async def link_dateien_zu_notiz_endpoint(notiz_id: int, payload: BatchIds, db: DbSession = Depends(get_db)):
+    anzahl, fehlend = await link_dateien_zu_notiz(db, notiz_id, payload.ids)
+    if anzahl is None:
+        raise HTTPException(status_code=404, detail=f"Dateien nicht gefunden: {fehlend}" if fehlend else "Notiz nicht gefunden")
+    return {"anzahl": anzahl}
+
+
+@router.post("/{notiz_id}/dateien/loeschen", response_model=VerknuepfungsErgebnis)
+async def unlink_dateien_von_notiz_endpoint(notiz_id: int, payload: BatchIds, db: DbSession = Depends(get_db)):
+    anzahl = await unlink_dateien_von_notiz(db, notiz_id, payload.ids)
+    if anzahl is None:
+        raise HTTPException(status_code=404, detail="Notiz nicht gefunden")
+    return {"anzahl": anzahl}
+
 
 @router.post("/{notiz_id}/dateien/{datei_id}")
-def link_datei_zu_notiz_endpoint(
-    notiz_id: int, datei_id: int, db: Session = Depends(get_db)
+async def link_datei_zu_notiz_endpoint(
+    notiz_id: int, datei_id: int, db: DbSession = Depends(get_db)
 ):
-    result = link_datei_zu_notiz(db, notiz_id, datei_id)
+    result = await link_datei_zu_notiz(db, notiz_id, datei_id)
     if not result:
         raise HTTPException(status_code=404, detail="Notiz oder Datei nicht gefunden")
     return {"message": "Datei erfolgreich mit Notiz verknüpft"}
 
 @router.delete("/{notiz_id}/dateien/{datei_id}")
-def unlink_datei_von_notiz_endpoint(
-    notiz_id: int, datei_id: int, db: Session = Depends(get_db)
+async def unlink_datei_von_notiz_endpoint(
+    notiz_id: int, datei_id: int, db: DbSession = Depends(get_db)
 ):
-    result = unlink_datei_von_notiz(db, notiz_id, datei_id)
+    result = await unlink_datei_von_notiz(db, notiz_id, datei_id)
     if not result:
         raise HTTPException(status_code=404, detail="Notiz oder Datei nicht gefunden")
     return {"message": "Datei erfolgreich von Notiz getrennt"}
@@ -1,49 +1,201 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from ..datenbank import get_db
-from ..crud import (
+from datetime import datetime
+from typing import List, Literal, Optional
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Response
+from ..datenbank import DbSession, get_db, get_lese_db
+from ..crudAsync import (
     create_quiz_frage,
     get_quiz_frage,
     get_quiz_fragen,
     update_quiz_frage,
     delete_quiz_frage,
+    create_quiz_fragen_batch,
+    update_quiz_fragen_batch,
+    delete_quiz_fragen_batch,
+    get_aehnliche_quiz_fragen,
+    pruefe_quiz_fragen_duplikate,
+    get_wiederholung,
+    bewerte_quiz_frage,
+    get_naechste_quiz_fragen,
+)
+from ..vektorIndex import vektor_index
+from ..wiederholung import BewertungKonflikt
+from ..versionierung import if_match_version, setze_etag
+from ..pydanticModelle import (
+    MAX_BATCH_GROESSE,
+    AehnlicheQuizFrage,
+    BatchIds,
+    DuplikatPruefung,
+    FaelligeQuizFrage,
+    QuizBewertung,
+    QuizFragenBatchIds,
+    QuizFrageBatchUpdate,
+    QuizFrageCreate,
+    QuizFrageResponse,
+    QuizFrageSeite,
+    QuizFrageUpdate,
+    WiederholungsStand,
 )
-from ..pydanticModelle import QuizFrageCreate, QuizFrageResponse, QuizFrageUpdate
 
 router = APIRouter()
 
 
 @router.post("/", response_model=QuizFrageResponse)
-def create_quiz_frage_endpoint(payload: QuizFrageCreate, db: Session = Depends(get_db)):
-    return create_quiz_frage(db, payload)
+async def create_quiz_frage_endpoint(payload: QuizFrageCreate, db: DbSession = Depends(get_db)):
+    return await create_quiz_frage(db, payload)
+
+
+def _pruefe_vektor_index():
+    if not vektor_index.aktiv:
+        raise HTTPException(status_code=503, detail="Vektorindex ist nicht aktiv")
+
+
+# Mit duplikate=ueberspringen werden Fragen, die einer vorhandenen oder einer
+# früheren Frage des Batches mindestens zu schwelle ähneln, nicht angelegt
+@router.post("/batch", response_model=QuizFragenBatchIds)
+async def create_quiz_fragen_batch_endpoint(
+    payload: List[QuizFrageCreate] = Body(..., min_length=1, max_length=MAX_BATCH_GROESSE),
+    duplikate: Literal["erlauben", "ueberspringen"] = "erlauben",
+    schwelle: float = Query(0.9, ge=0.0, le=1.0),
+    db: DbSession = Depends(get_db),
+):
+    uebersprungen = []
+    if duplikate == "ueberspringen":
+        _pruefe_vektor_index()
+        pruefung = await pruefe_quiz_fragen_duplikate(db, payload, schwelle)
+        uebersprungen = [eintrag for eintrag in pruefung if eintrag["aehnlichkeit"] is not None]
+        payload = [frage for frage, eintrag in zip(payload, pruefung) if eintrag["aehnlichkeit"] is None]
+        if not payload:
+            return {"ids": [], "uebersprungen": uebersprungen}
+    ids, fehlend = await create_quiz_fragen_batch(db, payload)
+    if fehlend:
+        raise HTTPException(status_code=404, detail=f"Quiz-Sessions nicht gefunden: {fehlend}")
+    return {"ids": ids, "uebersprungen": uebersprungen}
+
+
+# Prüft einen Batch auf Duplikate, ohne etwas anzulegen
+@router.post("/batch/pruefen", response_model=List[DuplikatPruefung])
+async def pruefe_quiz_fragen_batch_endpoint(
+    payload: List[QuizFrageCreate] = Body(..., min_length=1, max_length=MAX_BATCH_GROESSE),
+    schwelle: float = Query(0.9, ge=0.0, le=1.0),
+    db: DbSession = Depends(get_lese_db),
+):
+    _pruefe_vektor_index()
+    return await pruefe_quiz_fragen_duplikate(db, payload, schwelle)
+
+
+@router.put("/batch", response_model=BatchIds)
+async def update_quiz_fragen_batch_endpoint(
+    payload: List[QuizFrageBatchUpdate] = Body(..., min_length=1, max_length=MAX_BATCH_GROESSE),
+    db: DbSession = Depends(get_db),
+):
+    ids, fehlend = await update_quiz_fragen_batch(db, payload)
+    if fehlend:
+        raise HTTPException(status_code=404, detail=f"Quiz-Fragen oder Quiz-Sessions nicht gefunden: {fehlend}")
+    return {"ids": ids}
+
+
+@router.post("/batch/loeschen", response_model=BatchIds)
+async def delete_quiz_fragen_batch_endpoint(payload: BatchIds, db: DbSession = Depends(get_db)):
+    ids, fehlend = await delete_quiz_fragen_batch(db, payload.ids)
+    if fehlend:
+        raise HTTPException(status_code=404, detail=f"Quiz-Fragen nicht gefunden: {fehlend}")
+    return {"ids": ids}
 
 
-@router.get("/", response_model=list[QuizFrageResponse])
-def get_quiz_fragen_endpoint(db: Session = Depends(get_db)):
-    return get_quiz_fragen(db)
+@router.get("/", response_model=QuizFrageSeite)
+async def get_quiz_fragen_endpoint(
+    limit: int = Query(50, ge=1, le=500),
+    after: Optional[int] = None,
+    quiz_session_id: Optional[int] = None,
+    db: DbSession = Depends(get_lese_db),
+):
+    return await get_quiz_fragen(db, limit, after, quiz_session_id=quiz_session_id)
+
+
+# Die nächsten fälligen Fragen (bis jetzt bzw. bis zum angegebenen Zeitpunkt)
+# einer Quiz-Session oder der mit den Dateien verknüpften Sessions, die am
+# längsten fälligen zuerst
+@router.get("/naechste", response_model=List[FaelligeQuizFrage])
+async def get_naechste_quiz_fragen_endpoint(
+    quiz_session_id: Optional[int] = None,
+    datei_id: Optional[List[int]] = Query(None),
+    limit: int = Query(20, ge=1, le=200),
+    bis: Optional[datetime] = None,
+    db: DbSession = Depends(get_lese_db),
+):
+    if (quiz_session_id is None) == (not datei_id):
+        raise HTTPException(status_code=400, detail="Genau eins von quiz_session_id und datei_id angeben")
+    naechste = await get_naechste_quiz_fragen(
+        db, quiz_session_id=quiz_session_id, datei_ids=datei_id, limit=limit, bis=int(bis.timestamp()) if bis else None
+    )
+    if naechste is None:
+        raise HTTPException(status_code=404, detail="Quiz-Session nicht gefunden")
+    return naechste
 
 
 @router.get("/{quiz_frage_id}", response_model=QuizFrageResponse)
-def get_quiz_frage_endpoint(quiz_frage_id: int, db: Session = Depends(get_db)):
-    quiz_frage = get_quiz_frage(db, quiz_frage_id)
+async def get_quiz_frage_endpoint(quiz_frage_id: int, response: Response, db: DbSession = Depends(get_lese_db)):
+    quiz_frage = await get_quiz_frage(db, quiz_frage_id)
     if not quiz_frage:
         raise HTTPException(status_code=404, detail="Quiz-Frage nicht gefunden")
+    setze_etag(response, quiz_frage)
     return quiz_frage
 
 
+@router.get("/{quiz_frage_id}/aehnliche", response_model=List[AehnlicheQuizFrage])
+async def get_aehnliche_quiz_fragen_endpoint(
+    quiz_frage_id: int,
+    k: int = Query(10, ge=1, le=100),
+    min_aehnlichkeit: float = Query(0.0, ge=-1.0, le=1.0),
+    db: DbSession = Depends(get_lese_db),
+):
+    _pruefe_vektor_index()
+    treffer = await get_aehnliche_quiz_fragen(db, quiz_frage_id, k, min_aehnlichkeit)
+    if treffer is None:
+        raise HTTPException(status_code=404, detail="Quiz-Frage nicht gefunden")
+    return treffer
+
+
+@router.get("/{quiz_frage_id}/wiederholung", response_model=WiederholungsStand)
+async def get_wiederholung_endpoint(quiz_frage_id: int, db: DbSession = Depends(get_lese_db)):
+    stand = await get_wiederholung(db, quiz_frage_id)
+    if stand is None:
+        raise HTTPException(status_code=404, detail="Quiz-Frage nicht gefunden")
+    return stand
+
+
+# Bewertet eine Antwort und plant die nächste Wiederholung
+@router.post("/{quiz_frage_id}/bewertung", response_model=WiederholungsStand)
+async def bewerte_quiz_frage_endpoint(quiz_frage_id: int, payload: QuizBewertung, db: DbSession = Depends(get_db)):
+    try:
+        stand = await bewerte_quiz_frage(db, quiz_frage_id, payload.bewertung)
+    except BewertungKonflikt:
+        raise HTTPException(status_code=409, detail="Lernstand wurde gleichzeitig geändert, bitte erneut bewerten")
+    if stand is None:
+        raise HTTPException(status_code=404, detail="Quiz-Frage nicht gefunden")
+    return stand
+
+
+# PUT und PATCH ändern nur die übergebenen Felder
 @router.put("/{quiz_frage_id}", response_model=QuizFrageResponse)
-def update_quiz_frage_endpoint(
-    quiz_frage_id: int, payload: QuizFrageUpdate, db: Session = Depends(get_db)
+@router.patch("/{quiz_frage_id}", response_model=QuizFrageResponse)
+async def update_quiz_frage_endpoint(
+    quiz_frage_id: int,
+    payload: QuizFrageUpdate,
+    response: Response,
+    version: Optional[int] = Depends(if_match_version),
+    db: DbSession = Depends(get_db),
 ):
-    updated = update_quiz_frage(db, quiz_frage_id, payload)
+    updated = await update_quiz_frage(db, quiz_frage_id, payload, version)
     if not updated:
         raise HTTPException(status_code=404, detail="Quiz-Frage nicht gefunden")
+    setze_etag(response, updated)
     return updated
 
 
 @router.delete("/{quiz_frage_id}", response_model=QuizFrageResponse)
-def delete_quiz_frage_endpoint(quiz_frage_id: int, db: Session = Depends(get_db)):
-    deleted = delete_quiz_frage(db, quiz_frage_id)
+async def delete_quiz_frage_endpoint(quiz_frage_id: int, db: DbSession = Depends(get_db)):
+    deleted = await delete_quiz_frage(db, quiz_frage_id)
     if not deleted:
         raise HTTPException(status_code=404, detail="Quiz-Frage nicht gefunden")
     return deleted
@@ -1,7 +1,7 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from ..datenbank import get_db
-from ..crud import (
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from ..datenbank import DbSession, get_db, get_lese_db
+from ..crudAsync import (
     create_quiz_session,
     get_quiz_session,
     get_quiz_sessions,
@@ -11,73 +11,133 @@ from ..crud import (
     get_dateien_fuer_quiz_session,
     link_datei_zu_quiz_session,
     unlink_datei_von_quiz_session,
+    link_dateien_zu_quiz_session,
+    unlink_dateien_von_quiz_session,
+    get_quiz_session_vollstaendig,
+    get_quiz_sessions_vollstaendig,
+    delete_quiz_sessions_fuer_datei,
 )
-from ..pydanticModelle import QuizSessionCreate, QuizSessionResponse, QuizSessionUpdate, QuizFrageResponse, DateiResponse
+from ..versionierung import if_match_version, setze_etag
+from ..pydanticModelle import BatchIds, VerknuepfungsErgebnis, LoeschErgebnis, QuizSessionCreate, QuizSessionResponse, QuizSessionSeite, QuizSessionUpdate, QuizSessionVollstaendig, QuizSessionVollstaendigSeite, QuizFrageResponse, DateiResponse
 
 router = APIRouter()
 
 
 @router.post("/", response_model=QuizSessionResponse)
-def create_quiz_session_endpoint(payload: QuizSessionCreate, db: Session = Depends(get_db)):
-    return create_quiz_session(db, payload)
+async def create_quiz_session_endpoint(payload: QuizSessionCreate, db: DbSession = Depends(get_db)):
+    return await create_quiz_session(db, payload)
 
 
-@router.get("/", response_model=list[QuizSessionResponse])
-def get_quiz_sessions_endpoint(db: Session = Depends(get_db)):
-    return get_quiz_sessions(db)
+# Löscht alle Quiz-Sessions, die mit der Datei verknüpft sind, samt Fragen
+@router.delete("/", response_model=LoeschErgebnis)
+async def delete_quiz_sessions_gefiltert_endpoint(datei_id: int = Query(...), db: DbSession = Depends(get_db)):
+    return {"geloescht": await delete_quiz_sessions_fuer_datei(db, datei_id)}
+
+
+@router.get("/", response_model=QuizSessionSeite)
+async def get_quiz_sessions_endpoint(
+    limit: int = Query(50, ge=1, le=500),
+    after: Optional[int] = None,
+    datei_id: Optional[int] = None,
+    db: DbSession = Depends(get_lese_db),
+):
+    return await get_quiz_sessions(db, limit, after, datei_id=datei_id)
+
+
+@router.get("/vollstaendig", response_model=QuizSessionVollstaendigSeite)
+async def get_quiz_sessions_vollstaendig_endpoint(
+    limit: int = Query(50, ge=1, le=500),
+    after: Optional[int] = None,
+    datei_id: Optional[int] = None,
+    db: DbSession = Depends(get_lese_db),
+):
+    return await get_quiz_sessions_vollstaendig(db, limit, after, datei_id=datei_id)
 
 
 @router.get("/{quiz_session_id}", response_model=QuizSessionResponse)
-def get_quiz_session_endpoint(quiz_session_id: int, db: Session = Depends(get_db)):
-    quiz_session = get_quiz_session(db, quiz_session_id)
+async def get_quiz_session_endpoint(quiz_session_id: int, response: Response, db: DbSession = Depends(get_lese_db)):
+    quiz_session = await get_quiz_session(db, quiz_session_id)
     if not quiz_session:
         raise HTTPException(status_code=404, detail="Quiz-Session nicht gefunden")
+    setze_etag(response, quiz_session)
     return quiz_session
 
 
+# PUT und PATCH ändern nur die übergebenen Felder
 @router.put("/{quiz_session_id}", response_model=QuizSessionResponse)
-def update_quiz_session_endpoint(
-    quiz_session_id: int, payload: QuizSessionUpdate, db: Session = Depends(get_db)
+@router.patch("/{quiz_session_id}", response_model=QuizSessionResponse)
+async def update_quiz_session_endpoint(
+    quiz_session_id: int,
+    payload: QuizSessionUpdate,
+    response: Response,
+    version: Optional[int] = Depends(if_match_version),
+    db: DbSession = Depends(get_db),
 ):
-    updated = update_quiz_session(db, quiz_session_id, payload)
+    updated = await update_quiz_session(db, quiz_session_id, payload, version)
     if not updated:
         raise HTTPException(status_code=404, detail="Quiz-Session nicht gefunden")
+    setze_etag(response, updated)
     return updated
 
 
 @router.delete("/{quiz_session_id}", response_model=QuizSessionResponse)
-def delete_quiz_session_endpoint(quiz_session_id: int, db: Session = Depends(get_db)):
-    deleted = delete_quiz_session(db, quiz_session_id)
+async def delete_quiz_session_endpoint(quiz_session_id: int, db: DbSession = Depends(get_db)):
+    deleted = await delete_quiz_session(db, quiz_session_id)
     if not deleted:
         raise HTTPException(status_code=404, detail="Quiz-Session nicht gefunden")
     return deleted
 
 
 @router.get("/{quiz_session_id}/fragen", response_model=list[QuizFrageResponse])
-def get_quiz_fragen_fuer_session_endpoint(quiz_session_id: int, db: Session = Depends(get_db)):
-    return get_quiz_fragen_fuer_session(db, quiz_session_id)
+async def get_quiz_fragen_fuer_session_endpoint(quiz_session_id: int, db: DbSession = Depends(get_lese_db)):
+    return await get_quiz_fragen_fuer_session(db, quiz_session_id)
 
 
 @router.get("/{quiz_session_id}/dateien", response_model=list[DateiResponse])
-def get_dateien_fuer_quiz_session_endpoint(quiz_session_id: int, db: Session = Depends(get_db)):
-    return get_dateien_fuer_quiz_session(db, quiz_session_id)
+async def get_dateien_fuer_quiz_session_endpoint(quiz_session_id: int, db: DbSession = Depends(get_lese_db)):
+    return await get_dateien_fuer_quiz_session(db, quiz_session_id)
+
+
+@router.get("/{quiz_session_id}/vollstaendig", response_model=QuizSessionVollstaendig)
+async def get_quiz_session_vollstaendig_endpoint(quiz_session_id: int, db: DbSession = Depends(get_lese_db)):
+    quiz_session = await get_quiz_session_vollstaendig(db, quiz_session_id)
+    if not quiz_session:
+        raise HTTPException(status_code=404, detail="Quiz-Session nicht gefunden")
+    return quiz_session
+
+
+# Verknüpft bzw. trennt mehrere Dateien mit einer Anweisung
+@router.post("/{quiz_session_id}/dateien", response_model=VerknuepfungsErgebnis)
+async def link_dateien_zu_quiz_session_endpoint(quiz_session_id: int, payload: BatchIds, db: DbSession = Depends(get_db)):
+    anzahl, fehlend = await link_dateien_zu_quiz_session(db, quiz_session_id, payload.ids)
+    if anzahl is None:
+        raise HTTPException(status_code=404, detail=f"Dateien nicht gefunden: {fehlend}" if fehlend else "Quiz-Session nicht gefunden")
+    return {"anzahl": anzahl}
+
+
+@router.post("/{quiz_session_id}/dateien/loeschen", response_model=VerknuepfungsErgebnis)
+async def unlink_dateien_von_quiz_session_endpoint(quiz_session_id: int, payload: BatchIds, db: DbSession = Depends(get_db)):
+    anzahl = await unlink_dateien_von_quiz_session(db, quiz_session_id, payload.ids)
+    if anzahl is None:
+        raise HTTPException(status_code=404, detail="Quiz-Session nicht gefunden")
+    return {"anzahl": anzahl}
 
 
 @router.post("/{quiz_session_id}/dateien/{datei_id}")
-def link_datei_zu_quiz_session_endpoint(
-    quiz_session_id: int, datei_id: int, db: Session = Depends(get_db)
+async def link_datei_zu_quiz_session_endpoint(
+    quiz_session_id: int, datei_id: int, db: DbSession = Depends(get_db)
 ):
-    result = link_datei_zu_quiz_session(db, quiz_session_id, datei_id)
+    result = await link_datei_zu_quiz_session(db, quiz_session_id, datei_id)
     if not result:
         raise HTTPException(status_code=404, detail="Quiz-Session oder Datei nicht gefunden")
     return {"message": "Datei erfolgreich mit Quiz-Session verknüpft"}
 
 
 @router.delete("/{quiz_session_id}/dateien/{datei_id}")
-def unlink_datei_von_quiz_session_endpoint(
-    quiz_session_id: int, datei_id: int, db: Session = Depends(get_db)
+async def unlink_datei_von_quiz_session_endpoint(
+    quiz_session_id: int, datei_id: int, db: DbSession = Depends(get_db)
 ):
-    result = unlink_datei_von_quiz_session(db, quiz_session_id, datei_id)
+    result = await unlink_datei_von_quiz_session(db, quiz_session_id, datei_id)
     if not result:
         raise HTTPException(status_code=404, detail="Quiz-Session oder Datei nicht gefunden")
     return {"message": "Datei erfolgreich von Quiz-Session getrennt"}
@@ -0,0 +1,41 @@
+import time
+from typing import List, Optional
+from fastapi import APIRouter, Body, Depends, HTTPException, Query
+from ..datenbank import DbSession, get_lese_db
+from ..crudAsync import get_quiz_versuche
+from ..versuchsPuffer import versuchs_puffer
+from ..pydanticModelle import MAX_BATCH_GROESSE, QuizVersuchCreate, QuizVersuchSeite, VersucheAngenommen
+
+router = APIRouter()
+
+
+# Nimmt einen oder mehrere Versuche an, ohne auf das Schreiben zu warten; sie
+# erscheinen nach dem nächsten Stapel in GET /
+@router.post("/", response_model=VersucheAngenommen, status_code=202)
+async def create_quiz_versuche_endpoint(
+    payload: List[QuizVersuchCreate] = Body(..., min_length=1, max_length=MAX_BATCH_GROESSE),
+):
+    eingang = int(time.time())
+    versuche = [
+        {**versuch.dict(), "zeitpunkt": int(versuch.zeitpunkt.timestamp()) if versuch.zeitpunkt else eingang}
+        for versuch in payload
+    ]
+    if not versuchs_puffer.einreihen(versuche):
+        raise HTTPException(status_code=503, detail="Zu viele ungeschriebene Antwortversuche", headers={"Retry-After": "1"})
+    return {"angenommen": len(versuche)}
+
+
+@router.get("/", response_model=QuizVersuchSeite)
+async def get_quiz_versuche_endpoint(
+    limit: int = Query(50, ge=1, le=500),
+    after: Optional[int] = None,
+    quiz_frage_id: Optional[int] = None,
+    db: DbSession = Depends(get_lese_db),
+):
+    return await get_quiz_versuche(db, limit, after, quiz_frage_id=quiz_frage_id)
+
+
+# Zähler, Füllstand der Warteschlange und Schreibdauer der Stapel
+@router.get("/statistik")
+async def get_versuchs_puffer_statistik():
+    return versuchs_puffer.statistik()
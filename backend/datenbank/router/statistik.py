@@ -0,0 +1,55 @@
+from typing import List
+from fastapi import APIRouter, Depends, HTTPException
+from ..datenbank import DbSession, get_db, get_lese_db
+from ..crudAsync import (
+    baue_statistik_neu,
+    get_statistik_gesamt,
+    get_statistik_modul,
+    get_statistik_module,
+    get_statistik_notiz,
+    get_statistik_quiz_session,
+)
+from ..pydanticModelle import ModulStatistik, NotizStatistik, QuizSessionStatistik, StatistikGesamt
+
+router = APIRouter()
+
+
+@router.get("/", response_model=StatistikGesamt)
+async def get_statistik_gesamt_endpoint(db: DbSession = Depends(get_lese_db)):
+    return await get_statistik_gesamt(db)
+
+
+@router.get("/quiz-sessions/{quiz_session_id}", response_model=QuizSessionStatistik)
+async def get_statistik_quiz_session_endpoint(quiz_session_id: int, db: DbSession = Depends(get_lese_db)):
+    db_statistik = await get_statistik_quiz_session(db, quiz_session_id)
+    if db_statistik is None:
+        raise HTTPException(status_code=404, detail="Quiz-Session nicht gefunden")
+    return db_statistik
+
+
+@router.get("/notizen/{notiz_id}", response_model=NotizStatistik)
+async def get_statistik_notiz_endpoint(notiz_id: int, db: DbSession = Depends(get_lese_db)):
+    db_statistik = await get_statistik_notiz(db, notiz_id)
+    if db_statistik is None:
+        raise HTTPException(status_code=404, detail="Notiz nicht gefunden")
+    return db_statistik
+
+
+@router.get("/module", response_model=List[ModulStatistik])
+async def get_statistik_module_endpoint(db: DbSession = Depends(get_lese_db)):
+    return await get_statistik_module(db)
+
+
+@router.get("/module/{modul}", response_model=ModulStatistik)
+async def get_statistik_modul_endpoint(modul: str, db: DbSession = Depends(get_lese_db)):
+    db_statistik = await get_statistik_modul(db, modul)
+    if db_statistik is None:
+        raise HTTPException(status_code=404, detail="Modul nicht gefunden")
+    return db_statistik
+
+
+# Berechnet alle Statistiken aus den Grunddaten neu, falls sie (etwa nach
+# Änderungen an der Datenbank an der API vorbei) nicht mehr stimmen
+@router.post("/neu-aufbauen", response_model=StatistikGesamt)
+async def baue_statistik_neu_endpoint(db: DbSession = Depends(get_db)):
+    return await baue_statistik_neu(db)
@@ -0,0 +1,18 @@
+from typing import List, Literal, Optional
+from fastapi import APIRouter, Depends, Query
+from ..datenbank import DbSession, get_lese_db
+from ..crudAsync import suche
+from ..pydanticModelle import SuchErgebnis
+
+router = APIRouter()
+
+
+@router.get("/", response_model=SuchErgebnis)
+async def suche_endpoint(
+    q: str = Query(..., min_length=1),
+    typ: Optional[List[Literal["datei", "notiz", "kiantwort", "quizfrage"]]] = Query(None),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    db: DbSession = Depends(get_lese_db),
+):
+    return await suche(db, q, typ, limit, offset)
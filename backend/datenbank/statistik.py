@@ -0,0 +1,214 @@
+from sqlalchemy import text
+
+# Vorberechnete Lernstatistiken (Tabellen statistik_* in modelle.py). Trigger
+# halten sie in derselben Transaktion wie die Änderung aktuell, Abfragen lesen
+# damit eine Zeile statt über alle Fragen, Versuche oder Antworten zu zählen.
+# baue_neu() berechnet alles aus den Grunddaten, etwa zur Reparatur.
+#
+# Ein Modul zählt jede Quiz-Session einmal, auch wenn sie mit mehreren Dateien
+# des Moduls verknüpft ist; statistik_modul_sessions führt dazu je Modul und
+# Session die Anzahl der Verknüpfungen. Dateien ohne Modul werden nicht gezählt.
+#
+# Beim Löschen eines Elternteils (Datei, Quiz-Session, Quiz-Frage) sind dessen
+# Kinder während ON DELETE CASCADE bereits ohne Elternzeile: die Trigger der
+# Kinder finden dann nichts mehr zum Anpassen. Die Anteile der Kinder werden
+# deshalb im BEFORE-DELETE-Trigger des Elternteils abgezogen.
+GESAMT = {
+    "dateien": "dateien",
+    "notizen": "notizen",
+    "kiantworten": '"kiAntworten"',
+    "quiz_sessions": '"quizSessions"',
+    "quiz_fragen": '"quizFragen"',
+    "quiz_versuche": '"quizVersuche"',
+}
+SESSION_SPALTEN = ("fragen", "versuche", "richtig")
+
+
+def _gesamt(name, delta):
+    return f"UPDATE statistik_gesamt SET anzahl = anzahl + ({delta}) WHERE name = '{name}';"
+
+
+# Ändert die Zähler einer Quiz-Session und aller Module, in denen sie liegt
+def _session_und_module(session, werte):
+    zuweisung = ", ".join(f"{spalte} = {spalte} + ({wert})" for spalte, wert in werte.items())
+    return (
+        f"UPDATE statistik_quiz_sessions SET {zuweisung} WHERE quiz_session_id = {session}; "
+        f"UPDATE statistik_module SET {zuweisung} WHERE modul IN "
+        f"(SELECT modul FROM statistik_modul_sessions WHERE quiz_session_id = {session});"
+    )
+
+
+def _versuche_der_frage(frage):
+    return (
+        f'(SELECT count(*) FROM "quizVersuche" WHERE quiz_frage_id = {frage})',
+        f'(SELECT coalesce(sum(richtig), 0) FROM "quizVersuche" WHERE quiz_frage_id = {frage})',
+    )
+
+
+# Zähler der Quiz-Sessions aus sessions (Unterabfrage) zu einem Modul
+# addieren (vorzeichen "+") bzw. abziehen ("-")
+def _modul_sessions(modul, sessions, vorzeichen):
+    werte = ", ".join(
+        f"{spalte} = {spalte} {vorzeichen} (SELECT coalesce(sum({spalte}), 0) FROM statistik_quiz_sessions "
+        f"WHERE quiz_session_id IN {sessions})"
+        for spalte in SESSION_SPALTEN
+    )
+    return (
+        f"UPDATE statistik_module SET quiz_sessions = quiz_sessions {vorzeichen} "
+        f"(SELECT count(*) FROM {sessions}), {werte} WHERE modul = {modul};"
+    )
+
+
+# Verknüpfungen (modul, session) für die Sessions aus verknuepft hinzufügen;
+# Sessions, die damit neu im Modul sind, werden dem Modul zugerechnet
+def _tritt_bei(modul, verknuepft):
+    neu = (
+        f"(SELECT quiz_session_id FROM statistik_modul_sessions WHERE modul = {modul} "
+        f"AND verknuepfungen = 1 AND quiz_session_id IN {verknuepft})"
+    )
+    return (
+        f"INSERT OR IGNORE INTO statistik_modul_sessions(modul, quiz_session_id, verknuepfungen) "
+        f"SELECT {modul}, quiz_session_id, 0 FROM {verknuepft} WHERE {modul} IS NOT NULL; "
+        f"UPDATE statistik_modul_sessions SET verknuepfungen = verknuepfungen + 1 "
+        f"WHERE modul = {modul} AND quiz_session_id IN {verknuepft}; "
+        f"{_modul_sessions(modul, neu, '+')}"
+    )
+
+
+def _tritt_aus(modul, verknuepft):
+    weg = (
+        f"(SELECT quiz_session_id FROM statistik_modul_sessions WHERE modul = {modul} "
+        f"AND verknuepfungen <= 0 AND quiz_session_id IN {verknuepft})"
+    )
+    return (
+        f"UPDATE statistik_modul_sessions SET verknuepfungen = verknuepfungen - 1 "
+        f"WHERE modul = {modul} AND quiz_session_id IN {verknuepft}; "
+        f"{_modul_sessions(modul, weg, '-')} "
+        f"DELETE FROM statistik_modul_sessions WHERE modul = {modul} AND verknuepfungen <= 0;"
+    )
+
+
+def _datei_hinzu(modul, datei):
+    return (
+        f"INSERT OR IGNORE INTO statistik_module(modul) SELECT {modul} WHERE {modul} IS NOT NULL; "
+        f"UPDATE statistik_module SET dateien = dateien + 1 WHERE modul = {modul}; "
+        f"{_tritt_bei(modul, f'(SELECT quiz_session_id FROM datei_quizsession WHERE datei_id = {datei})')}"
+    )
+
+
+def _datei_weg(modul, datei):
+    return (
+        f"UPDATE statistik_module SET dateien = dateien - 1 WHERE modul = {modul}; "
+        f"{_tritt_aus(modul, f'(SELECT quiz_session_id FROM datei_quizsession WHERE datei_id = {datei})')} "
+        f"DELETE FROM statistik_module WHERE modul = {modul} AND dateien <= 0;"
+    )
+
+
+def _trigger():
+    trigger = []
+
+    def neu(name, ereignis, tabelle, koerper, wann=""):
+        wann = f" WHEN {wann}" if wann else ""
+        trigger.append(f'CREATE TRIGGER IF NOT EXISTS "statistik_{name}" {ereignis} ON {tabelle}{wann} BEGIN {koerper} END')
+
+    for name, tabelle in GESAMT.items():
+        neu(f"gesamt_{name}_ai", "AFTER INSERT", tabelle, _gesamt(name, "1"))
+        neu(f"gesamt_{name}_ad", "AFTER DELETE", tabelle, _gesamt(name, "-1"))
+
+    # Notizen: KI-Antworten und verknüpfte Dateien
+    neu("notizen_zeile", "AFTER INSERT", "notizen", "INSERT OR IGNORE INTO statistik_notizen(notiz_id) VALUES (new.id);")
+    neu("kiantworten_notiz_ai", "AFTER INSERT", '"kiAntworten"',
+        "UPDATE statistik_notizen SET kiantworten = kiantworten + 1 WHERE notiz_id = new.notiz_id;")
+    neu("kiantworten_notiz_ad", "AFTER DELETE", '"kiAntworten"',
+        "UPDATE statistik_notizen SET kiantworten = kiantworten - 1 WHERE notiz_id = old.notiz_id;")
+    neu("kiantworten_notiz_au", 'AFTER UPDATE OF notiz_id', '"kiAntworten"',
+        "UPDATE statistik_notizen SET kiantworten = kiantworten - 1 WHERE notiz_id = old.notiz_id; "
+        "UPDATE statistik_notizen SET kiantworten = kiantworten + 1 WHERE notiz_id = new.notiz_id;",
+        "old.notiz_id IS NOT new.notiz_id")
+    neu("notiz_datei_ai", "AFTER INSERT", "notiz_datei",
+        "UPDATE statistik_notizen SET dateien = dateien + 1 WHERE notiz_id = new.notiz_id;")
+    neu("notiz_datei_ad", "AFTER DELETE", "notiz_datei",
+        "UPDATE statistik_notizen SET dateien = dateien - 1 WHERE notiz_id = old.notiz_id;")
+
+    # Quiz-Sessions: Fragen und Versuche, jeweils auch für ihre Module
+    neu("quiz_sessions_zeile", "AFTER INSERT", '"quizSessions"',
+        "INSERT OR IGNORE INTO statistik_quiz_sessions(quiz_session_id) VALUES (new.id);")
+    abziehen = ", ".join(
+        f"{spalte} = {spalte} - coalesce((SELECT {spalte} FROM statistik_quiz_sessions WHERE quiz_session_id = old.id), 0)"
+        for spalte in SESSION_SPALTEN
+    )
+    neu("quiz_sessions_bd", "BEFORE DELETE", '"quizSessions"',
+        f"UPDATE statistik_module SET quiz_sessions = quiz_sessions - 1, {abziehen} WHERE modul IN "
+        "(SELECT modul FROM statistik_modul_sessions WHERE quiz_session_id = old.id); "
+        "DELETE FROM statistik_modul_sessions WHERE quiz_session_id = old.id;")
+    neu("quiz_fragen_ai", "AFTER INSERT", '"quizFragen"', _session_und_module("new.quiz_session_id", {"fragen": "1"}))
+    versuche, richtig = _versuche_der_frage("old.id")
+    neu("quiz_fragen_bd", "BEFORE DELETE", '"quizFragen"',
+        _session_und_module("old.quiz_session_id", {"fragen": "-1", "versuche": f"-{versuche}", "richtig": f"-{richtig}"}))
+    neu("quiz_fragen_au", "AFTER UPDATE OF quiz_session_id", '"quizFragen"',
+        _session_und_module("old.quiz_session_id", {"fragen": "-1", "versuche": f"-{versuche}", "richtig": f"-{richtig}"})
+        + " " + _session_und_module("new.quiz_session_id", {"fragen": "1", "versuche": versuche, "richtig": richtig}),
+        "old.quiz_session_id IS NOT new.quiz_session_id")
+    session = '(SELECT quiz_session_id FROM "quizFragen" WHERE id = {}.quiz_frage_id)'
+    neu("quiz_versuche_session_ai", "AFTER INSERT", '"quizVersuche"',
+        _gesamt("quiz_versuche_richtig", "coalesce(new.richtig, 0)")
+        + " " + _session_und_module(session.format("new"), {"versuche": "1", "richtig": "coalesce(new.richtig, 0)"}))
+    neu("quiz_versuche_session_ad", "AFTER DELETE", '"quizVersuche"',
+        _gesamt("quiz_versuche_richtig", "-coalesce(old.richtig, 0)")
+        + " " + _session_und_module(session.format("old"), {"versuche": "-1", "richtig": "-coalesce(old.richtig, 0)"}))
+
+    # Module: Dateien und die mit ihnen verknüpften Quiz-Sessions
+    neu("dateien_modul_ai", "AFTER INSERT", "dateien", _datei_hinzu("new.modul", "new.id"))
+    neu("dateien_modul_bd", "BEFORE DELETE", "dateien", _datei_weg("old.modul", "old.id"))
+    neu("dateien_modul_au", "AFTER UPDATE OF modul", "dateien",
+        _datei_weg("old.modul", "old.id") + " " + _datei_hinzu("new.modul", "new.id"), "old.modul IS NOT new.modul")
+    modul = "(SELECT modul FROM dateien WHERE id = {}.datei_id)"
+    neu("datei_quizsession_ai", "AFTER INSERT", "datei_quizsession",
+        _tritt_bei(modul.format("new"), "(SELECT new.quiz_session_id AS quiz_session_id)"))
+    neu("datei_quizsession_ad", "AFTER DELETE", "datei_quizsession",
+        _tritt_aus(modul.format("old"), "(SELECT old.quiz_session_id AS quiz_session_id)"))
+    return trigger
+
+
+def baue_neu(connection):
+    for tabelle in ("statistik_gesamt", "statistik_notizen", "statistik_quiz_sessions", "statistik_module", "statistik_modul_sessions"):
+        connection.execute(text(f"DELETE FROM {tabelle}"))
+    for name, tabelle in GESAMT.items():
+        connection.execute(text(f"INSERT INTO statistik_gesamt(name, anzahl) SELECT '{name}', count(*) FROM {tabelle}"))
+    connection.execute(text(
+        "INSERT INTO statistik_gesamt(name, anzahl) "
+        "SELECT 'quiz_versuche_richtig', coalesce(sum(richtig), 0) FROM \"quizVersuche\""
+    ))
+    connection.execute(text(
+        "INSERT INTO statistik_notizen(notiz_id, kiantworten, dateien) SELECT n.id, "
+        '(SELECT count(*) FROM "kiAntworten" WHERE notiz_id = n.id), '
+        "(SELECT count(*) FROM notiz_datei WHERE notiz_id = n.id) FROM notizen n"
+    ))
+    connection.execute(text(
+        "INSERT INTO statistik_quiz_sessions(quiz_session_id, fragen, versuche, richtig) SELECT s.id, "
+        '(SELECT count(*) FROM "quizFragen" WHERE quiz_session_id = s.id), '
+        '(SELECT count(*) FROM "quizVersuche" v JOIN "quizFragen" f ON f.id = v.quiz_frage_id WHERE f.quiz_session_id = s.id), '
+        '(SELECT coalesce(sum(v.richtig), 0) FROM "quizVersuche" v JOIN "quizFragen" f ON f.id = v.quiz_frage_id '
+        'WHERE f.quiz_session_id = s.id) FROM "quizSessions" s'
+    ))
+    connection.execute(text(
+        "INSERT INTO statistik_modul_sessions(modul, quiz_session_id, verknuepfungen) "
+        "SELECT d.modul, l.quiz_session_id, count(*) FROM datei_quizsession l JOIN dateien d ON d.id = l.datei_id "
+        "WHERE d.modul IS NOT NULL GROUP BY d.modul, l.quiz_session_id"
+    ))
+    summen = ", ".join(
+        f"(SELECT coalesce(sum(s.{spalte}), 0) FROM statistik_modul_sessions ms JOIN statistik_quiz_sessions s "
+        f"ON s.quiz_session_id = ms.quiz_session_id WHERE ms.modul = d.modul)"
+        for spalte in SESSION_SPALTEN
+    )
+    connection.execute(text(
+        f"INSERT INTO statistik_module(modul, dateien, quiz_sessions, {', '.join(SESSION_SPALTEN)}) "
+        "SELECT d.modul, count(*), (SELECT count(*) FROM statistik_modul_sessions ms WHERE ms.modul = d.modul), "
+        f"{summen} FROM dateien d WHERE d.modul IS NOT NULL GROUP BY d.modul"
+    ))
+
+
+def richte_statistik_ein(connection):
+    for ddl in _trigger():
+        connection.execute(text(ddl))
+    baue_neu(connection)
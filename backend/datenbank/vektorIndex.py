@@ -0,0 +1,300 @@
+import importlib
+import json
+import logging
+import math
+import os
+import re
+import threading
+import zlib
+from collections import Counter
+from pathlib import Path
+
+from sqlalchemy import select
+
+from .datenbank import SessionLocal
+from .modelle import KiAntwort, QuizFrage
+
+# Ähnlichkeitssuche über Quiz-Fragen und KI-Antworten. Je Index liegen die
+# Einbettungen als zusammenhängende float32-Matrix in einer Datei, die per
+# numpy.memmap eingeblendet wird; eine zweite Datei hält je Zeile (id, version).
+# Die Schreibfunktionen in crud.py aktualisieren den Index nach dem Commit,
+# beim Start werden nur Zeilen mit abweichender Version neu eingebettet.
+#
+# Ein Embedder hat die Attribute name und dimension und eine Methode
+# einbetten(texte), die eine float32-Matrix (len(texte), dimension) liefert.
+# LERNASSISTENT_EMBEDDER ist "hash", "modul:Klasse" oder "aus". numpy wird erst
+# beim Start importiert; fehlt es, bleibt der Index abgeschaltet.
+VEKTOR_PFAD = Path(os.getenv("LERNASSISTENT_VEKTOR_PFAD", "./vektorindex"))
+EMBEDDER = os.getenv("LERNASSISTENT_EMBEDDER", "hash")
+DIMENSION = int(os.getenv("LERNASSISTENT_EMBEDDER_DIMENSION", "512"))
+
+# Indexname -> (Modell, eingebettete Spalte)
+INDIZES = {
+    "quizfragen": (QuizFrage, QuizFrage.frage),
+    "kiantworten": (KiAntwort, KiAntwort.inhalt),
+}
+
+MIN_KAPAZITAET = 1024
+# Zeilen je Block beim Vergleich vieler Vektoren, begrenzt den Speicherbedarf
+BLOCK_WERTE = 2**24
+
+logger = logging.getLogger(__name__)
+
+_WORT = re.compile(r"\w+")
+
+
+# Feature-Hashing über Wörter, Wortpaare und Zeichen-Trigramme der Wörter
+# (robust gegen Flexion und Tippfehler) mit Gewicht 1 + log(Anzahl);
+# deterministisch (crc32 statt hash()) und ohne Vokabular
+class HashEmbedder:
+    def __init__(self, dimension=DIMENSION):
+        self.dimension = dimension
+        self.name = f"hash-{dimension}"
+
+    def einbetten(self, texte):
+        import numpy as np
+
+        matrix = np.zeros((len(texte), self.dimension), dtype=np.float32)
+        for zeile, inhalt in enumerate(texte):
+            woerter = _WORT.findall((inhalt or "").lower())
+            merkmale = Counter(woerter + [f"{a} {b}" for a, b in zip(woerter, woerter[1:])])
+            merkmale.update(f"#{wort[i : i + 3]}" for wort in (f"_{w}_" for w in woerter) for i in range(len(wort) - 2))
+            for merkmal, anzahl in merkmale.items():
+                wert = zlib.crc32(merkmal.encode())
+                vorzeichen = 1.0 if wert & 0x80000000 else -1.0
+                matrix[zeile, wert % self.dimension] += vorzeichen * (1.0 + math.log(anzahl))
+        return matrix
+
+
+def lade_embedder(angabe=EMBEDDER):
+    if angabe == "hash":
+        return HashEmbedder()
+    modul, _, klasse = angabe.partition(":")
+    return getattr(importlib.import_module(modul), klasse)()
+
+
+def _normiere(np, matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    normen = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return np.divide(matrix, normen, out=np.zeros_like(matrix), where=normen > 0)
+
+
+# Eine Matrix samt Zeilenzuordnung. Gelöschte Zeilen werden genullt, mit id -1
+# markiert und wiederverwendet; ist kein Platz mehr, wird die Datei verdoppelt.
+class _Matrix:
+    def __init__(self, np, pfad, name, embedder):
+        self.np = np
+        self.dimension = embedder.dimension
+        self.vektoren_pfad = pfad / f"{name}.f32"
+        self.ids_pfad = pfad / f"{name}.ids"
+        meta_pfad = pfad / f"{name}.json"
+        meta = {"embedder": embedder.name, "dimension": embedder.dimension}
+        if not meta_pfad.exists() or json.loads(meta_pfad.read_text()) != meta:
+            # Anderer Embedder: der Index wird beim Abgleich neu aufgebaut
+            self.vektoren_pfad.unlink(missing_ok=True)
+            self.ids_pfad.unlink(missing_ok=True)
+            meta_pfad.write_text(json.dumps(meta))
+        kapazitaet = self.vektoren_pfad.stat().st_size // (4 * self.dimension) if self.vektoren_pfad.exists() else 0
+        if not self.ids_pfad.exists() or self.ids_pfad.stat().st_size != 16 * kapazitaet:
+            kapazitaet = 0
+        self.kapazitaet = 0
+        self._oeffne(max(kapazitaet, MIN_KAPAZITAET), kapazitaet)
+        belegt = np.flatnonzero(self.ids[:, 0] >= 0)
+        self.zeile = {int(self.ids[nr, 0]): int(nr) for nr in belegt}
+        self.ende = int(belegt[-1]) + 1 if len(belegt) else 0
+        self.frei = [int(nr) for nr in np.flatnonzero(self.ids[: self.ende, 0] < 0)]
+
+    def _oeffne(self, kapazitaet, vorhanden):
+        np = self.np
+        for pfad, breite in ((self.vektoren_pfad, 4 * self.dimension), (self.ids_pfad, 16)):
+            with open(pfad, "ab") as datei:
+                datei.truncate(kapazitaet * breite)
+        self.vektoren = np.memmap(self.vektoren_pfad, dtype=np.float32, mode="r+", shape=(kapazitaet, self.dimension))
+        self.ids = np.memmap(self.ids_pfad, dtype=np.int64, mode="r+", shape=(kapazitaet, 2))
+        self.ids[vorhanden:, 0] = -1
+        self.kapazitaet = kapazitaet
+
+    def _freie_zeile(self):
+        if self.frei:
+            return self.frei.pop()
+        if self.ende == self.kapazitaet:
+            bisher = self.kapazitaet
+            self.schliesse()
+            self._oeffne(2 * bisher, bisher)
+        self.ende += 1
+        return self.ende - 1
+
+    def versionen(self):
+        return {eintrag: int(self.ids[nr, 1]) for eintrag, nr in self.zeile.items()}
+
+    def setze(self, ids, versionen, vektoren):
+        for eintrag, version, vektor in zip(ids, versionen, vektoren):
+            nr = self.zeile.get(eintrag)
+            if nr is None:
+                nr = self.zeile[eintrag] = self._freie_zeile()
+            self.vektoren[nr] = vektor
+            self.ids[nr] = (eintrag, version)
+
+    def entferne(self, ids):
+        for eintrag in ids:
+            nr = self.zeile.pop(eintrag, None)
+            if nr is not None:
+                self.vektoren[nr] = 0
+                self.ids[nr] = (-1, 0)
+                self.frei.append(nr)
+
+    # Kosinus-Ähnlichkeit aller Zeilen zu den (normierten) Anfragen, blockweise:
+    # liefert je Anfrage die beste Zeile und ihren Wert
+    def beste(self, anfragen):
+        np = self.np
+        beste_werte = np.full(len(anfragen), -np.inf, dtype=np.float32)
+        beste_zeilen = np.full(len(anfragen), -1, dtype=np.int64)
+        block = max(1, BLOCK_WERTE // max(len(anfragen), 1))
+        for anfang in range(0, self.ende, block):
+            werte = self.vektoren[anfang : anfang + block] @ anfragen.T
+            werte[self.ids[anfang : anfang + block, 0] < 0] = -np.inf
+            zeilen = werte.argmax(axis=0)
+            maxima = werte[zeilen, np.arange(len(anfragen))]
+            besser = maxima > beste_werte
+            beste_werte[besser] = maxima[besser]
+            beste_zeilen[besser] = zeilen[besser] + anfang
+        return beste_zeilen, beste_werte
+
+    def suche(self, anfrage, k, ausser):
+        np = self.np
+        werte = self.vektoren[: self.ende] @ anfrage
+        werte[self.ids[: self.ende, 0] < 0] = -np.inf
+        for eintrag in ausser:
+            if eintrag in self.zeile:
+                werte[self.zeile[eintrag]] = -np.inf
+        k = min(k, len(werte))
+        if k <= 0:
+            return []
+        kandidaten = np.argpartition(-werte, k - 1)[:k]
+        kandidaten = kandidaten[np.argsort(-werte[kandidaten], kind="stable")]
+        return [(int(self.ids[nr, 0]), min(float(werte[nr]), 1.0)) for nr in kandidaten if werte[nr] > -np.inf]
+
+    def schliesse(self):
+        if self.kapazitaet:
+            self.vektoren.flush()
+            self.ids.flush()
+            del self.vektoren, self.ids
+            self.kapazitaet = 0
+
+
+class VektorIndex:
+    def __init__(self, pfad=VEKTOR_PFAD, sessions=SessionLocal, embedder=None):
+        self.pfad = pfad
+        self.sessions = sessions
+        self.embedder = embedder
+        self._np = None
+        self._matrizen = {}
+        self._sperre = threading.Lock()
+
+    @property
+    def aktiv(self):
+        return bool(self._matrizen)
+
+    def starte(self):
+        if self.embedder is None and EMBEDDER == "aus":
+            return
+        try:
+            import numpy
+        except ImportError:
+            logger.warning("numpy ist nicht installiert, der Vektorindex bleibt abgeschaltet")
+            return
+        self._np = numpy
+        if self.embedder is None:
+            self.embedder = lade_embedder()
+        self.pfad.mkdir(parents=True, exist_ok=True)
+        with self._sperre:
+            self._matrizen = {name: _Matrix(numpy, self.pfad, name, self.embedder) for name in INDIZES}
+        with self.sessions() as db:
+            self.abgleichen(db)
+
+    def stoppe(self):
+        with self._sperre:
+            for matrix in self._matrizen.values():
+                matrix.schliesse()
+            self._matrizen = {}
+
+    # Bringt alle Indizes auf den Stand der Datenbank: nach dem Start und nach
+    # Änderungen, deren betroffene Zeilen nicht bekannt sind (Import, Löschen
+    # nach Filter)
+    def abgleichen(self, db):
+        if not self.aktiv:
+            return
+        for name, (modell, _) in INDIZES.items():
+            aktuell = dict(db.execute(select(modell.id, modell.version)).all())
+            with self._sperre:
+                vorhanden = self._matrizen[name].versionen()
+            self.entferne(name, [eintrag for eintrag in vorhanden if eintrag not in aktuell])
+            veraltet = [eintrag for eintrag, version in aktuell.items() if vorhanden.get(eintrag) != version]
+            for anfang in range(0, len(veraltet), 1000):
+                self.aktualisiere(db, name, veraltet[anfang : anfang + 1000])
+
+    def einbetten(self, texte):
+        return _normiere(self._np, self.embedder.einbetten(list(texte)))
+
+    # Bettet die angegebenen Zeilen in ihrer aktuellen Fassung (neu) ein
+    def aktualisiere(self, db, name, ids):
+        if not self.aktiv or not ids:
+            return
+        modell, spalte = INDIZES[name]
+        zeilen = db.execute(select(modell.id, modell.version, spalte).where(modell.id.in_(ids))).all()
+        if not zeilen:
+            return
+        vektoren = self.einbetten(text for _, _, text in zeilen)
+        with self._sperre:
+            self._matrizen[name].setze([zeile[0] for zeile in zeilen], [zeile[1] for zeile in zeilen], vektoren)
+
+    def entferne(self, name, ids):
+        if not self.aktiv or not ids:
+            return
+        with self._sperre:
+            self._matrizen[name].entferne(ids)
+
+    # Die k ähnlichsten Einträge zu einem Text bzw. zu einem vorhandenen
+    # Eintrag (dessen gespeicherter Vektor wird verwendet): [(id, Ähnlichkeit)]
+    def aehnliche(self, name, k, text=None, eintrag=None):
+        with self._sperre:
+            matrix = self._matrizen[name]
+            if eintrag is not None and eintrag in matrix.zeile:
+                anfrage = self._np.array(matrix.vektoren[matrix.zeile[eintrag]])
+            else:
+                anfrage = None
+        if anfrage is None:
+            anfrage = self.einbetten([text or ""])[0]
+        with self._sperre:
+            return self._matrizen[name].suche(anfrage, k, () if eintrag is None else (eintrag,))
+
+    # Je Text: der ähnlichste vorhandene Eintrag bzw. frühere Text der Liste,
+    # sofern die Ähnlichkeit mindestens schwelle beträgt
+    def duplikate(self, name, texte, schwelle):
+        np = self._np
+        vektoren = self.einbetten(texte)
+        with self._sperre:
+            zeilen, werte = self._matrizen[name].beste(vektoren)
+            ids = [int(self._matrizen[name].ids[nr, 0]) if nr >= 0 else None for nr in zeilen]
+        # Vergleich mit den früheren Texten der Liste, ebenfalls blockweise
+        anzahl = len(texte)
+        frueher = np.zeros(anzahl, dtype=np.int64)
+        frueher_werte = np.full(anzahl, -np.inf, dtype=np.float32)
+        block = max(1, BLOCK_WERTE // max(anzahl, 1))
+        for anfang in range(0, anzahl, block):
+            teil = vektoren[anfang : anfang + block] @ vektoren.T
+            teil[np.arange(anzahl)[None, :] >= np.arange(anfang, anfang + len(teil))[:, None]] = -np.inf
+            frueher[anfang : anfang + len(teil)] = teil.argmax(axis=1)
+            frueher_werte[anfang : anfang + len(teil)] = teil.max(axis=1)
+        ergebnis = []
+        for nr in range(anzahl):
+            eintrag = {"index": nr, "duplikat_von": None, "duplikat_im_batch": None, "aehnlichkeit": None}
+            if ids[nr] is not None and werte[nr] >= schwelle:
+                eintrag.update(duplikat_von=ids[nr], aehnlichkeit=min(float(werte[nr]), 1.0))
+            elif frueher_werte[nr] >= schwelle:
+                eintrag.update(duplikat_im_batch=int(frueher[nr]), aehnlichkeit=min(float(frueher_werte[nr]), 1.0))
+            ergebnis.append(eintrag)
+        return ergebnis
+
+
+vektor_index = VektorIndex()
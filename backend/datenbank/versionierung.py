@@ -0,0 +1,36 @@
+from typing import Optional
+
+from fastapi import Header, Response
+
+# Optimistische Nebenläufigkeit: jede Zeile trägt eine version, die bei jeder
+# Änderung hochgezählt wird. Einzelne Datensätze werden mit ETag "<version>"
+# ausgeliefert; PUT/PATCH mit If-Match (oder "version" im Body) schreiben nur,
+# wenn die Version noch aktuell ist. Eindeutig ist der ETag nur, weil die
+# versionierten Tabellen AUTOINCREMENT nutzen: eine id wird nach dem Löschen
+# nie wieder vergeben (Migration 11).
+
+
+class VersionKonflikt(Exception):
+    def __init__(self, aktuelle_versionen):
+        super().__init__(aktuelle_versionen)
+        # {id: aktuelle Version} der Datensätze, die sich geändert haben
+        self.aktuelle_versionen = aktuelle_versionen
+
+
+def etag(version):
+    return f'"{version}"'
+
+
+def setze_etag(response: Response, eintrag):
+    version = eintrag["version"] if isinstance(eintrag, dict) else eintrag.version
+    response.headers["ETag"] = etag(version)
+
+
+# Dependency für die Update-Routen: erwartete Version aus If-Match oder None.
+# Ein nicht lesbarer (auch ein schwacher W/-)Wert kann zu keiner Version passen
+# und ergibt -1, das UPDATE greift dann nicht und die Anfrage endet mit 412.
+def if_match_version(if_match: Optional[str] = Header(None)) -> Optional[int]:
+    if if_match is None or if_match.strip() == "*":
+        return None
+    wert = if_match.split(",")[0].strip().strip('"')
+    return int(wert) if wert.isdigit() else -1
@@ -0,0 +1,139 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from . import crud
+from .datenbank import SessionLocal
+
+# Antwortversuche auf Quiz-Fragen werden nicht je Anfrage committet, sondern in
+# einer begrenzten Warteschlange im Speicher gesammelt. Ein Thread schreibt sie
+# stapelweise (crud.speichere_quiz_versuche), sobald BATCH Versuche vorliegen
+# oder spätestens INTERVALL Sekunden nach dem ersten wartenden. Ist die
+# Warteschlange voll, wird ein Versuch abgelehnt (die API antwortet mit 503),
+# statt unbegrenzt Speicher zu belegen. Beim Beenden wird alles Wartende noch
+# geschrieben; bei einem Absturz des Prozesses gehen die wartenden Versuche
+# verloren.
+KAPAZITAET = int(os.getenv("LERNASSISTENT_VERSUCHE_PUFFER", "10000"))
+BATCH = int(os.getenv("LERNASSISTENT_VERSUCHE_BATCH", "500"))
+INTERVALL = float(os.getenv("LERNASSISTENT_VERSUCHE_INTERVALL", "0.5"))
+
+# Wartezeit vor einem erneuten Schreibversuch nach einem Fehler; beim Beenden
+# wird höchstens so oft wiederholt
+FEHLER_PAUSE = 1.0
+VERSUCHE_BEIM_BEENDEN = 3
+
+logger = logging.getLogger(__name__)
+
+
+class VersuchsPuffer:
+    def __init__(self, sessions=SessionLocal, kapazitaet=KAPAZITAET, batch=BATCH, intervall=INTERVALL):
+        self.sessions = sessions
+        self.kapazitaet = kapazitaet
+        self.batch = batch
+        self.intervall = intervall
+        self._eintraege = deque()
+        self._bedingung = threading.Condition()
+        self._stopp = False
+        self._thread = None
+        self.zaehler = {"angenommen": 0, "abgelehnt": 0, "geschrieben": 0, "verworfen": 0, "stapel": 0, "fehler": 0}
+        self._dauer_summe = 0.0
+        self._dauer_letzte = 0.0
+        self._dauer_max = 0.0
+
+    @property
+    def aktiv(self):
+        return self._thread is not None and not self._stopp
+
+    def starte(self):
+        if self._thread is not None:
+            return
+        self._stopp = False
+        self._thread = threading.Thread(target=self._laufe, name="versuchs-puffer", daemon=True)
+        self._thread.start()
+
+    def stoppe(self):
+        if self._thread is None:
+            return
+        with self._bedingung:
+            self._stopp = True
+            self._bedingung.notify()
+        self._thread.join()
+        self._thread = None
+
+    # Nimmt alle Versuche an oder, wenn sie nicht mehr hineinpassen, keinen
+    def einreihen(self, versuche):
+        with self._bedingung:
+            if not self.aktiv or len(self._eintraege) + len(versuche) > self.kapazitaet:
+                self.zaehler["abgelehnt"] += len(versuche)
+                return False
+            # Wecken beim ersten wartenden Versuch (Frist beginnt) und bei vollem Stapel
+            wecken = not self._eintraege or len(self._eintraege) + len(versuche) >= self.batch
+            self._eintraege.extend(versuche)
+            self.zaehler["angenommen"] += len(versuche)
+            if wecken:
+                self._bedingung.notify()
+        return True
+
+    def _laufe(self):
+        while True:
+            with self._bedingung:
+                while not self._eintraege and not self._stopp:
+                    self._bedingung.wait()
+                if len(self._eintraege) < self.batch and not self._stopp:
+                    # Weitere Versuche sammeln, höchstens bis der Stapel voll ist
+                    self._bedingung.wait(self.intervall)
+                if not self._eintraege:
+                    return
+                stapel = [self._eintraege.popleft() for _ in range(min(self.batch, len(self._eintraege)))]
+            self._schreibe(stapel)
+
+    def _schreibe(self, stapel):
+        fehlversuche = 0
+        while True:
+            beginn = time.perf_counter()
+            try:
+                with self.sessions() as db:
+                    geschrieben = crud.speichere_quiz_versuche(db, stapel)
+                break
+            except Exception:
+                logger.exception("%s Antwortversuche konnten nicht geschrieben werden", len(stapel))
+                fehlversuche += 1
+                with self._bedingung:
+                    self.zaehler["fehler"] += 1
+                    aufgeben = self._stopp and fehlversuche >= VERSUCHE_BEIM_BEENDEN
+                if aufgeben:
+                    logger.error("%s Antwortversuche verworfen", len(stapel))
+                    with self._bedingung:
+                        self.zaehler["verworfen"] += len(stapel)
+                    return
+                time.sleep(FEHLER_PAUSE)
+        dauer = time.perf_counter() - beginn
+        with self._bedingung:
+            self.zaehler["geschrieben"] += geschrieben
+            # Versuche zu nicht (mehr) vorhandenen Fragen
+            self.zaehler["verworfen"] += len(stapel) - geschrieben
+            self.zaehler["stapel"] += 1
+            self._dauer_summe += dauer
+            self._dauer_letzte = dauer
+            self._dauer_max = max(self._dauer_max, dauer)
+
+    def statistik(self):
+        with self._bedingung:
+            stapel = self.zaehler["stapel"]
+            return {
+                **self.zaehler,
+                "wartend": len(self._eintraege),
+                "kapazitaet": self.kapazitaet,
+                "batch": self.batch,
+                "intervall": self.intervall,
+                "schreibdauer_ms": {
+                    "letzte": self._dauer_letzte * 1000,
+                    "mittel": self._dauer_summe / stapel * 1000 if stapel else 0.0,
+                    "max": self._dauer_max * 1000,
+                },
+            }
+
+
+versuchs_puffer = VersuchsPuffer()
@@ -0,0 +1,84 @@
+from sqlalchemy import inspect, text
+
+# Alle durchsuchbaren Texte liegen in einer FTS5-Tabelle. Die rowid kodiert
+# Typ und Primärschlüssel (id * 4 + Typcode), damit die Trigger einzelne
+# Einträge per rowid statt per Tabellenscan ersetzen können.
+TYPEN = {
+    "datei": 0,
+    "notiz": 1,
+    "kiantwort": 2,
+    "quizfrage": 3,
+}
+
+# Tabelle, Typ und die Spalten für (titel, inhalt, zusatz)
+_QUELLEN = [
+    ("dateien", "datei", ("titel", None, None)),
+    ("notizen", "notiz", ("titel", None, None)),
+    ("kiAntworten", "kiantwort", (None, "inhalt", "kommentar")),
+    ("quizFragen", "quizfrage", ("frage", "Antwort", "Erklaerung")),
+]
+
+
+def _werte(prefix, spalten):
+    return ", ".join(f'{prefix}."{spalte}"' if spalte else "NULL" for spalte in spalten)
+
+
+def _trigger(tabelle, typ, spalten):
+    code = TYPEN[typ]
+    neu = f"INSERT INTO volltext(rowid, titel, inhalt, zusatz) VALUES (new.id * 4 + {code}, {_werte('new', spalten)});"
+    alt = f"DELETE FROM volltext WHERE rowid = old.id * 4 + {code};"
+    geaendert = ", ".join(["id"] + [f'"{spalte}"' for spalte in spalten if spalte])
+    return [
+        f'CREATE TRIGGER IF NOT EXISTS "{tabelle}_volltext_ai" AFTER INSERT ON "{tabelle}" BEGIN {neu} END',
+        f'CREATE TRIGGER IF NOT EXISTS "{tabelle}_volltext_ad" AFTER DELETE ON "{tabelle}" BEGIN {alt} END',
+        f'CREATE TRIGGER IF NOT EXISTS "{tabelle}_volltext_au" AFTER UPDATE OF {geaendert} ON "{tabelle}" BEGIN {alt} {neu} END',
+    ]
+
+
+def _indexiere(connection, tabelle, typ, spalten, ab_id=0):
+    connection.execute(text(
+        f"INSERT INTO volltext(rowid, titel, inhalt, zusatz) "
+        f'SELECT id * 4 + {TYPEN[typ]}, {_werte(tabelle, spalten)} FROM "{tabelle}" WHERE id > {int(ab_id)}'
+    ))
+
+
+def richte_volltextsuche_ein(connection):
+    neu_angelegt = not inspect(connection).has_table("volltext")
+    connection.execute(text(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS volltext USING fts5("
+        "titel, inhalt, zusatz, tokenize = 'unicode61 remove_diacritics 2')"
+    ))
+    for tabelle, typ, spalten in _QUELLEN:
+        for ddl in _trigger(tabelle, typ, spalten):
+            connection.execute(text(ddl))
+        # Bestehende Datensätze einmalig in den Index übernehmen
+        if neu_angelegt:
+            _indexiere(connection, tabelle, typ, spalten)
+
+
+# Massenimport: Die Einfüge-Trigger indexieren jede Zeile einzeln, was den
+# Import dominiert. Innerhalb der Import-Transaktion werden sie deshalb
+# entfernt und die neuen Zeilen (id > ab_ids[tabelle]) am Ende in einem
+# INSERT ... SELECT nachgetragen. DDL ist in SQLite transaktional, bei einem
+# Abbruch stellt das ROLLBACK die Trigger wieder her.
+def pausiere_einfuege_trigger(connection):
+    for tabelle, _, _ in _QUELLEN:
+        connection.execute(text(f'DROP TRIGGER IF EXISTS "{tabelle}_volltext_ai"'))
+
+
+def indexiere_nachtraeglich(connection, ab_ids):
+    for tabelle, typ, spalten in _QUELLEN:
+        _indexiere(connection, tabelle, typ, spalten, ab_ids.get(tabelle, 0))
+        connection.execute(text(_trigger(tabelle, typ, spalten)[0]))
+
+
+# Freitext in eine FTS5-Abfrage übersetzen: jedes Wort wird als Phrase
+# gequotet (keine Syntaxfehler durch Sonderzeichen), das letzte Wort
+# zusätzlich als Präfix gesucht.
+def baue_fts_abfrage(suchbegriff: str):
+    woerter = [wort.replace('"', '""') for wort in suchbegriff.split()]
+    if not woerter:
+        return None
+    teile = [f'"{wort}"' for wort in woerter]
+    teile[-1] += "*"
+    return " ".join(teile)
@@ -0,0 +1,79 @@
+import time
+
+from sqlalchemy import text
+
+# Lernstand je Quiz-Frage für verteiltes Wiederholen nach SM-2: quiz_wiederholung
+# (modelle.py) hält Ease-Faktor, Intervall in Tagen und den Fälligkeitszeitpunkt
+# (Unix-Sekunden). Trigger legen den Stand mit jeder neuen Frage an (sofort
+# fällig) und übernehmen einen Wechsel der Quiz-Session; beim Löschen der Frage
+# entfernt ON DELETE CASCADE die Zeile. Die Session steht mit in der Tabelle,
+# damit der Index (quiz_session_id, faellig) die fälligen Fragen einer Session
+# in Reihenfolge liefert, ohne die Fragen zu lesen.
+START_EASE = 2.5
+MIN_EASE = 1.3
+TAG = 86400
+# Nicht gewusste Fragen (Bewertung < 3) kommen nach kurzer Zeit erneut dran
+ERNEUT_NACH = 600
+# Anläufe für eine Bewertung, wenn gleichzeitige Bewertungen derselben Frage
+# den Stand dazwischen ändern; danach BewertungKonflikt (409)
+MAX_VERSUCHE = 5
+
+
+class BewertungKonflikt(Exception):
+    pass
+
+
+def jetzt():
+    return int(time.time())
+
+
+# Neuer Stand nach einer Bewertung von 0 (keine Ahnung) bis 5 (sofort gewusst)
+def sm2(stand, bewertung, zeitpunkt):
+    if bewertung < 3:
+        # Wiederholungen beginnen von vorn, der Ease-Faktor bleibt
+        return {
+            "ease": stand["ease"],
+            "intervall": 0.0,
+            "wiederholungen": 0,
+            "fehlversuche": stand["fehlversuche"] + 1,
+            "faellig": zeitpunkt + ERNEUT_NACH,
+        }
+    abstand = 5 - bewertung
+    ease = max(MIN_EASE, stand["ease"] + 0.1 - abstand * (0.08 + abstand * 0.02))
+    wiederholungen = stand["wiederholungen"] + 1
+    if wiederholungen == 1:
+        intervall = 1.0
+    elif wiederholungen == 2:
+        intervall = 6.0
+    else:
+        intervall = stand["intervall"] * ease
+    return {
+        "ease": ease,
+        "intervall": intervall,
+        "wiederholungen": wiederholungen,
+        "fehlversuche": stand["fehlversuche"],
+        "faellig": zeitpunkt + round(intervall * TAG),
+    }
+
+
+_JETZT = "CAST(strftime('%s', 'now') AS INTEGER)"
+
+
+def _trigger():
+    return [
+        'CREATE TRIGGER IF NOT EXISTS "quizFragen_wiederholung_ai" AFTER INSERT ON "quizFragen" BEGIN '
+        "INSERT OR IGNORE INTO quiz_wiederholung(quiz_frage_id, quiz_session_id, faellig) "
+        f"VALUES (new.id, new.quiz_session_id, {_JETZT}); END",
+        'CREATE TRIGGER IF NOT EXISTS "quizFragen_wiederholung_au" AFTER UPDATE OF quiz_session_id ON "quizFragen" BEGIN '
+        "UPDATE quiz_wiederholung SET quiz_session_id = new.quiz_session_id WHERE quiz_frage_id = new.id; END",
+    ]
+
+
+def richte_wiederholung_ein(connection):
+    for ddl in _trigger():
+        connection.execute(text(ddl))
+    # Bestehende Fragen ohne Lernstand sind sofort fällig
+    connection.execute(text(
+        "INSERT OR IGNORE INTO quiz_wiederholung(quiz_frage_id, quiz_session_id, faellig) "
+        f'SELECT id, quiz_session_id, {_JETZT} FROM "quizFragen"'
+    ))
@@ -1,23 +1,93 @@
-from fastapi import FastAPI
-from datenbank.datenbank import engine
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import IntegrityError
+from datenbank import abfrageProfil, metriken
+from datenbank.datenbank import async_engine, async_lese_engine, engine, lese_engine
 from datenbank.modelle import Base
-from datenbank.router import dateien, notizen, kiAntwort, quizSession, quizFrage
+from datenbank.antwortCache import antwort_cache, cache_middleware
+from datenbank.extraktion import extraktion
+from datenbank.kiGenerierung import ki_generierung
+from datenbank.migrationen import migriere
+from datenbank.vektorIndex import vektor_index
+from datenbank.versuchsPuffer import versuchs_puffer
+from datenbank.versionierung import VersionKonflikt, etag
+from datenbank.router import dateien, notizen, kiAntwort, kiAuftrag, quizSession, quizFrage, quizVersuch, statistik, suche, austausch, admin
 
-# Create database tables
+# Create database tables and apply pending migrations
 Base.metadata.create_all(bind=engine)
+migriere(engine)
+
+# Hintergrundverarbeitung: Prozesspool der Textextraktion (datenbank/extraktion.py)
+# und Worker der KI-Aufträge (datenbank/kiGenerierung.py); der Vektorindex
+# (datenbank/vektorIndex.py) wird vor den Workern geladen und abgeglichen.
+# Gepufferte Antwortversuche (datenbank/versuchsPuffer.py) werden beim Beenden
+# noch geschrieben.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    vektor_index.starte()
+    extraktion.starte()
+    ki_generierung.starte()
+    versuchs_puffer.starte()
+    yield
+    versuchs_puffer.stoppe()
+    ki_generierung.stoppe()
+    extraktion.stoppe()
+    vektor_index.stoppe()
 
 app = FastAPI(
     title="Lernassistent API",
     description="API für den Lernassistenten mit Dateien, Notizen, KI-Antworten, Quiz-Sessions und Quiz-Fragen",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
+app.middleware("http")(cache_middleware)
+
+# Metriken je Route unter /metrics (datenbank/metriken.py), nur mit
+# LERNASSISTENT_METRIKEN=1; als äußerste Middleware misst sie auch Cache-Treffer.
+if metriken.AKTIV:
+    metriken.beobachte(engine, lese_engine, async_engine, async_lese_engine)
+    app.add_middleware(metriken.MetrikenMiddleware)
+    app.add_api_route("/metrics", metriken.metriken_endpunkt, include_in_schema=False)
+
+# Protokoll langsamer SQL-Anweisungen (datenbank/abfrageProfil.py), nur mit
+# LERNASSISTENT_LANGSAME_ABFRAGEN_MS; Auswertung unter /api/admin/langsame-abfragen
+if abfrageProfil.AKTIV:
+    abfrageProfil.beobachte(engine, lese_engine, async_engine, async_lese_engine)
+    app.add_middleware(abfrageProfil.AbfrageProfilMiddleware)
+    app.include_router(admin.router, prefix="/api/admin", tags=["Admin"])
+
+# Mit PRAGMA foreign_keys=ON lehnt SQLite Verweise auf nicht vorhandene
+# Datensätze ab; das ist ein Fehler des Clients, kein Serverfehler.
+@app.exception_handler(IntegrityError)
+async def integrity_error_handler(request: Request, exc: IntegrityError):
+    return JSONResponse(status_code=409, content={"detail": "Verweis auf nicht vorhandenen Datensatz oder Konflikt"})
+
+# Der Datensatz wurde seit dem Lesen geändert: 412, wenn die erwartete Version
+# per If-Match kam, sonst (version im Body) 409.
+@app.exception_handler(VersionKonflikt)
+async def version_konflikt_handler(request: Request, exc: VersionKonflikt):
+    status_code = 412 if "if-match" in request.headers else 409
+    headers = {"ETag": etag(*exc.aktuelle_versionen.values())} if len(exc.aktuelle_versionen) == 1 else None
+    return JSONResponse(
+        status_code=status_code,
+        content={"detail": "Datensatz wurde zwischenzeitlich geändert", "aktuelle_versionen": exc.aktuelle_versionen},
+        headers=headers,
+    )
+
 # Include routers
 app.include_router(dateien.router, prefix="/api/dateien", tags=["Dateien"])
 app.include_router(notizen.router, prefix="/api/notizen", tags=["Notizen"])
 app.include_router(kiAntwort.router, prefix="/api/kiantworten", tags=["KI-Antworten"])
+app.include_router(kiAuftrag.router, prefix="/api/ki-auftraege", tags=["KI-Aufträge"])
 app.include_router(quizSession.router, prefix="/api/quiz-sessions", tags=["Quiz-Sessions"])
 app.include_router(quizFrage.router, prefix="/api/quiz-fragen", tags=["Quiz-Fragen"])
+app.include_router(quizVersuch.router, prefix="/api/quiz-versuche", tags=["Quiz-Versuche"])
+app.include_router(statistik.router, prefix="/api/statistik", tags=["Statistik"])
+app.include_router(suche.router, prefix="/api/suche", tags=["Suche"])
+app.include_router(austausch.router, prefix="/api", tags=["Export/Import"])
 
 @app.get("/")
 async def root():
@@ -26,3 +96,7 @@ async def root():
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "message": "API läuft erfolgreich"}
+
+@app.get("/api/cache/statistik")
+async def cache_statistik():
+    return antwort_cache.statistik()